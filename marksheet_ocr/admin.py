@@ -1,19 +1,172 @@
 from django.contrib import admin
-from .models import MarksheetUpload, Student, Subject, Mark
+from django.contrib.auth import get_permission_codename
+from django.db.models import Case, ExpressionWrapper, F, FloatField, Q, Value, When
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.text import capfirst
+
+from .models import ApiSubmission, ApiToken, MarksheetUpload, Student, Subject, Mark
+from .services.csv_exporter import CSVExporter
+from .services.processing import enqueue_upload
+from .services.retention import MarksheetRetention
+
+
+class InputFilter(admin.SimpleListFilter):
+    """
+    Sidebar filter rendered as a text box instead of a list of choices
+    
+    Used for foreign keys with an unbounded number of targets, where the
+    default RelatedFieldListFilter would load and render every row.
+    """
+    template = 'admin/marksheet_ocr/input_filter.html'
+    
+    def lookups(self, request, model_admin):
+        # A dummy choice so the filter is always displayed
+        return (('', ''),)
+    
+    def choices(self, changelist):
+        yield {
+            'value': self.value() or '',
+            # Keep the other active filters, search and ordering; restart paging
+            'hidden_params': [
+                (key, value) for key, value in changelist.params.items()
+                if key not in (self.parameter_name, 'p')
+            ],
+            'clear_query_string': changelist.get_query_string(remove=[self.parameter_name]),
+        }
+
+
+class UploadIdFilter(InputFilter):
+    title = 'upload ID'
+    parameter_name = 'upload_id'
+    
+    def queryset(self, request, queryset):
+        value = (self.value() or '').strip().lstrip('#')
+        if value.isdigit():
+            return queryset.filter(upload_id=int(value))
+        return queryset
+
+
+def students_csv_response(students, filename):
+    """Detailed CSV download (one row per student per subject) of ``students``"""
+    csv_data = CSVExporter().export_detailed_csv(
+        students.order_by('upload_id', 'roll_number', 'id').prefetch_related('marks__subject')
+    )
+    response = HttpResponse(csv_data.getvalue(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
 
 @admin.register(MarksheetUpload)
 class MarksheetUploadAdmin(admin.ModelAdmin):
-    list_display = ['id', 'uploaded_at', 'status']
-    list_filter = ['status', 'uploaded_at']
+    list_display = ['id', 'uploaded_at', 'status', 'students_saved', 'page_count', 'extraction_resolution']
+    list_filter = ['status', 'uploaded_at', 'extraction_resolution']
     readonly_fields = ['uploaded_at']
+    search_fields = ['=id']
+    show_full_result_count = False
+    actions = ['reextract', 'export_students']
+    
+    @admin.action(description='Re-extract selected uploads')
+    def reextract(self, request, queryset):
+        # Uploads already queued or running are left to their job; the rest
+        # are claimed, as reprocess_uploads does, so a second click skips them.
+        # Archived uploads are restored first (restore_uploads).
+        ids = list(queryset.exclude(status__in=['pending', 'processing', 'archived']).values_list('id', flat=True))
+        MarksheetUpload.objects.filter(pk__in=ids).update(
+            status='processing', stage='queued', updated_at=timezone.now()
+        )
+        for upload_id in ids:
+            enqueue_upload(upload_id, replace_students=True)
+        
+        skipped = queryset.count() - len(ids)
+        message = f"Queued {len(ids)} upload(s) for re-extraction."
+        if skipped:
+            message += f" Skipped {skipped} already queued, processing or archived."
+        self.message_user(request, message)
+    
+    @admin.action(description='Export students of selected uploads as CSV')
+    def export_students(self, request, queryset):
+        ids = list(queryset.values_list('id', flat=True))
+        students = Student.objects.filter(Q(upload_id__in=ids) | Q(upload__parent_id__in=ids))
+        return students_csv_response(students, 'marksheet_uploads.csv')
+    
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        if 'delete_selected' in actions:
+            function, name, _ = actions['delete_selected']
+            actions['delete_selected'] = (function, name, 'Delete selected uploads and their images')
+        return actions
+    
+    def get_deleted_objects(self, objs, request):
+        """
+        Summarize what deleting uploads removes instead of listing it
+        
+        The default confirmation page renders every student and mark the
+        uploads cascade to; for a few large uploads that is tens of
+        thousands of rows.
+        """
+        ids = [obj.pk for obj in objs]
+        uploads = MarksheetUpload.objects.filter(Q(pk__in=ids) | Q(parent_id__in=ids))
+        students = Student.objects.filter(upload__in=uploads)
+        model_count = {
+            MarksheetUpload._meta.verbose_name_plural: uploads.count(),
+            Student._meta.verbose_name_plural: students.count(),
+            Mark._meta.verbose_name_plural: Mark.objects.filter(student__in=students).count(),
+        }
+        perms_needed = {
+            model._meta.verbose_name for model in (MarksheetUpload, Student, Mark)
+            if not request.user.has_perm(
+                f'{model._meta.app_label}.{get_permission_codename("delete", model._meta)}'
+            )
+        }
+        to_delete = [f'{capfirst(MarksheetUpload._meta.verbose_name)}: {obj}' for obj in objs]
+        return to_delete, model_count, perms_needed, []
+    
+    def delete_model(self, request, obj):
+        MarksheetRetention().delete_uploads(MarksheetUpload.objects.filter(pk=obj.pk))
+    
+    def delete_queryset(self, request, queryset):
+        MarksheetRetention().delete_uploads(queryset)
 
 
 @admin.register(Student)
 class StudentAdmin(admin.ModelAdmin):
-    list_display = ['roll_number', 'name', 'father_name', 'upload', 'get_percentage', 'get_result_status']
-    list_filter = ['upload']
+    list_display = ['roll_number', 'name', 'father_name', 'upload', 'percentage', 'result']
+    list_filter = [UploadIdFilter]
+    list_select_related = ['upload']
+    raw_id_fields = ['upload']
     search_fields = ['roll_number', 'name', 'father_name']
+    show_full_result_count = False
+    actions = ['export_csv']
+    
+    def get_queryset(self, request):
+        # Aggregated per row in subqueries: the changelist count skips them
+        # and only the students on the page are summarized
+        queryset = super().get_queryset(request).with_results(correlated=True)
+        percentage = Case(
+            When(total_maximum=0, then=Value(0.0)),
+            default=ExpressionWrapper(F('total_obtained') * 100.0 / F('total_maximum'), output_field=FloatField()),
+            output_field=FloatField(),
+        )
+        return queryset.annotate(
+            percentage=percentage,
+            # FAIL below every pass, passes by percentage
+            result_rank=Case(When(failed_subjects__gt=0, then=Value(-1.0)), default=percentage),
+        )
+    
+    @admin.display(description='Percentage', ordering='percentage')
+    def percentage(self, student):
+        return student.get_summary()['percentage']
+    
+    @admin.display(description='Result', ordering='result_rank')
+    def result(self, student):
+        return student.get_summary()['result']
+    
+    @admin.action(description='Export selected students as CSV')
+    def export_csv(self, request, queryset):
+        students = Student.objects.filter(pk__in=queryset.values('pk'))
+        return students_csv_response(students, 'students.csv')
 
 
 @admin.register(Subject)
@@ -24,6 +177,35 @@ class SubjectAdmin(admin.ModelAdmin):
 
 @admin.register(Mark)
 class MarkAdmin(admin.ModelAdmin):
-    list_display = ['student', 'subject', 'theory_ese', 'theory_internal', 'practical_marks', 'practical_internal', 'get_total_marks']
+    list_display = ['student', 'subject', 'theory_ese', 'theory_internal', 'practical_marks', 'practical_internal', 'total']
     list_filter = ['subject']
+    list_select_related = ['student', 'subject']
+    raw_id_fields = ['student']
+    autocomplete_fields = ['subject']
     search_fields = ['student__roll_number', 'student__name', 'subject__name']
+    show_full_result_count = False
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(total_marks=(
+            Coalesce('theory_ese', 0) + Coalesce('theory_internal', 0)
+            + Coalesce('practical_marks', 0) + Coalesce('practical_internal', 0)
+        ))
+    
+    @admin.display(description='Total', ordering='total_marks')
+    def total(self, mark):
+        return mark.get_total_marks()
+
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    list_display = ['name', 'key', 'is_active', 'created_at', 'last_used_at']
+    list_filter = ['is_active']
+    readonly_fields = ['key', 'created_at', 'last_used_at']
+
+
+@admin.register(ApiSubmission)
+class ApiSubmissionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'token', 'idempotency_key', 'created_at']
+    list_filter = ['token']
+    search_fields = ['idempotency_key']
+    readonly_fields = ['token', 'idempotency_key', 'created_at']
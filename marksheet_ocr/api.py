@@ -0,0 +1,652 @@
+"""
+JSON API endpoints for marksheet uploads
+"""
+import asyncio
+import hashlib
+import json
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_GET, require_http_methods
+
+from .forms import MarksheetUploadForm
+from .models import ApiSubmission, ApiToken, MarksheetUpload, Subject, UploadSession
+from .pagination import InvalidCursor, KeysetPaginator
+from .services.analytics import SubjectAnalytics
+from .services.archive import UploadArchiver
+from .services.processing import enqueue_upload
+from .services.search import StudentSearch
+from .services.upload_sessions import OffsetMismatch, SessionFinalized, UploadSessionStore
+
+
+def token_required(view):
+    """
+    Authenticate the request with an ``Authorization: Token <key>`` header
+
+    The matching ApiToken is available to the view as ``request.api_token``.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        scheme, _, key = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() not in ('token', 'bearer') or not key:
+            return JsonResponse({'error': 'Authentication credentials were not provided.'}, status=401)
+
+        token = ApiToken.objects.filter(key=key.strip(), is_active=True).first()
+        if token is None:
+            return JsonResponse({'error': 'Invalid token.'}, status=401)
+
+        ApiToken.objects.filter(pk=token.pk).update(last_used_at=timezone.now())
+        request.api_token = token
+        return view(request, *args, **kwargs)
+
+    return csrf_exempt(wrapper)
+
+
+def token_or_csrf(view):
+    """
+    Authenticate like token_required when an Authorization header is sent
+
+    Requests without one are browser requests and must pass the CSRF check,
+    as the upload form does.
+    """
+    with_token = token_required(view)
+    with_csrf = csrf_protect(view)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if 'Authorization' in request.headers:
+            return with_token(request, *args, **kwargs)
+        request.api_token = None
+        return with_csrf(request, *args, **kwargs)
+
+    return csrf_exempt(wrapper)
+
+
+def _status_etag(payload):
+    """Strong ETag over everything a status poller can observe"""
+    digest = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+@require_GET
+async def upload_status(request, upload_id):
+    """
+    Current processing status of an upload
+
+    For a PDF upload, ``pages`` lists the status of each page's own upload.
+    Supports conditional GET: pollers that send back the ETag get an empty
+    304 response until the status, stage or student counts change.
+    """
+    upload = await aget_object_or_404(MarksheetUpload, id=upload_id)
+    payload = upload.get_status_payload()
+    if upload.is_document():
+        payload['pages'] = [
+            {**page, 'status_url': reverse('upload_status', args=[page['id']])}
+            async for page in upload.pages.order_by('page_number').values(
+                'id', 'page_number', 'status', 'stage', 'students_saved'
+            )
+        ]
+    etag = _status_etag(payload)
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(payload)
+    response['ETag'] = etag
+    # Browsers must revalidate on every poll instead of reusing a stale copy
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@require_GET
+async def upload_events(request, upload_id):
+    """
+    Server-Sent Events stream of progress updates for an upload
+
+    Emits a ``progress`` event whenever the stage or student counts change
+    and a final ``done`` event once processing completes or fails. Served
+    without tying up a worker when running under the ASGI application.
+    """
+    await aget_object_or_404(MarksheetUpload, id=upload_id)
+
+    interval = getattr(settings, 'MARKSHEET_EVENTS_POLL_INTERVAL', 1.0)
+    timeout = getattr(settings, 'MARKSHEET_EVENTS_TIMEOUT', 300)
+
+    async def event_stream():
+        # Ask EventSource to wait a little before reconnecting after a drop
+        yield f'retry: {int(interval * 1000)}\n\n'
+
+        last_payload = None
+        elapsed = 0.0
+        idle = 0.0
+        while elapsed < timeout:
+            upload = await MarksheetUpload.objects.filter(id=upload_id).afirst()
+            if upload is None:
+                return
+
+            payload = upload.get_status_payload()
+            if payload != last_payload:
+                last_payload = payload
+                idle = 0.0
+                event = 'done' if upload.is_finished() else 'progress'
+                yield f'event: {event}\ndata: {json.dumps(payload)}\n\n'
+                if event == 'done':
+                    return
+            elif idle >= 15:
+                # Comment line keeps proxies from closing an idle connection
+                idle = 0.0
+                yield ': keep-alive\n\n'
+
+            await asyncio.sleep(interval)
+            elapsed += interval
+            idle += interval
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _job_payload(upload):
+    payload = upload.get_status_payload()
+    payload['status_url'] = reverse('upload_status', args=[upload.id])
+    payload['students_url'] = reverse('api_upload_students', args=[upload.id])
+    return payload
+
+
+def _open_local_file(relative_path):
+    """
+    Open a file that already sits under MARKSHEET_API_IMPORT_DIR
+
+    Raises:
+        ValueError: If imports are disabled or the path escapes the import directory
+    """
+    import_dir = getattr(settings, 'MARKSHEET_API_IMPORT_DIR', None)
+    if not import_dir:
+        raise ValueError('Submitting files by path is disabled on this server.')
+
+    root = Path(import_dir).resolve()
+    path = (root / relative_path).resolve()
+    if root not in path.parents or not path.is_file():
+        raise ValueError(f'File not found in import directory: {relative_path}')
+
+    return UploadedFile(file=open(path, 'rb'), name=path.name, size=path.stat().st_size)
+
+
+def _submitted_files(request):
+    """Collect (label, file) pairs from multipart files and local path references"""
+    files = [(f.name, f) for f in request.FILES.getlist('image')]
+
+    if request.content_type == 'application/json':
+        try:
+            body = json.loads(request.body or b'{}')
+        except json.JSONDecodeError:
+            raise ValueError('Request body is not valid JSON.')
+        paths = body.get('paths', [])
+    else:
+        paths = request.POST.getlist('path')
+
+    if not isinstance(paths, list):
+        raise ValueError('"paths" must be a list.')
+    try:
+        for relative_path in paths:
+            files.append((relative_path, _open_local_file(str(relative_path))))
+    except ValueError:
+        for label, file in files:
+            file.close()
+        raise
+
+    return files
+
+
+def _token_uploads(token):
+    """Uploads submitted with an API token, directly or through an upload session"""
+    # Pages of a PDF share its submission, but not its session file
+    return MarksheetUpload.objects.filter(
+        Q(submission__token=token)
+        | Q(session_file__session__token=token)
+        | Q(parent__session_file__session__token=token)
+    )
+
+
+def _create_submission(request, idempotency_key, files):
+    """
+    Save every file as an upload under a new submission, all or nothing
+
+    Returns:
+        Tuple of (submission, list of validation errors). On errors nothing is saved.
+    """
+    errors = []
+    with transaction.atomic():
+        submission = ApiSubmission.objects.create(
+            token=request.api_token,
+            idempotency_key=idempotency_key
+        )
+
+        for label, file in files:
+            form = MarksheetUploadForm(files={'image': file})
+            if not form.is_valid():
+                for error in form.errors.values():
+                    errors.append(f"Error in {label}: {' '.join(error)}")
+                continue
+
+            upload = form.save(commit=False)
+            upload.submission = submission
+            upload.save()
+            enqueue_upload(upload.id)
+
+        if errors:
+            # Roll back so a corrected retry can reuse the same idempotency key
+            transaction.set_rollback(True)
+
+    return submission, errors
+
+
+@token_required
+@require_http_methods(['GET', 'POST'])
+def uploads(request):
+    """
+    Submit marksheets for extraction (POST) or query job status in bulk (GET)
+
+    POST accepts multipart ``image`` files and/or references to files under
+    MARKSHEET_API_IMPORT_DIR (``path`` form fields or a JSON ``paths`` list).
+    An ``Idempotency-Key`` header is required: retrying with the same key
+    returns the original jobs instead of creating new uploads.
+
+    GET takes ``?ids=1,2,3`` and returns the status of each job submitted
+    with the same token; other ids are left out as if they did not exist.
+    """
+    if request.method == 'GET':
+        try:
+            ids = [int(i) for i in request.GET.get('ids', '').split(',') if i.strip()]
+        except ValueError:
+            return JsonResponse({'error': 'ids must be a comma-separated list of integers.'}, status=400)
+        if len(ids) > 100:
+            return JsonResponse({'error': 'At most 100 ids per request.'}, status=400)
+
+        found = _token_uploads(request.api_token).filter(id__in=ids)
+        return JsonResponse({'uploads': [_job_payload(upload) for upload in found]})
+
+    idempotency_key = request.headers.get('Idempotency-Key', '').strip()
+    if not idempotency_key or len(idempotency_key) > 255:
+        return JsonResponse({'error': 'An Idempotency-Key header (max 255 chars) is required.'}, status=400)
+
+    existing = ApiSubmission.objects.filter(token=request.api_token, idempotency_key=idempotency_key).first()
+    if existing is None:
+        try:
+            files = _submitted_files(request)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        # Set by the upload handler while the body is parsed, which reading the files does
+        if getattr(request, 'upload_rejected', None):
+            return JsonResponse({'error': request.upload_rejected}, status=413)
+
+        max_files = getattr(settings, 'MARKSHEET_API_MAX_FILES', 50)
+        if not files:
+            return JsonResponse({'error': 'No files submitted.'}, status=400)
+        if len(files) > max_files:
+            return JsonResponse({'error': f'Maximum {max_files} files allowed per submission.'}, status=400)
+
+        try:
+            submission, errors = _create_submission(request, idempotency_key, files)
+        except IntegrityError:
+            # A concurrent retry with the same key won the race
+            existing = ApiSubmission.objects.get(token=request.api_token, idempotency_key=idempotency_key)
+        else:
+            if errors:
+                return JsonResponse({'errors': errors}, status=400)
+            return JsonResponse({
+                'submission': submission.id,
+                'uploads': [_job_payload(upload) for upload in submission.uploads.order_by('id')],
+            }, status=202)
+        finally:
+            for label, file in files:
+                file.close()
+
+    return JsonResponse({
+        'submission': existing.id,
+        'uploads': [_job_payload(upload) for upload in existing.uploads.order_by('id')],
+    })
+
+
+def _session_file_payload(session_file):
+    return {
+        'id': session_file.id,
+        'name': session_file.name,
+        'size': session_file.size,
+        'received': session_file.received,
+        'complete': session_file.is_complete(),
+        'error': session_file.error,
+        'upload_id': session_file.upload_id,
+        'chunk_url': reverse('api_upload_session_file', args=[session_file.session.key, session_file.id]),
+    }
+
+
+def _session_payload(session):
+    key = session.key
+    return {
+        'key': key,
+        'created_at': session.created_at.isoformat(),
+        'finalized': session.is_finalized(),
+        'chunk_size': settings.MARKSHEET_UPLOAD_CHUNK_SIZE,
+        'max_files': settings.MARKSHEET_UPLOAD_SESSION_MAX_FILES,
+        'max_bytes': settings.MARKSHEET_UPLOAD_SESSION_MAX_BYTES,
+        'status_url': reverse('api_upload_session', args=[key]),
+        'files_url': reverse('api_upload_session_files', args=[key]),
+        'finalize_url': reverse('api_upload_session_finalize', args=[key]),
+        'files': [_session_file_payload(f) for f in session.files.all()],
+    }
+
+
+def _json_body(request):
+    try:
+        body = json.loads(request.body or b'{}')
+    except json.JSONDecodeError:
+        raise ValueError('Request body is not valid JSON.')
+    if not isinstance(body, dict):
+        raise ValueError('Request body must be a JSON object.')
+    return body
+
+
+@token_or_csrf
+@require_http_methods(['POST'])
+def create_upload_session(request):
+    """
+    Open a resumable upload session
+
+    Add files to it (``files_url``), send each in chunks at increasing
+    offsets (``chunk_url``), then finalize it to queue the uploads. The
+    session key in the URLs is its only credential.
+    """
+    session = UploadSessionStore().create(token=request.api_token)
+    return JsonResponse(_session_payload(session), status=201)
+
+
+@token_or_csrf
+@require_GET
+def upload_session(request, key):
+    """Files of an upload session and how much of each has arrived; used to resume"""
+    session = get_object_or_404(UploadSession, key=key)
+    return JsonResponse(_session_payload(session))
+
+
+@token_or_csrf
+@require_http_methods(['POST'])
+def upload_session_files(request, key):
+    """Declare a file (JSON ``name`` and ``size``) before sending its chunks"""
+    session = get_object_or_404(UploadSession, key=key)
+    try:
+        body = _json_body(request)
+        session_file = UploadSessionStore().add_file(session, body.get('name'), body.get('size'))
+    except SessionFinalized as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(_session_file_payload(session_file), status=201)
+
+
+@token_or_csrf
+@require_http_methods(['GET', 'PUT'])
+def upload_session_file(request, key, file_id):
+    """
+    Send one chunk of a file as the raw request body (PUT ``?offset=N``), or get its progress
+
+    A chunk at any offset but the file's current ``received`` is refused
+    with 409 and the current offset, so a client that lost track of a
+    chunk resends from there.
+    """
+    session = get_object_or_404(UploadSession, key=key)
+    session_file = get_object_or_404(session.files, id=file_id)
+    if request.method == 'GET':
+        return JsonResponse(_session_file_payload(session_file))
+
+    try:
+        offset = int(request.GET.get('offset', ''))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'offset must be an integer.'}, status=400)
+    if length > settings.MARKSHEET_UPLOAD_CHUNK_SIZE:
+        return JsonResponse(
+            {'error': f'Chunks may be at most {settings.MARKSHEET_UPLOAD_CHUNK_SIZE} bytes.'}, status=413
+        )
+
+    try:
+        session_file = UploadSessionStore().write_chunk(session_file, offset, request, length)
+    except OffsetMismatch as e:
+        return JsonResponse(dict(_session_file_payload(session_file), error=str(e)), status=409)
+    except SessionFinalized as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(_session_file_payload(session_file))
+
+
+@token_or_csrf
+@require_http_methods(['POST'])
+def finalize_upload_session(request, key):
+    """
+    Queue the session's complete files for extraction
+
+    Files that failed validation are reported in ``errors``; a file still
+    missing chunks fails the request with 409. Finalizing again returns the
+    same uploads.
+    """
+    session = get_object_or_404(UploadSession, key=key)
+    try:
+        finalized, errors = UploadSessionStore().finalize(session)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=409)
+
+    uploads = [
+        dict(
+            _job_payload(session_file.upload),
+            name=session_file.name,
+            events_url=reverse('upload_events', args=[session_file.upload_id]),
+        )
+        for session_file in finalized
+    ]
+    return JsonResponse({'uploads': uploads, 'errors': errors}, status=202 if uploads else 400)
+
+
+def _serialize_student(student):
+    marks = []
+    for mark in student.marks.all():
+        marks.append({
+            'subject_code': mark.subject.code,
+            'subject_name': mark.subject.name,
+            'theory_ese': mark.theory_ese,
+            'theory_internal': mark.theory_internal,
+            'practical_marks': mark.practical_marks,
+            'practical_internal': mark.practical_internal,
+            'theory_total': mark.get_theory_total(),
+            'practical_total': mark.get_practical_total(),
+            'total': mark.get_total_marks(),
+            'failed': mark.is_failed(),
+        })
+
+    return {
+        'id': student.id,
+        'roll_number': student.roll_number,
+        'name': student.name,
+        'father_name': student.father_name,
+        'mother_name': student.mother_name,
+        'enrollment_number': student.enrollment_number,
+        'total_marks': student.get_total_marks(),
+        'percentage': student.get_percentage(),
+        'result': student.get_result_status(),
+        'marks': marks,
+    }
+
+
+def _serialize_record(record):
+    """_serialize_student of an archived ExtractedStudent, which has no id"""
+    marks = []
+    for mark in record.marks:
+        marks.append({
+            'subject_code': mark.subject_code,
+            'subject_name': mark.subject_name,
+            'theory_ese': mark.theory_ese,
+            'theory_internal': mark.theory_internal,
+            'practical_marks': mark.practical_marks,
+            'practical_internal': mark.practical_internal,
+            'theory_total': mark.theory_total(),
+            'practical_total': mark.practical_total(),
+            'total': mark.total(),
+            'failed': mark.is_failed(),
+        })
+
+    summary = record.summary()
+    return {
+        'id': None,
+        'roll_number': record.roll_number,
+        'name': record.name,
+        'father_name': record.father_name,
+        'mother_name': record.mother_name,
+        'enrollment_number': record.enrollment_number,
+        'total_marks': summary['total'],
+        'percentage': summary['percentage'],
+        'result': summary['result'],
+        'marks': marks,
+    }
+
+
+def _archived_students(upload, cursor, limit):
+    """upload_students of an archived upload; the cursor is an offset into its records"""
+    try:
+        offset = max(int(cursor or 0), 0)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+
+    records = UploadArchiver().records(upload)
+    page = records[offset:offset + limit]
+    return JsonResponse({
+        'upload': upload.get_status_payload(),
+        'students': [_serialize_record(record) for record in page],
+        'next_cursor': str(offset + limit) if offset + limit < len(records) else None,
+    })
+
+
+@token_required
+@require_GET
+def upload_students(request, upload_id):
+    """
+    Extracted students and marks of an upload, in roll number order
+
+    Pass the ``next_cursor`` of a page as ``?cursor=`` to fetch the next one.
+    Students of an archived upload are read from its archive and have no id.
+    """
+    upload = get_object_or_404(MarksheetUpload, id=upload_id)
+
+    try:
+        limit = min(max(int(request.GET.get('limit', 50)), 1), 200)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer.'}, status=400)
+
+    if upload.is_archived():
+        return _archived_students(upload, request.GET.get('cursor'), limit)
+
+    paginator = KeysetPaginator(
+        upload.get_students().prefetch_related('marks__subject'),
+        ('roll_number', 'id'),
+        per_page=limit,
+    )
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'upload': upload.get_status_payload(),
+        'students': [_serialize_student(student) for student in page],
+        'next_cursor': page.next_cursor,
+    })
+
+
+@token_required
+@require_GET
+def search_students(request):
+    """
+    Students matching ``?q=`` by roll number, enrollment number or name
+
+    Each result carries its upload and computed result; marks are available
+    from the upload's students endpoint.
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', 50)), 1), 200)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer.'}, status=400)
+
+    results = []
+    for student in StudentSearch().search(request.GET.get('q', ''), limit=limit):
+        summary = student.get_summary()
+        results.append({
+            'id': student.id,
+            'roll_number': student.roll_number,
+            'name': student.name,
+            'father_name': student.father_name,
+            'enrollment_number': student.enrollment_number,
+            'total_marks': summary['total'],
+            'percentage': summary['percentage'],
+            'result': summary['result'],
+            'upload': {
+                'id': student.upload.id,
+                'uploaded_at': student.upload.uploaded_at.isoformat(),
+                'students_url': reverse('api_upload_students', args=[student.upload.id]),
+            },
+        })
+
+    return JsonResponse({'students': results})
+
+
+@token_required
+@require_GET
+def subject_statistics(request):
+    """
+    Pass rate, mean and median marks and grade counts of every subject
+
+    Across all uploads, or of one upload (its pages, for a PDF) with
+    ``?upload=``. Read from the summary tables, not from the marks.
+    """
+    upload = None
+    upload_id = request.GET.get('upload')
+    if upload_id:
+        if not upload_id.isdigit():
+            return JsonResponse({'error': 'upload must be an integer.'}, status=400)
+        upload = get_object_or_404(MarksheetUpload, id=upload_id)
+
+    return JsonResponse({
+        'upload_id': upload.id if upload else None,
+        'subjects': [
+            {
+                'id': subject.id,
+                'code': subject.code,
+                'name': subject.name,
+                'trend_url': reverse('api_subject_trend', args=[subject.id]),
+                **stats.get_statistics(),
+            }
+            for subject, stats in SubjectAnalytics().subjects(upload)
+        ],
+    })
+
+
+@token_required
+@require_GET
+def subject_trend(request, subject_id):
+    """Statistics of a subject per month, oldest first"""
+    subject = get_object_or_404(Subject, id=subject_id)
+    return JsonResponse({
+        'subject': {'id': subject.id, 'code': subject.code, 'name': subject.name},
+        'months': [
+            {'month': row.period.strftime('%Y-%m'), 'sheets': row.sheets, **row.get_statistics()}
+            for row in SubjectAnalytics().trend(subject)
+        ],
+    })
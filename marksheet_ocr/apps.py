@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MarksheetOcrConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'marksheet_ocr'
+
+    def ready(self):
+        from . import db, signals  # noqa: F401
@@ -0,0 +1,38 @@
+"""
+Helpers for running blocking work from async views
+"""
+from asgiref.sync import sync_to_async
+from django.db import connection
+
+
+async def run_in_thread(func, *args, **kwargs):
+    """
+    Run a blocking call (database queries included) on a worker thread
+
+    Unlike a plain ``sync_to_async``, which funnels every call through the
+    single thread shared by all synchronous code, each call gets a thread of
+    its own, so a slow export does not hold up other requests. The thread's
+    database connection is closed afterwards.
+    """
+    def call():
+        try:
+            return func(*args, **kwargs)
+        finally:
+            connection.close()
+
+    return await sync_to_async(call, thread_sensitive=False)()
+
+
+async def iterate_in_thread(iterator):
+    """
+    Consume a blocking iterator from async code, one item per worker thread call
+
+    Lets a StreamingHttpResponse stream a synchronous generator under ASGI
+    instead of Django collecting all of it in memory first.
+    """
+    done = object()
+    while True:
+        item = await run_in_thread(next, iterator, done)
+        if item is done:
+            return
+        yield item
@@ -0,0 +1,52 @@
+"""
+Per-connection database tuning for concurrent extraction workers
+
+SQLite's defaults (rollback journal, full fsync on every commit) make
+concurrent writers fail with "database is locked". Every new SQLite
+connection is switched to write-ahead logging so readers never block the
+writer, and waits for the write lock instead of failing. Postgres pooling is
+configured in settings (MARKSHEET_DB_POOL_MAX_SIZE), as Django manages the
+pool itself.
+"""
+import logging
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+logger = logging.getLogger(__name__)
+
+
+def sqlite_pragmas():
+    """PRAGMA name/value pairs applied to new SQLite connections, from settings"""
+    return [
+        ('journal_mode', getattr(settings, 'MARKSHEET_SQLITE_JOURNAL_MODE', 'wal')),
+        # NORMAL is durable against application crashes in WAL mode; only an
+        # OS crash or power loss can drop the last commits
+        ('synchronous', getattr(settings, 'MARKSHEET_SQLITE_SYNCHRONOUS', 'normal')),
+        ('busy_timeout', getattr(settings, 'MARKSHEET_SQLITE_BUSY_TIMEOUT', 20000)),
+        ('mmap_size', getattr(settings, 'MARKSHEET_SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    ]
+
+
+def tune_sqlite(connection):
+    """
+    Apply sqlite_pragmas() to an open SQLite connection
+
+    Args:
+        connection: Django database wrapper whose vendor is 'sqlite'
+    """
+    with connection.cursor() as cursor:
+        for name, value in sqlite_pragmas():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.execute('PRAGMA journal_mode')
+        mode = cursor.fetchone()[0]
+    logger.debug("Tuned SQLite connection to %s (journal_mode=%s)", connection.settings_dict['NAME'], mode)
+
+
+@receiver(connection_created)
+def configure_connection(sender, connection, **kwargs):
+    """Tune every new database connection for concurrent use"""
+    if connection.vendor == 'sqlite' and getattr(settings, 'MARKSHEET_SQLITE_TUNING', True):
+        tune_sqlite(connection)
@@ -1,35 +1,147 @@
+import hashlib
+import os
+from datetime import datetime, time, timedelta
 from django import forms
+from django.conf import settings
+from django.utils import timezone
 from .models import MarksheetUpload
+from .services.documents import count_pages
+from .upload_handlers import SNIFF_BYTES, TYPE_EXTENSIONS, max_upload_size, sniff_image_type
 
 
 class MarksheetUploadForm(forms.ModelForm):
     """Form for uploading marksheet images"""
     
+    # A plain FileField: the type is checked from the magic bytes below, so the
+    # image does not have to be read again by Pillow just to validate it
+    image = forms.FileField(widget=forms.FileInput(attrs={
+        'class': 'form-control',
+        'accept': 'image/*,application/pdf',
+        'id': 'marksheet-upload'
+    }))
+    
+    VALID_EXTENSIONS = [extension for extensions in TYPE_EXTENSIONS.values() for extension in extensions]
+    
     class Meta:
         model = MarksheetUpload
         fields = ['image']
-        widgets = {
-            'image': forms.FileInput(attrs={
-                'class': 'form-control',
-                'accept': 'image/*',
-                'id': 'marksheet-upload'
-            })
-        }
     
     def clean_image(self):
         image = self.cleaned_data.get('image')
         
         if image:
-            # Validate file size (max 10MB)
-            if image.size > 10 * 1024 * 1024:
-                raise forms.ValidationError('Image file size must be less than 10MB')
+            # Validate file type from the content, not the file name
+            image_type = getattr(image, 'sniffed_type', None)
+            if image_type is None:
+                image_type = self._sniff(image)
+            if image_type is None:
+                raise forms.ValidationError(
+                    f'Invalid file type. Allowed types: {", ".join(self.VALID_EXTENSIONS)}'
+                )
+            
+            # The name must agree with the content, so a scan is never offered as e.g. .html
+            extension = os.path.splitext(image.name or '')[1].lower()
+            if extension not in TYPE_EXTENSIONS[image_type]:
+                raise forms.ValidationError(
+                    f'The file is a {image_type.upper()} but is named "{image.name}". '
+                    f'Use one of these extensions: {", ".join(TYPE_EXTENSIONS[image_type])}'
+                )
             
-            # Validate file type
-            valid_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
-            file_extension = image.name.lower().split('.')[-1]
-            if f'.{file_extension}' not in valid_extensions:
+            # Validate file size (streamed uploads flag oversized files instead of storing them)
+            max_size = max_upload_size(image_type)
+            if getattr(image, 'oversized', False) or image.size > max_size:
+                kind = {'pdf': 'PDF', 'tiff': 'TIFF'}.get(image_type, 'Image')
                 raise forms.ValidationError(
-                    f'Invalid file type. Allowed types: {", ".join(valid_extensions)}'
+                    f'{kind} file size must be less than {max_size // (1024 * 1024)}MB'
                 )
+            
+            if image_type == 'pdf':
+                self.page_count = self._count_pages(image)
+            elif image_type == 'tiff':
+                # A multi-page TIFF is split into pages like a PDF
+                pages = self._count_pages(image)
+                self.page_count = pages if pages > 1 else 0
+                if pages == 1 and image.size > settings.MARKSHEET_MAX_UPLOAD_SIZE:
+                    raise forms.ValidationError(
+                        f'Image file size must be less than {settings.MARKSHEET_MAX_UPLOAD_SIZE // (1024 * 1024)}MB'
+                    )
         
         return image
+    
+    def save(self, commit=True):
+        upload = super().save(commit=False)
+        image = self.cleaned_data['image']
+        upload.content_hash = getattr(image, 'sha256', None) or self._hash(image)
+        upload.page_count = getattr(self, 'page_count', 0)
+        if commit:
+            upload.save()
+        return upload
+    
+    @staticmethod
+    def _sniff(image):
+        """Read the magic bytes of a file that did not go through the streaming handler"""
+        image.seek(0)
+        header = image.read(SNIFF_BYTES)
+        image.seek(0)
+        return sniff_image_type(header)
+    
+    @staticmethod
+    def _count_pages(document):
+        """Check that a PDF or TIFF can be read and is within the page limit"""
+        try:
+            document.seek(0)
+            pages = count_pages(document)
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+        finally:
+            document.seek(0)
+        
+        max_pages = settings.MARKSHEET_MAX_PDF_PAGES
+        if not pages:
+            raise forms.ValidationError('The file has no pages.')
+        if pages > max_pages:
+            raise forms.ValidationError(f'Files may have at most {max_pages} pages; this one has {pages}.')
+        return pages
+    
+    @staticmethod
+    def _hash(image):
+        hasher = hashlib.sha256()
+        for chunk in image.chunks():
+            hasher.update(chunk)
+        image.seek(0)
+        return hasher.hexdigest()
+
+
+class UploadHistoryFilterForm(forms.Form):
+    """Filters for the upload history listing"""
+    
+    status = forms.ChoiceField(
+        choices=[('', 'All statuses')] + MarksheetUpload.STATUS_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    date_from = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    date_to = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    
+    def filter_queryset(self, queryset):
+        """Apply the cleaned filters as range conditions the history indexes can use"""
+        status = self.cleaned_data.get('status')
+        date_from = self.cleaned_data.get('date_from')
+        date_to = self.cleaned_data.get('date_to')
+        
+        if status:
+            queryset = queryset.filter(status=status)
+        if date_from:
+            start = timezone.make_aware(datetime.combine(date_from, time.min))
+            queryset = queryset.filter(uploaded_at__gte=start)
+        if date_to:
+            end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min))
+            queryset = queryset.filter(uploaded_at__lt=end)
+        
+        return queryset
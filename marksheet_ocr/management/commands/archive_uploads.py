@@ -0,0 +1,61 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from marksheet_ocr.services.archive import UploadArchiver
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the students and marks of completed uploads older than a cutoff into "
+        "compressed archives. Archived uploads stay listed, exportable and in the "
+        "analytics; restore_uploads brings their rows back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=int, default=settings.MARKSHEET_ARCHIVE_AFTER_DAYS,
+            help="Archive completed uploads older than this (default MARKSHEET_ARCHIVE_AFTER_DAYS)",
+        )
+        parser.add_argument('--ids', help="Comma-separated upload ids to restrict to")
+        parser.add_argument('--limit', type=int, help="Stop after this many uploads")
+        parser.add_argument('--dry-run', action='store_true', help="List matching uploads and exit")
+
+    def handle(self, *args, **options):
+        days = options['older_than_days']
+        if days <= 0:
+            raise CommandError(
+                "No cutoff: pass --older-than-days or set MARKSHEET_ARCHIVE_AFTER_DAYS"
+            )
+
+        archiver = UploadArchiver()
+        uploads = archiver.archivable(days)
+        if options['ids']:
+            try:
+                uploads = uploads.filter(id__in=[int(i) for i in options['ids'].split(',') if i.strip()])
+            except ValueError:
+                raise CommandError("--ids must be a comma-separated list of integers")
+        if options['limit']:
+            uploads = uploads[:options['limit']]
+        uploads = list(uploads)
+
+        if options['dry_run']:
+            for upload in uploads:
+                self.stdout.write(f"  #{upload.id} uploaded {upload.uploaded_at:%Y-%m-%d}")
+            self.stdout.write(f"[dry run] {len(uploads)} upload(s) would be archived.")
+            return
+
+        started = time.monotonic()
+        students = marks = stored = 0
+        for upload in uploads:
+            counts = archiver.archive(upload)
+            students += counts[0]
+            marks += counts[1]
+            stored += counts[2]
+            self.stdout.write(f"  #{upload.id}: {counts[0]} students, {counts[1]} marks, {counts[2]} bytes")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {len(uploads)} upload(s): {students} students and {marks} marks "
+            f"in {stored / 1024:.1f}KB, {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,95 @@
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a running server with slow requests (exports, extraction) and fast ones "
+        "(status polls) at the same time and report the latency of each. Compare a "
+        "WSGI and an ASGI deployment by pointing --base-url at each in turn."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help="Server to load")
+        parser.add_argument(
+            '--slow-path', action='append', required=True,
+            help="Path of a slow request, e.g. /download/excel-detailed/1/ (repeatable)",
+        )
+        parser.add_argument(
+            '--fast-path', action='append', required=True,
+            help="Path of a fast request, e.g. /api/uploads/1/status (repeatable)",
+        )
+        parser.add_argument('--slow-clients', type=int, default=4, help="Clients issuing slow requests")
+        parser.add_argument('--fast-clients', type=int, default=8, help="Clients issuing fast requests")
+        parser.add_argument('--duration', type=float, default=20, help="Seconds to run")
+        parser.add_argument('--timeout', type=float, default=120, help="Per-request timeout in seconds")
+
+    def handle(self, *args, **options):
+        if options['slow_clients'] < 0 or options['fast_clients'] < 1:
+            raise CommandError("Need at least one fast client and no negative client counts")
+
+        base_url = options['base_url'].rstrip('/')
+        deadline = time.monotonic() + options['duration']
+        results = {'slow': [], 'fast': []}
+        errors = {'slow': 0, 'fast': 0}
+        lock = threading.Lock()
+
+        def client(kind, paths, offset):
+            position = offset
+            while time.monotonic() < deadline:
+                url = base_url + paths[position % len(paths)]
+                position += 1
+                started = time.monotonic()
+                try:
+                    with urllib.request.urlopen(url, timeout=options['timeout']) as response:
+                        response.read()
+                    ok = True
+                except (urllib.error.URLError, OSError) as e:
+                    ok = False
+                    if isinstance(e, urllib.error.HTTPError) and e.code == 304:
+                        ok = True
+                elapsed = time.monotonic() - started
+                with lock:
+                    if ok:
+                        results[kind].append(elapsed)
+                    else:
+                        errors[kind] += 1
+
+        threads = [
+            threading.Thread(target=client, args=('slow', options['slow_path'], i), daemon=True)
+            for i in range(options['slow_clients'])
+        ] + [
+            threading.Thread(target=client, args=('fast', options['fast_path'], i), daemon=True)
+            for i in range(options['fast_clients'])
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.monotonic() - started
+
+        self.stdout.write(
+            f"{base_url}: {options['slow_clients']} slow + {options['fast_clients']} fast clients "
+            f"for {wall:.1f}s"
+        )
+        for kind in ('slow', 'fast'):
+            self.stdout.write(self._summary(kind, results[kind], errors[kind], wall))
+        if not results['fast']:
+            raise CommandError("No fast request succeeded; is the server running?")
+
+    def _summary(self, kind, latencies, error_count, wall):
+        if not latencies:
+            return f"  {kind}: no successful requests, {error_count} error(s)"
+        latencies = sorted(latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return (
+            f"  {kind}: {len(latencies)} ok, {error_count} error(s), {len(latencies) / wall:.1f} req/s, "
+            f"p50 {statistics.median(latencies) * 1000:.0f}ms, p95 {p95 * 1000:.0f}ms, "
+            f"max {latencies[-1] * 1000:.0f}ms"
+        )
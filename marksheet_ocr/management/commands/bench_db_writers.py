@@ -0,0 +1,149 @@
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.db.models import F
+from django.test.utils import override_settings
+
+from marksheet_ocr.models import Mark, MarksheetUpload, Student, Subject
+
+
+class Command(BaseCommand):
+    help = (
+        "Stress a scratch SQLite database with concurrent writers saving students the way "
+        "extraction does, once with Django's defaults and once with the tuning in "
+        "marksheet_ocr.db, and compare failures, throughput and latency"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help="Concurrent writer threads")
+        parser.add_argument('--students', type=int, default=100, help="Students saved by each writer")
+        parser.add_argument('--subjects', type=int, default=6, help="Marks saved per student")
+        parser.add_argument('--readers', type=int, default=4, help="Threads polling the upload's status")
+        parser.add_argument(
+            '--mode', choices=['both', 'baseline', 'tuned'], default='both',
+            help="Which configuration to run",
+        )
+
+    def handle(self, *args, **options):
+        if options['writers'] < 1 or options['students'] < 1:
+            raise CommandError("--writers and --students must be at least 1")
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError("This benchmark needs the SQLite backend.")
+
+        modes = ['baseline', 'tuned'] if options['mode'] == 'both' else [options['mode']]
+        for mode in modes:
+            self.stdout.write(f"{mode}: {self._run(mode, options)}")
+
+    def _run(self, mode, options):
+        directory = tempfile.mkdtemp(prefix='bench-db-')
+        alias = f'bench_{mode}'
+        config = dict(connections.settings['default'], NAME=os.path.join(directory, 'bench.sqlite3'))
+        config['OPTIONS'] = dict(config.get('OPTIONS') or {})
+        if mode == 'baseline':
+            # Django's own defaults: deferred transactions, rollback journal
+            config['OPTIONS'].pop('transaction_mode', None)
+        connections.settings[alias] = config
+
+        try:
+            with override_settings(MARKSHEET_SQLITE_TUNING=(mode == 'tuned')):
+                call_command('migrate', database=alias, verbosity=0, interactive=False)
+                connections[alias].close()
+                return self._stress(alias, options)
+        finally:
+            connections[alias].close()
+            del connections.settings[alias]
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+            os.rmdir(directory)
+
+    def _stress(self, alias, options):
+        upload = MarksheetUpload.objects.using(alias).create(image='marksheets/bench.png', status='processing')
+        subjects = [
+            Subject.objects.using(alias).create(code=f'{i:02}', name=f'Subject {i}')
+            for i in range(options['subjects'])
+        ]
+        connections[alias].close()
+
+        latencies = []
+        failures = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(options['writers'])
+
+        def writer(number):
+            barrier.wait()
+            try:
+                for index in range(options['students']):
+                    started = time.monotonic()
+                    try:
+                        # Same writes as reprocessing with UploadProcessor: drop
+                        # the previous copy of the student, save it and its marks
+                        # in one transaction, then update progress on the shared
+                        # upload row. bulk_create skips the post_save handlers,
+                        # which would write to the default database
+                        with transaction.atomic(using=alias):
+                            Student.objects.using(alias).filter(
+                                upload=upload, roll_number=f'{number}-{index}'
+                            ).delete()
+                            [student] = Student.objects.using(alias).bulk_create([Student(
+                                upload=upload, roll_number=f'{number}-{index}', name=f'Student {index}'
+                            )])
+                            Mark.objects.using(alias).bulk_create([
+                                Mark(student=student, subject=subject, theory_ese=50, theory_internal=15)
+                                for subject in subjects
+                            ])
+                        MarksheetUpload.objects.using(alias).filter(pk=upload.pk).update(
+                            students_saved=F('students_saved') + 1
+                        )
+                    except OperationalError as e:
+                        with lock:
+                            failures.append(str(e))
+                        continue
+                    with lock:
+                        latencies.append(time.monotonic() - started)
+            finally:
+                connections[alias].close()
+
+        def reader():
+            try:
+                while not done.is_set():
+                    try:
+                        MarksheetUpload.objects.using(alias).get(pk=upload.pk).get_status_payload()
+                    except OperationalError:
+                        pass
+                    time.sleep(0.01)
+            finally:
+                connections[alias].close()
+
+        done = threading.Event()
+        readers = [threading.Thread(target=reader) for _ in range(options['readers'])]
+        for thread in readers:
+            thread.start()
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(options['writers'])]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.monotonic() - started
+        done.set()
+        for thread in readers:
+            thread.join()
+
+        attempted = options['writers'] * options['students']
+        summary = f"{len(latencies)}/{attempted} saved, {len(failures)} failed"
+        if failures:
+            summary += f" (e.g. {failures[0]!r})"
+        if latencies:
+            latencies.sort()
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            summary += (
+                f", {len(latencies) / wall:.0f} students/s, p50 {statistics.median(latencies) * 1000:.1f}ms, "
+                f"p95 {p95 * 1000:.1f}ms, max {latencies[-1] * 1000:.0f}ms"
+            )
+        return summary
@@ -0,0 +1,169 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from marksheet_ocr.models import MarksheetUpload
+from marksheet_ocr.services.ai_extractor import AIExtractor
+from marksheet_ocr.services.extraction_schema import MARK_COLUMNS, PROMPT
+from marksheet_ocr.services.imaging import load_reduced
+from marksheet_ocr.services.records import MARK_FIELDS, load_records
+from marksheet_ocr.services.usage import call_usage
+
+
+# Free-form JSON prompt used before the compact response schema, kept only
+# as the baseline to compare against
+VERBOSE_PROMPT = """
+Analyze this marksheet image and extract ALL student information in JSON format.
+
+For EACH student give roll number, name, father's/husband's name, mother's name,
+enrollment number, every subject with its code, name and marks (theory ESE,
+theory internal, practical, practical internal), aggregate percentage and result.
+
+Return a JSON array of objects with the keys "roll_number", "name", "father_name",
+"mother_name", "enrollment_number", "subjects" (objects with "code", "name",
+"theory_ese", "theory_internal", "practical", "practical_internal"), "percentage"
+and "result". Use null for marks that are not shown or printed as "...".
+Return ONLY valid JSON, no additional text.
+"""
+
+
+def verbose_output(records):
+    """Records as the verbose JSON array the old prompt asked for"""
+    return [
+        {
+            'roll_number': record.roll_number,
+            'name': record.name,
+            'father_name': record.father_name,
+            'mother_name': record.mother_name,
+            'enrollment_number': record.enrollment_number,
+            'subjects': [
+                {
+                    'code': mark.subject_code,
+                    'name': mark.subject_name,
+                    **{key: getattr(mark, field) for field, key in MARK_FIELDS},
+                }
+                for mark in record.marks
+            ],
+            'percentage': record.reported_percentage,
+            'result': record.reported_result,
+        }
+        for record in records
+    ]
+
+
+def compact_output(records):
+    """Records as the compact payload RESPONSE_SCHEMA asks for"""
+    subjects = {}
+    students = []
+    for record in records:
+        rows = []
+        for mark in record.marks:
+            index = subjects.setdefault((mark.subject_code, mark.subject_name), len(subjects))
+            marks = {key: getattr(mark, field) for field, key in MARK_FIELDS}
+            rows.append([index] + [marks[column] for column in MARK_COLUMNS])
+        students.append({
+            'r': record.roll_number, 'n': record.name, 'f': record.father_name,
+            'm': record.mother_name, 'e': record.enrollment_number, 'k': rows,
+            'p': record.reported_percentage, 's': record.reported_result,
+        })
+    return {'subjects': [list(subject) for subject in subjects], 'students': students}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the verbose free-form JSON output with the compact response schema: "
+        "live, by extracting the given images both ways and reporting tokens and "
+        "latency, or offline, by sizing both encodings of stored extractions (--uploads)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help="Marksheet images to extract both ways")
+        parser.add_argument('--repeat', type=int, default=3, help="Calls per image and format")
+        parser.add_argument(
+            '--max-size', type=int, default=AIExtractor.MAX_IMAGE_SIZE,
+            help="Longest side the images are sent at",
+        )
+        parser.add_argument(
+            '--uploads', type=str,
+            help="Comma-separated ids of uploads whose stored extraction to size offline",
+        )
+
+    def handle(self, *args, **options):
+        if bool(options['paths']) == bool(options['uploads']):
+            raise CommandError("Give either image paths or --uploads")
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be at least 1")
+
+        if options['uploads']:
+            try:
+                ids = [int(i) for i in options['uploads'].split(',') if i.strip()]
+            except ValueError:
+                raise CommandError("--uploads must be a comma-separated list of integers")
+            self.size_offline(ids)
+        else:
+            self.measure_live(options['paths'], options['repeat'], options['max_size'])
+
+    def size_offline(self, ids):
+        uploads = MarksheetUpload.objects.filter(pk__in=ids, extraction_result__isnull=False)
+        totals = {'students': 0, 'verbose': 0, 'indented': 0, 'compact': 0}
+        for upload in uploads.order_by('id'):
+            records = load_records(upload.extraction_result)
+            sizes = {
+                'verbose': len(json.dumps(verbose_output(records), separators=(',', ':'))),
+                'indented': len(json.dumps(verbose_output(records), indent=4)),
+                'compact': len(json.dumps(compact_output(records), separators=(',', ':'))),
+            }
+            self.stdout.write(
+                f"Upload {upload.id}: {len(records)} student(s), verbose {sizes['verbose']:,} "
+                f"characters ({sizes['indented']:,} indented), compact {sizes['compact']:,}"
+            )
+            totals['students'] += len(records)
+            for name, size in sizes.items():
+                totals[name] += size
+
+        if not totals['verbose']:
+            raise CommandError("None of the uploads has a stored extraction")
+        saved = 1 - totals['compact'] / totals['verbose']
+        self.stdout.write(
+            f"Total: {totals['students']} student(s), compact output is {saved:.0%} shorter than "
+            f"verbose ({1 - totals['compact'] / totals['indented']:.0%} shorter than indented)"
+        )
+
+    def measure_live(self, paths, repeat, max_size):
+        extractor = AIExtractor()
+        calls = {'verbose': [], 'compact': []}
+        for path in paths:
+            image = load_reduced(path, max_size)
+            for _ in range(repeat):
+                started = time.perf_counter()
+                response = extractor.model.generate_content(
+                    [VERBOSE_PROMPT, image],
+                    generation_config={'response_mime_type': 'application/json', 'temperature': 0},
+                    request_options={'timeout': 120},
+                )
+                usage = call_usage(response, 'verbose', image, max_size, time.perf_counter() - started)
+                usage['students'] = len(json.loads(response.text))
+                calls['verbose'].append(usage)
+
+                students = extractor._generate(PROMPT, image, 'full', max_size)
+                usage = dict(extractor.calls[-1], students=len(students))
+                calls['compact'].append(usage)
+
+        self.stdout.write(f"{'Format':10} {'Calls':>5} {'Students':>8} {'Text in':>8} {'Output':>8} {'Seconds':>8}")
+        medians = {}
+        for name, rows in calls.items():
+            medians[name] = {
+                key: statistics.median(row[key] for row in rows)
+                for key in ('students', 'text_tokens', 'output_tokens', 'seconds')
+            }
+            m = medians[name]
+            self.stdout.write(
+                f"{name:10} {len(rows):>5} {m['students']:>8g} {m['text_tokens']:>8g} "
+                f"{m['output_tokens']:>8g} {m['seconds']:>8.1f}"
+            )
+        for key, label in (('output_tokens', 'output tokens'), ('seconds', 'latency')):
+            if medians['verbose'][key]:
+                change = 1 - medians['compact'][key] / medians['verbose'][key]
+                self.stdout.write(f"Median {label}: {change:.0%} lower with the compact schema")
@@ -0,0 +1,100 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Loads what a web worker loads before serving its first request; the
+# deployment (render.yaml) serves the ASGI application under uvicorn
+BOOT_SCRIPT = """
+import json, resource, sys
+from marksheet_project.asgi import application
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps({
+    'modules': sorted(sys.modules),
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+"""
+
+# Only needed by extraction and exports; must not be imported at boot
+HEAVY_MODULES = ['google.generativeai', 'pandas', 'openpyxl']
+
+
+class Command(BaseCommand):
+    help = (
+        "Boot the ASGI application in a fresh interpreter under `python -X importtime` "
+        "and fail if it is slower, larger or imports more than allowed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-ms', type=float, default=1500,
+            help="Maximum total import time in milliseconds",
+        )
+        parser.add_argument(
+            '--max-rss-mb', type=float, default=100,
+            help="Maximum resident memory after boot in MB",
+        )
+        parser.add_argument(
+            '--forbid', default=','.join(HEAVY_MODULES),
+            help="Comma-separated modules that must not be imported at boot",
+        )
+        parser.add_argument('--top', type=int, default=15, help="Number of slowest modules to list")
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+            'DJANGO_SETTINGS_MODULE', 'marksheet_project.settings'
+        ))
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT],
+            capture_output=True, text=True, env=env,
+        )
+        if result.returncode != 0:
+            raise CommandError(f"Booting the application failed:\n{result.stderr[-2000:]}")
+
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        imports = self._parse_importtime(result.stderr)
+        total_ms = sum(cumulative for name, cumulative, top_level in imports if top_level) / 1000
+        rss_mb = report['max_rss_kb'] / 1024
+
+        self.stdout.write("Slowest imports (cumulative, including what they import):")
+        slowest = sorted(imports, key=lambda i: i[1], reverse=True)
+        for name, cumulative, _ in slowest[:options['top']]:
+            self.stdout.write(f"  {cumulative / 1000:8.1f}ms  {name}")
+        self.stdout.write(f"Total import time: {total_ms:.0f}ms, peak RSS: {rss_mb:.1f}MB")
+
+        problems = []
+        forbidden = [name.strip() for name in options['forbid'].split(',') if name.strip()]
+        loaded = set(report['modules'])
+        for name in forbidden:
+            if name in loaded:
+                problems.append(f"{name} is imported at boot")
+        if total_ms > options['max_ms']:
+            problems.append(f"import time {total_ms:.0f}ms exceeds {options['max_ms']:.0f}ms")
+        if rss_mb > options['max_rss_mb']:
+            problems.append(f"RSS {rss_mb:.1f}MB exceeds {options['max_rss_mb']:.0f}MB")
+
+        if problems:
+            raise CommandError("Worker boot budget exceeded: " + "; ".join(problems))
+        self.stdout.write(self.style.SUCCESS("Worker boot is within budget."))
+
+    @staticmethod
+    def _parse_importtime(stderr):
+        """
+        Parse ``-X importtime`` output
+
+        Returns:
+            List of (module, cumulative microseconds, is top level) tuples
+        """
+        imports = []
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|', 2)
+            # Nested imports are indented by two spaces per level
+            top_level = not name[1:].startswith(' ')
+            imports.append((name.strip(), int(cumulative), top_level))
+        return imports
@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from marksheet_ocr.services.retention import MarksheetRetention
+from marksheet_ocr.services.upload_sessions import UploadSessionStore, session_max_age
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete idle upload sessions and marksheet images no upload references, then "
+        "compress or evict originals of old completed uploads according to the retention policy"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Report what would be removed without changing anything",
+        )
+        parser.add_argument(
+            '--retention-days', type=int, default=settings.MARKSHEET_RETENTION_DAYS,
+            help="Apply the retention action to completed uploads older than this (0 disables)",
+        )
+        parser.add_argument(
+            '--retention-action', choices=['compress', 'evict'], default=settings.MARKSHEET_RETENTION_ACTION,
+            help="Re-encode originals as smaller JPEGs, or delete them",
+        )
+        parser.add_argument(
+            '--grace-minutes', type=int, default=60,
+            help="Keep unreferenced files younger than this (uploads still in progress)",
+        )
+
+    def handle(self, *args, **options):
+        retention = MarksheetRetention(dry_run=options['dry_run'])
+        prefix = "[dry run] " if options['dry_run'] else ""
+
+        if options['retention_days'] > 0:
+            try:
+                processed, freed = retention.apply_retention(
+                    options['retention_days'],
+                    options['retention_action'],
+                    max_dimension=settings.MARKSHEET_RETENTION_MAX_DIMENSION,
+                    quality=settings.MARKSHEET_RETENTION_QUALITY,
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(
+                f"{prefix}Retention ({options['retention_action']} after {options['retention_days']} days): "
+                f"{processed} image(s), {freed / (1024 * 1024):.1f}MB freed."
+            )
+
+        sessions, freed = UploadSessionStore().expire(session_max_age(), dry_run=options['dry_run'])
+        self.stdout.write(
+            f"{prefix}Deleted {sessions} upload session(s) idle for {settings.MARKSHEET_UPLOAD_SESSION_HOURS}h, "
+            f"{freed / (1024 * 1024):.1f}MB of partial files freed."
+        )
+
+        removed, freed = retention.collect_garbage(timedelta(minutes=options['grace_minutes']))
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Removed {removed} unreferenced file(s), {freed / (1024 * 1024):.1f}MB freed."
+        ))
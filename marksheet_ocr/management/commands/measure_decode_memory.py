@@ -0,0 +1,75 @@
+import multiprocessing
+import resource
+import time
+
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from marksheet_ocr.services.ai_extractor import AIExtractor
+from marksheet_ocr.services.imaging import ImageTooLargeError, load_reduced
+
+
+def _naive_decode(path, max_size):
+    """What the extractor used to do: full decode, convert, then resize"""
+    image = Image.open(path)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    if max(image.size) > max_size:
+        ratio = max_size / max(image.size)
+        image = image.resize((int(image.size[0] * ratio), int(image.size[1] * ratio)), Image.Resampling.LANCZOS)
+    return image
+
+
+def _bounded_decode(path, max_size):
+    return load_reduced(path, max_size)
+
+
+def _measure(decode, path, max_size, results):
+    # Runs in a fresh child process so ru_maxrss reflects this decode only
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    try:
+        image = decode(path, max_size)
+        outcome = f'{image.size[0]}x{image.size[1]}'
+    except ImageTooLargeError as e:
+        outcome = f'rejected: {e}'
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((outcome, (peak - before) / 1024, elapsed))
+
+
+class Command(BaseCommand):
+    help = "Measure peak memory (RSS) of decoding images for extraction, bounded vs. full decode"
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="Image files to decode")
+        parser.add_argument(
+            '--max-size', type=int, default=AIExtractor.MAX_IMAGE_SIZE,
+            help="Longest side to decode to",
+        )
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('fork')
+
+        for path in options['paths']:
+            try:
+                with Image.open(path) as image:
+                    self.stdout.write(
+                        f"{path}: {image.format} {image.size[0]}x{image.size[1]} {image.mode}, "
+                        f"{getattr(image, 'n_frames', 1)} frame(s)"
+                    )
+            except Image.DecompressionBombError as e:
+                self.stdout.write(self.style.WARNING(f"{path}: {e}"))
+                continue
+
+            for label, decode in (('full decode', _naive_decode), ('bounded', _bounded_decode)):
+                results = context.Queue()
+                process = context.Process(target=_measure, args=(decode, path, options['max_size'], results))
+                process.start()
+                process.join()
+                if process.exitcode != 0:
+                    self.stdout.write(self.style.ERROR(f"  {label:12} failed (exit code {process.exitcode})"))
+                    continue
+
+                outcome, peak_mb, elapsed = results.get()
+                self.stdout.write(f"  {label:12} {outcome:>12}  peak +{peak_mb:7.1f}MB  {elapsed:6.2f}s")
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from marksheet_ocr.services.analytics import SubjectAnalytics
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the subject summary and trend tables from all marks, archived ones included. They are kept "
+        "current as marks change; run this after loading marks without signals, or to repair them."
+    )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        summaries, trends = SubjectAnalytics().rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {summaries} upload summaries and {trends} monthly trends "
+            f"in {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from marksheet_ocr.services.search import StudentSearch
+
+
+class Command(BaseCommand):
+    help = "Rebuild the student name search tokens (SQLite; PostgreSQL uses a trigram index)"
+
+    def handle(self, *args, **options):
+        search = StudentSearch()
+        if not search.uses_token_table():
+            self.stdout.write("Name search uses the pg_trgm index on this database; nothing to rebuild.")
+            return
+
+        indexed = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} student(s)."))
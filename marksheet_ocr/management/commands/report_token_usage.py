@@ -0,0 +1,178 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Case, Count, F, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from marksheet_ocr.models import MarksheetUpload
+from marksheet_ocr.services.usage import image_tokens_at
+
+
+# Students per sheet, as (label, largest count in the bucket)
+SHEET_SIZES = [('1-10', 10), ('11-25', 25), ('26-50', 50), ('51+', None)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Report Gemini token usage of extractions by day, model, sheet size and "
+        "resolution, and estimate what trimming the prompt or changing the "
+        "resolution ladder would save"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help="Uploads of the last N days (0 for all)")
+        parser.add_argument(
+            '--input-price', type=float, default=0,
+            help="USD per million input tokens, to show costs",
+        )
+        parser.add_argument('--output-price', type=float, default=0, help="USD per million output tokens")
+        parser.add_argument(
+            '--prompt-trim', type=float, default=0.25,
+            help="Fraction of the fixed prompt to assume trimmed in the savings estimate",
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError("--days must not be negative")
+        if not 0 <= options['prompt_trim'] <= 1:
+            raise CommandError("--prompt-trim must be between 0 and 1")
+        self.options = options
+
+        uploads = MarksheetUpload.objects.filter(api_calls__gt=0)
+        if options['days']:
+            uploads = uploads.filter(uploaded_at__gte=timezone.now() - timedelta(days=options['days']))
+        if not uploads.exists():
+            self.stdout.write("No extractions with recorded token usage.")
+            return
+
+        sums = {
+            'sheets': Count('id'),
+            'calls': Sum('api_calls'),
+            'text': Sum('prompt_tokens'),
+            'image': Sum('image_tokens'),
+            'output': Sum('output_tokens'),
+        }
+        overall = uploads.aggregate(**sums)
+        self._table("Overall", "", [dict(overall, key='all')])
+        self._table(
+            "By day", "day",
+            uploads.annotate(key=TruncDate('uploaded_at')).values('key').annotate(**sums).order_by('key'),
+        )
+        self._table("By model", "model", uploads.values(key=F('model_name')).annotate(**sums).order_by('key'))
+        self._table("By sheet size (students)", "students", self._by_size(uploads, sums))
+        self._table(
+            "By accepted resolution", "px",
+            uploads.values(key=F('extraction_resolution')).annotate(**sums).order_by('key'),
+        )
+        self._savings(uploads, overall)
+
+    def _by_size(self, uploads, sums):
+        buckets = []
+        lower = 0
+        for label, upper in SHEET_SIZES:
+            condition = {'students_total__gt': lower}
+            if upper is not None:
+                condition['students_total__lte'] = upper
+            buckets.append(When(then=Value(label), **condition))
+            lower = upper
+        rows = {
+            row['key']: row
+            for row in uploads.annotate(key=Case(*buckets, default=Value('none'))).values('key').annotate(**sums)
+        }
+        return [rows[label] for label in [label for label, _ in SHEET_SIZES] + ['none'] if label in rows]
+
+    def _table(self, title, key_label, rows):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n{title}"))
+        priced = self.options['input_price'] or self.options['output_price']
+        header = (
+            f"{key_label:>18} {'sheets':>7} {'calls':>6} {'calls/sh':>8} {'text/sh':>8} "
+            f"{'image/sh':>8} {'output/sh':>9} {'tokens':>11}"
+        )
+        self.stdout.write(header + (f" {'USD/sheet':>9} {'USD':>9}" if priced else ''))
+        for row in rows:
+            sheets = row['sheets']
+            total = row['text'] + row['image'] + row['output']
+            line = (
+                f"{str(row['key'] if row['key'] is not None else '-'):>18} {sheets:>7} {row['calls']:>6} "
+                f"{row['calls'] / sheets:>8.2f} {row['text'] / sheets:>8.0f} {row['image'] / sheets:>8.0f} "
+                f"{row['output'] / sheets:>9.0f} {total:>11}"
+            )
+            if priced:
+                cost = self._cost(row['text'] + row['image'], row['output'])
+                line += f" {cost / sheets:>9.5f} {cost:>9.4f}"
+            self.stdout.write(line)
+
+    def _cost(self, input_tokens, output_tokens):
+        return (input_tokens * self.options['input_price'] + output_tokens * self.options['output_price']) / 1e6
+
+    def _savings(self, uploads, overall):
+        input_tokens = overall['text'] + overall['image'] or 1
+        trim = self.options['prompt_trim']
+        saved = overall['text'] * trim
+        self.stdout.write(self.style.MIGRATE_HEADING("\nPrompt"))
+        self.stdout.write(
+            f"The fixed prompt and schema are {overall['text'] / overall['calls']:.0f} tokens per call, "
+            f"{overall['text'] / input_tokens:.0%} of input tokens."
+        )
+        self.stdout.write(
+            f"Trimming it by {trim:.0%} would save {saved:.0f} input tokens "
+            f"({saved / input_tokens:.1%} of input){self._priced(saved, 0)}."
+        )
+
+        # Replay the recorded calls at each rung of the ladder
+        resolutions = sorted(set(settings.MARKSHEET_EXTRACTION_RESOLUTIONS))
+        actual_image = 0
+        at_resolution = defaultdict(int)
+        rejected = defaultdict(int)
+        by_size = defaultdict(lambda: {'calls': 0, 'image': 0, 'output': 0, 'seconds': 0.0})
+        for calls, accepted in uploads.values_list('token_usage', 'extraction_resolution').iterator():
+            for call in calls or []:
+                if call['kind'] != 'full':
+                    continue
+                actual_image += call['image_tokens']
+                for resolution in resolutions:
+                    at_resolution[resolution] += image_tokens_at(call, resolution)
+                if call['max_size'] != accepted:
+                    rejected['calls'] += 1
+                    rejected['input'] += call['text_tokens'] + call['image_tokens']
+                    rejected['output'] += call['output_tokens']
+                stats = by_size[call['max_size']]
+                stats['calls'] += 1
+                stats['image'] += call['image_tokens']
+                stats['output'] += call['output_tokens']
+                stats['seconds'] += call.get('seconds', 0)
+
+        self.stdout.write(self.style.MIGRATE_HEADING("\nFull extraction calls by image size"))
+        self.stdout.write(f"{'px':>6} {'calls':>6} {'image/call':>10} {'output/call':>11} {'s/call':>7}")
+        for size, stats in sorted(by_size.items()):
+            calls = stats['calls']
+            self.stdout.write(
+                f"{size:>6} {calls:>6} {stats['image'] / calls:>10.0f} {stats['output'] / calls:>11.0f} "
+                f"{stats['seconds'] / calls:>7.1f}"
+            )
+        self.stdout.write(
+            f"Attempts rejected by the quality checks: {rejected['calls']} call(s), "
+            f"{rejected['input'] + rejected['output']} tokens{self._priced(rejected['input'], rejected['output'])}."
+        )
+
+        self.stdout.write(self.style.MIGRATE_HEADING("\nImage tokens if every full call were sent at"))
+        for resolution in resolutions:
+            change = at_resolution[resolution] - actual_image
+            share = change / actual_image if actual_image else 0
+            self.stdout.write(
+                f"{resolution:>6}px: {at_resolution[resolution]:>10} ({change:+d}, {share:+.0%})"
+                f"{self._priced(-change, 0, 'saved') if change < 0 else ''}"
+            )
+        self.stdout.write(
+            "Lower resolutions may fail the quality checks more often; compare with the "
+            "accepted resolution table above."
+        )
+
+    def _priced(self, input_tokens, output_tokens, verb=''):
+        if not (self.options['input_price'] or self.options['output_price']):
+            return ''
+        cost = self._cost(input_tokens, output_tokens)
+        return f", ${cost:.4f}{' ' + verb if verb else ''}"
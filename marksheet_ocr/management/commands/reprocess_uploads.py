@@ -0,0 +1,241 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, time as dt_time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from marksheet_ocr.models import MarksheetUpload
+from marksheet_ocr.services.documents import DocumentSplitter
+from marksheet_ocr.services.processing import UploadProcessor
+
+DEFAULT_STATUSES = ['failed', 'processing']
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-run extraction for failed, stuck or selected uploads, replacing their "
+        "students. Resumable with --checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--status', action='append', choices=['failed', 'processing', 'pending', 'completed'],
+            help="Statuses to reprocess (repeatable; default failed and stuck processing)",
+        )
+        parser.add_argument('--ids', help="Comma-separated upload ids to restrict to")
+        parser.add_argument('--since', type=_parse_date, help="Uploaded on or after this date (YYYY-MM-DD)")
+        parser.add_argument('--until', type=_parse_date, help="Uploaded on or before this date (YYYY-MM-DD)")
+        parser.add_argument('--error-contains', help="Only uploads whose error message contains this text")
+        parser.add_argument(
+            '--stale-minutes', type=int, default=30,
+            help="Uploads 'processing' without progress for this long count as stuck",
+        )
+        parser.add_argument('--concurrency', type=int, default=2, help="Uploads processed at once")
+        parser.add_argument('--rate', type=float, help="Start at most this many uploads per minute")
+        parser.add_argument('--limit', type=int, help="Stop after this many uploads")
+        parser.add_argument(
+            '--checkpoint',
+            help="File recording completed upload ids; ids already in it are skipped, so an "
+                 "interrupted run continues where it stopped",
+        )
+        parser.add_argument(
+            '--checkpoint-failed', action='store_true',
+            help="Also record failed uploads in the checkpoint, so a resumed run does not retry them",
+        )
+        parser.add_argument('--dry-run', action='store_true', help="List matching uploads and exit")
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError("--concurrency must be at least 1")
+
+        queryset = self._matching(options)
+        done = self._read_checkpoint(options['checkpoint'])
+        units, claimable = self._units(queryset, options, split=not options['dry_run'])
+        ids = [upload_id for upload_id in units if upload_id not in done]
+        if options['limit']:
+            ids = ids[:options['limit']]
+
+        if done:
+            self.stdout.write(f"Skipping {len(done)} upload(s) recorded in {options['checkpoint']}.")
+        if options['dry_run']:
+            for upload in MarksheetUpload.objects.filter(id__in=ids).order_by('uploaded_at', 'id'):
+                error = (upload.error_message or '').splitlines()[0][:80] if upload.error_message else ''
+                self.stdout.write(f"  #{upload.id} {upload.status:10} {upload.uploaded_at:%Y-%m-%d %H:%M} {error}")
+            self.stdout.write(f"[dry run] {len(ids)} upload(s) would be reprocessed.")
+            return
+        if not ids:
+            self.stdout.write("Nothing to reprocess.")
+            return
+
+        self._run(ids, claimable, options)
+
+    def _matching(self, options):
+        statuses = options['status'] or DEFAULT_STATUSES
+        stale_before = timezone.now() - timedelta(minutes=options['stale_minutes'])
+
+        condition = Q()
+        for status in statuses:
+            if status == 'processing':
+                # Only rows a killed worker left behind, not live jobs
+                condition |= Q(status='processing', updated_at__lt=stale_before)
+            else:
+                condition |= Q(status=status)
+        queryset = MarksheetUpload.objects.filter(condition)
+
+        if options['ids']:
+            try:
+                queryset = queryset.filter(id__in=[int(i) for i in options['ids'].split(',') if i.strip()])
+            except ValueError:
+                raise CommandError("--ids must be a comma-separated list of integers")
+        if options['since']:
+            start = timezone.make_aware(datetime.combine(options['since'], dt_time.min))
+            queryset = queryset.filter(uploaded_at__gte=start)
+        if options['until']:
+            end = timezone.make_aware(datetime.combine(options['until'] + timedelta(days=1), dt_time.min))
+            queryset = queryset.filter(uploaded_at__lt=end)
+        if options['error_contains']:
+            queryset = queryset.filter(error_message__icontains=options['error_contains'])
+
+        return queryset.order_by('uploaded_at', 'id')
+
+    def _units(self, queryset, options, split=True):
+        """
+        Expand the matching uploads into the uploads to extract
+
+        A PDF or multi-page TIFF is not extracted itself: process() would only
+        queue its pages on the in-process pool, outside --concurrency and
+        --rate, and return before they ran. Its pages are reprocessed here
+        instead, like any other upload; completed pages only when completed
+        uploads were asked for. A page that matched on its own as well is
+        listed once.
+
+        Args:
+            queryset: Matching uploads, from _matching
+            options: Command options
+            split: Create the missing pages of the documents first (off for
+                --dry-run, which lists only the pages that exist)
+
+        Returns:
+            Tuple of the upload ids in processing order and the queryset a
+            row must still be in to be claimed
+        """
+        statuses = options['status'] or DEFAULT_STATUSES
+        stale_before = timezone.now() - timedelta(minutes=options['stale_minutes'])
+        documents = list(queryset.filter(page_count__gt=0).values_list('id', flat=True))
+
+        if split:
+            splitter = DocumentSplitter()
+            for document in MarksheetUpload.objects.filter(id__in=documents):
+                try:
+                    splitter.split(document)
+                except Exception as e:
+                    self.stderr.write(f"Could not split upload {document.id}: {e}")
+                    continue
+                # A document whose pages have all finished only needs its status recounted
+                splitter.refresh_progress(document.id)
+
+        pages = MarksheetUpload.objects.filter(parent_id__in=documents).exclude(
+            status='processing', updated_at__gte=stale_before
+        )
+        if 'completed' not in statuses:
+            pages = pages.exclude(status='completed')
+
+        ids = list(queryset.filter(page_count=0).values_list('id', flat=True))
+        seen = set(ids)
+        ordered = pages.order_by('parent__uploaded_at', 'parent_id', 'page_number')
+        ids += [page_id for page_id in ordered.values_list('id', flat=True) if page_id not in seen]
+        return ids, queryset.filter(page_count=0) | pages
+
+    def _read_checkpoint(self, path):
+        if not path:
+            return set()
+        try:
+            with open(path) as f:
+                return {int(line) for line in f if line.strip().isdigit()}
+        except FileNotFoundError:
+            return set()
+
+    def _run(self, ids, claimable, options):
+        total = len(ids)
+        interval = 60.0 / options['rate'] if options['rate'] else 0
+        checkpoint = open(options['checkpoint'], 'a') if options['checkpoint'] else None
+        lock = threading.Lock()
+        counts = {'completed': 0, 'failed': 0, 'skipped': 0}
+        started = time.monotonic()
+
+        def reprocess(upload_id):
+            try:
+                # Claim the row so a concurrent run or live worker cannot take it too
+                claimed = claimable.filter(pk=upload_id).update(
+                    status='processing', stage='queued', updated_at=timezone.now()
+                )
+                if not claimed:
+                    return upload_id, 'skipped'
+                upload = MarksheetUpload.objects.get(pk=upload_id)
+                ok = UploadProcessor().process(upload, replace_students=True)
+                return upload_id, 'completed' if ok else 'failed'
+            finally:
+                connection.close()
+
+        def record(upload_id, outcome):
+            with lock:
+                counts[outcome] += 1
+                # Failures stay out of the checkpoint so a resumed run retries them
+                recorded = outcome == 'completed' or (outcome == 'failed' and options['checkpoint_failed'])
+                if checkpoint is not None and recorded:
+                    checkpoint.write(f"{upload_id}\n")
+                    checkpoint.flush()
+                finished = sum(counts.values())
+                elapsed = time.monotonic() - started
+                rate = finished / elapsed * 60 if elapsed else 0
+                eta = (total - finished) / (finished / elapsed) if finished else 0
+                self.stdout.write(
+                    f"[{finished}/{total}] #{upload_id} {outcome}  "
+                    f"{rate:.1f} uploads/min, ETA {timedelta(seconds=int(eta))}"
+                )
+
+        executor = ThreadPoolExecutor(max_workers=options['concurrency'], thread_name_prefix='reprocess')
+        pending = set()
+        try:
+            for position, upload_id in enumerate(ids):
+                if interval and position:
+                    time.sleep(interval)
+                while len(pending) >= options['concurrency']:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        record(*future.result())
+                pending.add(executor.submit(reprocess, upload_id))
+
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    record(*future.result())
+            executor.shutdown()
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(
+                "Interrupted; waiting for uploads in progress. Rerun with the same --checkpoint to resume."
+            ))
+            executor.shutdown(wait=True, cancel_futures=True)
+            for future in pending:
+                if future.done() and not future.cancelled():
+                    record(*future.result())
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Reprocessed {counts['completed']} upload(s), {counts['failed']} failed, "
+            f"{counts['skipped']} skipped in {elapsed:.0f}s."
+        ))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from marksheet_ocr.models import MarksheetUpload
+from marksheet_ocr.services.archive import UploadArchiver
+
+
+class Command(BaseCommand):
+    help = "Write the students and marks of archived uploads back and remove their archives"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ids', help="Comma-separated upload ids to restore")
+        parser.add_argument('--all', action='store_true', help="Restore every archived upload")
+
+    def handle(self, *args, **options):
+        if bool(options['ids']) == options['all']:
+            raise CommandError("Pass either --ids or --all")
+
+        uploads = MarksheetUpload.objects.filter(status='archived', parent__isnull=True)
+        if options['ids']:
+            try:
+                ids = [int(i) for i in options['ids'].split(',') if i.strip()]
+            except ValueError:
+                raise CommandError("--ids must be a comma-separated list of integers")
+            uploads = uploads.filter(id__in=ids)
+            missing = set(ids) - set(uploads.values_list('id', flat=True))
+            if missing:
+                raise CommandError(f"Not archived: {', '.join(map(str, sorted(missing)))}")
+
+        archiver = UploadArchiver()
+        restored = 0
+        uploads = list(uploads.order_by('uploaded_at', 'id'))
+        for upload in uploads:
+            students = archiver.restore(upload)
+            restored += students
+            self.stdout.write(f"  #{upload.id}: {students} students")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Restored {len(uploads)} upload(s) with {restored} students."
+        ))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marksheet_ocr', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='stage',
+            field=models.CharField(choices=[('queued', 'Queued'), ('preparing', 'Preparing image'), ('extracting', 'Extracting with AI'), ('saving', 'Saving students'), ('done', 'Done')], default='queued', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='students_saved',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='students_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
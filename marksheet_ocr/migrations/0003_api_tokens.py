@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marksheet_ocr', '0002_upload_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiSubmission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ApiToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Who or what uses this token, e.g. scanner station', max_length=100)),
+                ('key', models.CharField(editable=False, max_length=64, unique=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='submission',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='uploads', to='marksheet_ocr.apisubmission'),
+        ),
+        migrations.AddField(
+            model_name='apisubmission',
+            name='token',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submissions', to='marksheet_ocr.apitoken'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='apisubmission',
+            unique_together={('token', 'idempotency_key')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marksheet_ocr', '0003_api_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='results_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marksheet_ocr', '0004_results_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='marksheetupload',
+            index=models.Index(fields=['-uploaded_at', '-id'], name='upload_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='marksheetupload',
+            index=models.Index(fields=['status', '-uploaded_at', '-id'], name='upload_status_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['upload', 'roll_number', 'id'], name='student_upload_roll_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_trigram_index(apps, schema_editor):
+    # Matches the UPPER(name::text) LIKE UPPER(...) that icontains generates
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS student_name_trgm_idx ON marksheet_ocr_student '
+        'USING gin ((UPPER(name::text)) gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS student_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marksheet_ocr', '0005_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='student',
+            name='enrollment_number',
+            field=models.CharField(blank=True, db_index=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='student',
+            name='roll_number',
+            field=models.CharField(db_index=True, max_length=50),
+        ),
+        migrations.CreateModel(
+            name='StudentSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=100)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='marksheet_ocr.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', 'student'], name='student_search_token_idx')],
+            },
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marksheet_ocr', '0006_student_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 of the image', max_length=64),
+        ),
+    ]
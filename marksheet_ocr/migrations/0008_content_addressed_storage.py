@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:19
+
+import marksheet_ocr.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marksheet_ocr', '0007_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='retention_state',
+            field=models.CharField(blank=True, choices=[('', 'Original kept'), ('compressed', 'Original compressed'), ('evicted', 'Original removed')], default='', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='marksheetupload',
+            name='image',
+            field=models.ImageField(db_index=True, storage=marksheet_ocr.storage.get_marksheet_storage, upload_to='marksheets/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marksheet_ocr', '0008_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='extraction_resolution',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
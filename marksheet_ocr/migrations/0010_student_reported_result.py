@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marksheet_ocr', '0009_extraction_resolution'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='reported_percentage',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='reported_result',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+    ]
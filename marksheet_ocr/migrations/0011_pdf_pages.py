@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marksheet_ocr', '0010_student_reported_result'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='page_count',
+            field=models.PositiveIntegerField(default=0, help_text='Pages of a PDF upload; 0 for images'),
+        ),
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='page_number',
+            field=models.PositiveIntegerField(blank=True, help_text='1-based page of the parent PDF', null=True),
+        ),
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='pages_finished',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='marksheet_ocr.marksheetupload'),
+        ),
+    ]
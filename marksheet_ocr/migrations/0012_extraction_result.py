@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marksheet_ocr', '0011_pdf_pages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='extraction_result',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
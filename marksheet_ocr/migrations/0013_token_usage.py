@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marksheet_ocr', '0012_extraction_result'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='api_calls',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='image_tokens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='model_name',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='output_tokens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='prompt_tokens',
+            field=models.PositiveIntegerField(default=0, help_text='Text input tokens: instructions and schema'),
+        ),
+        migrations.AddField(
+            model_name='marksheetupload',
+            name='token_usage',
+            field=models.JSONField(blank=True, editable=False, help_text='Usage of each call', null=True),
+        ),
+    ]
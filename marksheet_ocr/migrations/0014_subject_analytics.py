@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marksheet_ocr', '0013_token_usage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubjectSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('students', models.PositiveIntegerField(default=0)),
+                ('passed', models.PositiveIntegerField(default=0)),
+                ('marks_obtained', models.PositiveIntegerField(default=0)),
+                ('marks_maximum', models.PositiveIntegerField(default=0)),
+                ('histogram', models.JSONField(default=list)),
+                ('grades', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('period', models.DateField()),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='summaries', to='marksheet_ocr.subject')),
+                ('upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subject_summaries', to='marksheet_ocr.marksheetupload')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['subject', 'period'], name='subject_summary_period_idx')],
+                'unique_together': {('upload', 'subject')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SubjectTrend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('students', models.PositiveIntegerField(default=0)),
+                ('passed', models.PositiveIntegerField(default=0)),
+                ('marks_obtained', models.PositiveIntegerField(default=0)),
+                ('marks_maximum', models.PositiveIntegerField(default=0)),
+                ('histogram', models.JSONField(default=list)),
+                ('grades', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('period', models.DateField(help_text='First day of the month')),
+                ('sheets', models.PositiveIntegerField(default=0)),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trends', to='marksheet_ocr.subject')),
+            ],
+            options={
+                'ordering': ['subject', 'period'],
+                'unique_together': {('subject', 'period')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marksheet_ocr', '0014_subject_analytics'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='marksheetupload',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed'), ('archived', 'Archived')], default='pending', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='UploadArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('format_version', models.PositiveSmallIntegerField(default=1)),
+                ('students', models.PositiveIntegerField(default=0)),
+                ('marks', models.PositiveIntegerField(default=0)),
+                ('payload', models.BinaryField()),
+                ('upload', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='archive', to='marksheet_ocr.marksheetupload')),
+            ],
+        ),
+    ]
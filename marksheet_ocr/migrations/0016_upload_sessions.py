@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marksheet_ocr', '0015_upload_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(editable=False, max_length=64, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finalized_at', models.DateTimeField(blank=True, null=True)),
+                ('token', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_sessions', to='marksheet_ocr.apitoken')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UploadSessionFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.PositiveBigIntegerField(help_text='Declared size in bytes')),
+                ('received', models.PositiveBigIntegerField(default=0)),
+                ('content_hash', models.CharField(blank=True, max_length=64)),
+                ('page_count', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='marksheet_ocr.uploadsession')),
+                ('upload', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='session_file', to='marksheet_ocr.marksheetupload')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
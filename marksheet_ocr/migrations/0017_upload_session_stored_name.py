@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marksheet_ocr', '0016_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsessionfile',
+            name='stored_name',
+            field=models.CharField(blank=True, help_text='Name in the marksheet storage', max_length=255),
+        ),
+    ]
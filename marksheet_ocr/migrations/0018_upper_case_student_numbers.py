@@ -0,0 +1,19 @@
+from django.db import migrations
+from django.db.models.functions import Upper
+
+
+def upper_case_numbers(apps, schema_editor):
+    # StudentSearch matches the upper-cased query against both columns
+    Student = apps.get_model('marksheet_ocr', 'Student')
+    Student.objects.update(roll_number=Upper('roll_number'), enrollment_number=Upper('enrollment_number'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marksheet_ocr', '0017_upload_session_stored_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(upper_case_numbers, migrations.RunPython.noop),
+    ]
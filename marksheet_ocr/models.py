@@ -1,6 +1,43 @@
 from django.db import models
+from django.db.models import Case, Count, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.urls import reverse
+from django.utils import timezone
 import os
+import secrets
+
+from .storage import get_marksheet_storage
+
+
+class ApiToken(models.Model):
+    """Token used by scripts to authenticate against the JSON API"""
+    name = models.CharField(max_length=100, help_text="Who or what uses this token, e.g. scanner station")
+    key = models.CharField(max_length=64, unique=True, editable=False)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return self.name
+    
+    def save(self, *args, **kwargs):
+        if not self.key:
+            self.key = secrets.token_hex(20)
+        super().save(*args, **kwargs)
+
+
+class ApiSubmission(models.Model):
+    """A batch of uploads submitted through the API under one idempotency key"""
+    token = models.ForeignKey(ApiToken, on_delete=models.CASCADE, related_name='submissions')
+    idempotency_key = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['token', 'idempotency_key']
+    
+    def __str__(self):
+        return f"Submission {self.id} ({self.idempotency_key})"
 
 
 class MarksheetUpload(models.Model):
@@ -10,31 +47,222 @@ class MarksheetUpload(models.Model):
         ('processing', 'Processing'),
         ('completed', 'Completed'),
         ('failed', 'Failed'),
+        # Completed, with its students and marks moved to an UploadArchive
+        ('archived', 'Archived'),
+    ]
+    
+    STAGE_CHOICES = [
+        ('queued', 'Queued'),
+        ('preparing', 'Preparing image'),
+        ('extracting', 'Extracting with AI'),
+        ('saving', 'Saving students'),
+        ('done', 'Done'),
+    ]
+    
+    RETENTION_CHOICES = [
+        ('', 'Original kept'),
+        ('compressed', 'Original compressed'),
+        ('evicted', 'Original removed'),
     ]
     
-    image = models.ImageField(upload_to='marksheets/')
+    # Stored under its content hash and shared by uploads of the same scan
+    image = models.ImageField(upload_to='marksheets/', storage=get_marksheet_storage, db_index=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     error_message = models.TextField(blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True, help_text="SHA-256 of the image")
+    submission = models.ForeignKey(
+        ApiSubmission, on_delete=models.SET_NULL, null=True, blank=True, related_name='uploads'
+    )
+    
+    # Live progress of the extraction, polled by the status API
+    stage = models.CharField(max_length=20, choices=STAGE_CHOICES, default='queued')
+    students_total = models.PositiveIntegerField(default=0)
+    students_saved = models.PositiveIntegerField(default=0)
+    
+    # Bumped whenever this upload's students or marks change; part of the
+    # results page cache key so stale fragments are never served
+    results_version = models.PositiveIntegerField(default=0)
+    
+    # Longest image side (px) of the extraction that was kept
+    extraction_resolution = models.PositiveIntegerField(null=True, blank=True)
+    # The students as extracted, in the compact form of services.records
+    extraction_result = models.JSONField(null=True, blank=True, editable=False)
+    
+    # Gemini usage of the last extraction, summed over its calls (adaptive
+    # retries and targeted re-reads included); see services.usage
+    model_name = models.CharField(max_length=100, blank=True)
+    api_calls = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.PositiveIntegerField(default=0, help_text="Text input tokens: instructions and schema")
+    image_tokens = models.PositiveIntegerField(default=0)
+    output_tokens = models.PositiveIntegerField(default=0)
+    token_usage = models.JSONField(null=True, blank=True, editable=False, help_text="Usage of each call")
+    
+    # What gc_marksheets has done to the original image under the retention policy
+    retention_state = models.CharField(max_length=20, choices=RETENTION_CHOICES, blank=True, default='')
+    
+    # A PDF or multi-page TIFF upload is a document: its image is the file,
+    # and each page is a child upload of its own, rasterized when its
+    # extraction starts
+    parent = models.ForeignKey(
+        'self', on_delete=models.CASCADE, null=True, blank=True, related_name='pages'
+    )
+    page_number = models.PositiveIntegerField(null=True, blank=True, help_text="1-based page of the parent PDF")
+    page_count = models.PositiveIntegerField(default=0, help_text="Pages of a PDF upload; 0 for images")
+    pages_finished = models.PositiveIntegerField(default=0)
     
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            # Upload history, newest first, optionally filtered by status
+            models.Index(fields=['-uploaded_at', '-id'], name='upload_history_idx'),
+            models.Index(fields=['status', '-uploaded_at', '-id'], name='upload_status_history_idx'),
+        ]
     
     def __str__(self):
         return f"Marksheet {self.id} - {self.status}"
+    
+    @classmethod
+    def bump_results_version(cls, upload_id):
+        """Invalidate cached result fragments of an upload (and of its PDF, for a page)"""
+        cls.objects.filter(Q(pk=upload_id) | Q(pages__pk=upload_id)).update(
+            results_version=models.F('results_version') + 1
+        )
+    
+    def is_finished(self):
+        """Whether processing has reached a terminal status"""
+        return self.status in ('completed', 'failed', 'archived')
+    
+    def is_archived(self):
+        """Whether the students were moved to compact archive storage"""
+        return self.status == 'archived'
+    
+    def is_document(self):
+        """Whether this is a PDF or multi-page TIFF whose pages are processed as child uploads"""
+        return self.page_count > 0
+    
+    def get_students(self):
+        """Students extracted from this upload, or from all pages of a PDF upload"""
+        if self.is_document():
+            return Student.objects.filter(upload__parent=self)
+        return self.students.all()
+    
+    def set_progress(self, stage=None, status=None, **counts):
+        """
+        Record a progress update without touching the other columns
+        
+        Uses a single UPDATE so it is safe to call from the background
+        worker while the row is being read by status pollers.
+        
+        Args:
+            stage: New stage (one of STAGE_CHOICES), or None to keep it
+            status: New status (one of STATUS_CHOICES), or None to keep it
+            **counts: students_total and/or students_saved
+        """
+        fields = {'updated_at': timezone.now()}
+        if stage is not None:
+            fields['stage'] = stage
+        if status is not None:
+            fields['status'] = status
+        for name in ('students_total', 'students_saved'):
+            if name in counts:
+                fields[name] = counts[name]
+        
+        MarksheetUpload.objects.filter(pk=self.pk).update(**fields)
+        for name, value in fields.items():
+            setattr(self, name, value)
+    
+    def get_status_payload(self):
+        """Serializable progress snapshot used by the status API and event stream"""
+        payload = {
+            'id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'students_total': self.students_total,
+            'students_saved': self.students_saved,
+            'error_message': self.error_message or '',
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'results_url': None,
+        }
+        if self.status in ('completed', 'archived'):
+            payload['results_url'] = reverse('view_results', args=[self.id])
+        if self.is_document():
+            payload['page_count'] = self.page_count
+            payload['pages_finished'] = self.pages_finished
+        if self.parent_id:
+            payload['parent_id'] = self.parent_id
+            payload['page_number'] = self.page_number
+        return payload
+
+
+class StudentQuerySet(models.QuerySet):
+    def with_results(self, correlated=False):
+        """
+        Annotate each student with the aggregates behind their result
+        
+        Computes in the database what get_total_marks, get_percentage and
+        get_result_status compute per row in Python, so a whole listing is
+        summarized in one query. Student.get_summary uses the annotations
+        when they are present.
+        
+        Args:
+            correlated: Compute each aggregate in a subquery per student
+                instead of joining and grouping the marks. count() then
+                skips them, and a sliced page only aggregates its own rows,
+                which suits paginated listings of the whole table.
+        """
+        prefix = '' if correlated else 'marks__'
+        has_theory = Q(**{f'{prefix}theory_ese__isnull': False}) | Q(**{f'{prefix}theory_internal__isnull': False})
+        has_practical = (
+            Q(**{f'{prefix}practical_marks__isnull': False}) | Q(**{f'{prefix}practical_internal__isnull': False})
+        )
+        aggregates = {
+            'total_obtained': Sum(
+                Coalesce(f'{prefix}theory_ese', 0) + Coalesce(f'{prefix}theory_internal', 0)
+                + Coalesce(f'{prefix}practical_marks', 0) + Coalesce(f'{prefix}practical_internal', 0)
+            ),
+            'total_maximum': Sum(
+                Case(When(has_theory, then=100), default=0)
+                + Case(When(has_practical, then=100), default=0)
+            ),
+            'failed_subjects': Count(
+                prefix.rstrip('_') or 'pk',
+                filter=Q(**{f'{prefix}theory_ese__lt': 33}) | Q(**{f'{prefix}practical_marks__lt': 33}),
+            ),
+            'subject_count': Count(prefix.rstrip('_') or 'pk'),
+        }
+        
+        if correlated:
+            marks = Mark.objects.filter(student=OuterRef('pk')).order_by().values('student')
+            aggregates = {
+                name: Subquery(marks.annotate(value=aggregate).values('value'))
+                for name, aggregate in aggregates.items()
+            }
+        return self.annotate(**{name: Coalesce(value, 0) for name, value in aggregates.items()})
 
 
 class Student(models.Model):
     """Model to store student information"""
     upload = models.ForeignKey(MarksheetUpload, on_delete=models.CASCADE, related_name='students')
-    roll_number = models.CharField(max_length=50)
+    roll_number = models.CharField(max_length=50, db_index=True)
     name = models.CharField(max_length=200)
     father_name = models.CharField(max_length=200, blank=True)
     mother_name = models.CharField(max_length=200, blank=True)
-    enrollment_number = models.CharField(max_length=100, blank=True)
+    enrollment_number = models.CharField(max_length=100, blank=True, db_index=True)
+    
+    # Percentage and result as printed on the sheet, kept to check the
+    # extracted marks against
+    reported_percentage = models.FloatField(null=True, blank=True)
+    reported_result = models.CharField(max_length=50, blank=True)
+    
+    objects = StudentQuerySet.as_manager()
     
     class Meta:
         ordering = ['roll_number']
+        indexes = [
+            models.Index(fields=['upload', 'roll_number', 'id'], name='student_upload_roll_idx'),
+        ]
     
     def __str__(self):
         return f"{self.roll_number} - {self.name}"
@@ -67,11 +295,51 @@ class Student(models.Model):
             return 'N/A'
         
         # Check if any subject has failing marks
-        for mark in marks:
-            if mark.is_failed():
-                return 'FAIL'
+        has_failed = any(mark.is_failed() for mark in marks)
+        return self.classify_result(self.get_percentage(), has_failed)
+    
+    def get_summary(self):
+        """
+        Total, percentage and result computed in a single pass over the marks
+        
+        Equivalent to calling get_total_marks, get_percentage and
+        get_result_status, but iterates the (ideally prefetched) marks once.
+        
+        Returns:
+            Dictionary with total, maximum, percentage and result
+        """
+        if hasattr(self, 'total_obtained'):
+            # Aggregated by StudentQuerySet.with_results, no marks needed
+            total = self.total_obtained
+            maximum = self.total_maximum
+            has_failed = self.failed_subjects > 0
+            has_marks = self.subject_count > 0
+        else:
+            total = 0
+            maximum = 0
+            has_failed = False
+            has_marks = False
+            for mark in self.marks.all():
+                total += mark.get_total_marks()
+                maximum += mark.get_maximum_marks()
+                has_failed = has_failed or mark.is_failed()
+                has_marks = True
+        
+        percentage = round((total / maximum) * 100, 2) if maximum else 0
+        result = self.classify_result(percentage, has_failed) if has_marks else 'N/A'
         
-        percentage = self.get_percentage()
+        return {
+            'total': total,
+            'maximum': maximum,
+            'percentage': percentage,
+            'result': result,
+        }
+    
+    @staticmethod
+    def classify_result(percentage, has_failed_subject):
+        """Map an aggregate percentage to the division printed on the marksheet"""
+        if has_failed_subject:
+            return 'FAIL'
         if percentage >= 75:
             return 'PASS FIRST'
         elif percentage >= 60:
@@ -84,6 +352,25 @@ class Student(models.Model):
             return 'FAIL'
 
 
+class StudentSearchToken(models.Model):
+    """
+    Normalized name tokens for prefix search of students by name
+    
+    Only maintained on databases without trigram indexes (SQLite); on
+    PostgreSQL name search uses a pg_trgm index on the name column instead.
+    """
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=100)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['token', 'student'], name='student_search_token_idx'),
+        ]
+    
+    def __str__(self):
+        return self.token
+
+
 class Subject(models.Model):
     """Model to store subject information"""
     code = models.CharField(max_length=50)
@@ -168,3 +455,195 @@ class Mark(models.Model):
         if self.practical_marks is not None and self.practical_marks < 33:
             return True
         return False
+
+
+class SubjectStats(models.Model):
+    """
+    Running totals of one subject's marks, from which its analytics are read
+    
+    Each mark counts once, with its subject percentage (total over maximum)
+    and the grade Student.classify_result gives that percentage. Totals of
+    several rows add up, so statistics across uploads or months are merged
+    from the rows instead of computed from the marks.
+    """
+    GRADES = ['PASS FIRST', 'PASS SECOND', 'PASS THIRD', 'PASS', 'FAIL']
+    
+    students = models.PositiveIntegerField(default=0)
+    passed = models.PositiveIntegerField(default=0)
+    marks_obtained = models.PositiveIntegerField(default=0)
+    marks_maximum = models.PositiveIntegerField(default=0)
+    # Students per whole subject percentage; index 0-100
+    histogram = models.JSONField(default=list)
+    # Students per grade
+    grades = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        abstract = True
+    
+    def add_mark(self, mark):
+        """Count a Mark (saved or not); marks without any value are skipped"""
+        maximum = mark.get_maximum_marks()
+        if not maximum:
+            return
+        total = mark.get_total_marks()
+        percentage = min(max(total * 100 / maximum, 0), 100)
+        grade = Student.classify_result(percentage, mark.is_failed())
+        
+        if not self.histogram:
+            self.histogram = [0] * 101
+        self.histogram[int(percentage)] += 1
+        self.grades[grade] = self.grades.get(grade, 0) + 1
+        self.students += 1
+        self.passed += grade != 'FAIL'
+        self.marks_obtained += total
+        self.marks_maximum += maximum
+    
+    def merge(self, other):
+        """Add the totals of another row of the same subject"""
+        if other.histogram:
+            self.histogram = [a + b for a, b in zip(self.histogram or [0] * 101, other.histogram)]
+        for grade, count in other.grades.items():
+            self.grades[grade] = self.grades.get(grade, 0) + count
+        self.students += other.students
+        self.passed += other.passed
+        self.marks_obtained += other.marks_obtained
+        self.marks_maximum += other.marks_maximum
+    
+    def pass_rate(self):
+        return round(self.passed * 100 / self.students, 2) if self.students else 0
+    
+    def mean_marks(self):
+        return round(self.marks_obtained / self.students, 2) if self.students else 0
+    
+    def mean_percentage(self):
+        return round(self.marks_obtained * 100 / self.marks_maximum, 2) if self.marks_maximum else 0
+    
+    def median_percentage(self):
+        """Median subject percentage, to the whole percent"""
+        middle = (self.students + 1) / 2
+        seen = 0
+        for percentage, count in enumerate(self.histogram):
+            seen += count
+            if seen >= middle:
+                return percentage
+        return 0
+    
+    def grade_distribution(self):
+        """List of (grade, students) in GRADES order"""
+        return [(grade, self.grades.get(grade, 0)) for grade in self.GRADES]
+    
+    def get_statistics(self):
+        """Serializable statistics used by the analytics page and API"""
+        return {
+            'students': self.students,
+            'passed': self.passed,
+            'pass_rate': self.pass_rate(),
+            'mean_marks': self.mean_marks(),
+            'mean_percentage': self.mean_percentage(),
+            'median_percentage': self.median_percentage(),
+            'grades': dict(self.grade_distribution()),
+        }
+
+
+class SubjectSummary(SubjectStats):
+    """Statistics of one subject on one upload, kept current by services.analytics"""
+    upload = models.ForeignKey(MarksheetUpload, on_delete=models.CASCADE, related_name='subject_summaries')
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='summaries')
+    # First day of the upload's month; the SubjectTrend row this one adds to
+    period = models.DateField()
+    
+    class Meta:
+        unique_together = ['upload', 'subject']
+        indexes = [
+            models.Index(fields=['subject', 'period'], name='subject_summary_period_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.subject.code} on upload {self.upload_id}"
+
+
+class SubjectTrend(SubjectStats):
+    """Statistics of one subject over all uploads of a month"""
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='trends')
+    period = models.DateField(help_text="First day of the month")
+    sheets = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['subject', 'period']
+        ordering = ['subject', 'period']
+    
+    def __str__(self):
+        return f"{self.subject.code} in {self.period:%Y-%m}"
+
+
+class UploadArchive(models.Model):
+    """
+    Students and marks of an archived upload, stored as one compressed blob
+    
+    The payload is the zlib-compressed JSON of the records' compact form (see
+    services.records); services.archive writes and reads it. A PDF upload is
+    archived page by page, each page upload with its own archive.
+    """
+    upload = models.OneToOneField(MarksheetUpload, on_delete=models.CASCADE, related_name='archive')
+    archived_at = models.DateTimeField(auto_now_add=True)
+    format_version = models.PositiveSmallIntegerField(default=1)
+    students = models.PositiveIntegerField(default=0)
+    marks = models.PositiveIntegerField(default=0)
+    payload = models.BinaryField()
+    
+    def __str__(self):
+        return f"Archive of upload {self.upload_id}"
+
+
+class UploadSession(models.Model):
+    """
+    A batch of files sent in resumable chunks, then finalized into uploads
+    
+    The key in its URLs is the session's only credential. Files are added
+    one at a time and written chunk by chunk at explicit offsets (see
+    services.upload_sessions), so a dropped connection costs one chunk.
+    """
+    key = models.CharField(max_length=64, unique=True, editable=False)
+    token = models.ForeignKey(
+        ApiToken, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_sessions'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finalized_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Upload session {self.id}"
+    
+    def save(self, *args, **kwargs):
+        if not self.key:
+            self.key = secrets.token_urlsafe(32)
+        super().save(*args, **kwargs)
+    
+    def is_finalized(self):
+        return self.finalized_at is not None
+
+
+class UploadSessionFile(models.Model):
+    """One file of an UploadSession and how much of it has arrived"""
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='files')
+    name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField(help_text="Declared size in bytes")
+    received = models.PositiveBigIntegerField(default=0)
+    # Filled in when the last chunk arrives and the file passes validation
+    content_hash = models.CharField(max_length=64, blank=True)
+    page_count = models.PositiveIntegerField(default=0)
+    stored_name = models.CharField(max_length=255, blank=True, help_text="Name in the marksheet storage")
+    error = models.TextField(blank=True)
+    upload = models.OneToOneField(
+        MarksheetUpload, on_delete=models.SET_NULL, null=True, blank=True, related_name='session_file'
+    )
+    
+    class Meta:
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"{self.name} ({self.received}/{self.size} bytes)"
+    
+    def is_complete(self):
+        return self.received == self.size
@@ -0,0 +1,104 @@
+"""
+Keyset (cursor) pagination for large, index-backed listings
+"""
+import base64
+import json
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor string cannot be decoded"""
+
+
+class KeysetPage:
+    """One page of results plus the cursor of the page after it"""
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by seeking past the last row instead of using OFFSET
+
+    Each page is a range scan on the ordering columns, so fetching page 5000
+    costs the same as page 1 as long as an index covers the ordering. The
+    ordering must end in a unique field (normally ``id``) so rows with equal
+    sort keys are neither skipped nor repeated.
+
+    Example:
+        paginator = KeysetPaginator(MarksheetUpload.objects.all(), ('-uploaded_at', '-id'))
+        page = paginator.page(request.GET.get('cursor'))
+    """
+
+    def __init__(self, queryset, ordering, per_page=20):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.fields = [name.lstrip('-') for name in self.ordering]
+
+    def page(self, cursor=None):
+        """
+        Fetch the page that starts after ``cursor`` (or the first page)
+
+        Raises:
+            InvalidCursor: If the cursor is malformed
+        """
+        queryset = self.queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self._seek(self.decode_cursor(cursor)))
+
+        items = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(items) > self.per_page:
+            items = items[:self.per_page]
+            next_cursor = self.encode_cursor(items[-1])
+
+        return KeysetPage(items, next_cursor)
+
+    def encode_cursor(self, obj):
+        """Opaque, URL-safe cursor pointing just after ``obj``"""
+        meta = self.queryset.model._meta
+        values = [meta.get_field(name).value_to_string(obj) for name in self.fields]
+        raw = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        meta = self.queryset.model._meta
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded))
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            return [meta.get_field(name).to_python(value) for name, value in zip(self.fields, values)]
+        except Exception:
+            raise InvalidCursor('Invalid pagination cursor.')
+
+    def _seek(self, values):
+        """
+        Build ``(a, b, c) > (x, y, z)`` as nested OR/AND conditions
+
+        Written out field by field because row-value comparisons are not
+        portable and each column may sort in a different direction.
+        """
+        condition = Q()
+        for position, name in enumerate(self.ordering):
+            field = self.fields[position]
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            step = Q(**{f'{field}__{lookup}': values[position]})
+            for previous in range(position):
+                step &= Q(**{self.fields[previous]: values[previous]})
+            condition |= step
+        return condition
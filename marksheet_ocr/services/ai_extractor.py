@@ -3,14 +3,23 @@ AI-powered text extraction service using Google Gemini Vision API
 """
 import os
 import json
-import google.generativeai as genai
-from PIL import Image
+import logging
+import time
 from django.conf import settings
 
+from .extraction_schema import PROMPT, RESPONSE_SCHEMA, TARGETED_PROMPT, decode_response
+from .imaging import ImageTooLargeError, load_reduced
+from .usage import call_usage
+
+
+logger = logging.getLogger(__name__)
 
 class AIExtractor:
     """Extract structured data from marksheet images using Gemini AI"""
     
+    # Longest side of the image sent to the model, in pixels
+    MAX_IMAGE_SIZE = 1024
+    
     def __init__(self):
         # Get API key from Django settings
         api_key = getattr(settings, 'GEMINI_API_KEY', None) or os.getenv('GEMINI_API_KEY')
@@ -21,8 +30,14 @@ class AIExtractor:
                 "Please set it in your environment variables or Render dashboard. "
                 "Get your API key from https://makersuite.google.com/app/apikey"
             )
+        # Imported here rather than at module level: the SDK and its gRPC
+        # dependencies take seconds to load and only extraction needs them
+        import google.generativeai as genai
         genai.configure(api_key=api_key)
         
+        # Usage of every call made through this instance (see services.usage)
+        self.calls = []
+        
         # Try different model names in order of preference (based on actual available models)
         model_names = [
             'gemini-2.5-flash',
@@ -37,7 +52,8 @@ class AIExtractor:
         for model_name in model_names:
             try:
                 self.model = genai.GenerativeModel(model_name)
-                print(f"Successfully initialized model: {model_name}")
+                self.model_name = model_name.removeprefix('models/')
+                logger.info("Initialized Gemini model %s", model_name)
                 break
             except Exception as e:
                 last_error = e
@@ -45,131 +61,96 @@ class AIExtractor:
         else:
             raise ValueError(f"Could not initialize any Gemini model. Last error: {last_error}")
     
-    def extract_marksheet_data(self, image_path):
+    def extract_marksheet_data(self, image_path, max_size=None):
         """
         Extract student data from marksheet image
         
         Args:
             image_path: Path to the marksheet image
+            max_size: Longest side sent to the model (default MAX_IMAGE_SIZE)
             
         Returns:
             List of dictionaries containing student data
         """
         try:
-            # Load image and resize if necessary to reduce memory usage and API latency
-            image = Image.open(image_path)
-            
-            # Convert to RGB if necessary (e.g. for RGBA/P images)
-            if image.mode not in ('RGB', 'L'):
-                image = image.convert('RGB')
-                
-            # Resize if too large (max 1024px dimension) while maintaining aspect ratio
-            max_size = 1024
-            if max(image.size) > max_size:
-                print(f"Resizing image from {image.size} to max {max_size}px")
-                ratio = max_size / max(image.size)
-                new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
-                image = image.resize(new_size, Image.Resampling.LANCZOS)
-            
-            # Create detailed prompt for structured extraction
-            prompt = """
-            Analyze this marksheet image and extract ALL student information in JSON format.
-            
-            For EACH student in the image, extract:
-            1. Roll Number (ROLL NO.)
-            2. Student Name (STUDENT'S NAME)
-            3. Father's/Husband's Name (FATHER'S/HUSBAND NAME)
-            4. Mother's Name (if available)
-            5. Enrollment Number (if available)
-            6. All subjects with their codes and names
-            7. For each subject, extract marks:
-               - Theory ESE (External Semester Examination)
-               - Theory Internal
-               - Practical marks
-               - Practical Internal
-            8. Aggregate percentage
-            9. Result status (e.g., "PASS FIRST", "PASS SECOND", "FAIL")
-            
-            Return the data as a JSON array with this exact structure:
-            [
-                {
-                    "roll_number": "294343",
-                    "name": "KHEL KUMAR",
-                    "father_name": "SHRI TIJ RAM",
-                    "mother_name": "SMT. INDER BAI",
-                    "enrollment_number": "SHRI21S0370 VID-(SHRI21S0371A)",
-                    "subjects": [
-                        {
-                            "code": "01",
-                            "name": "PC HINDI LANGUAGE",
-                            "theory_ese": 24,
-                            "theory_internal": null,
-                            "practical": null,
-                            "practical_internal": null
-                        },
-                        {
-                            "code": "02",
-                            "name": "PC ENGLISH LANGUAGE",
-                            "theory_ese": 50,
-                            "theory_internal": null,
-                            "practical": null,
-                            "practical_internal": null
-                        }
-                    ],
-                    "percentage": 62.66,
-                    "result": "PASS FIRST"
-                }
-            ]
-            
-            IMPORTANT:
-            - Extract ALL students visible in the image
-            - Use null for marks that are not available or shown as "..."
-            - Be precise with numbers
-            - Include all subjects for each student
-            - Return ONLY valid JSON, no additional text
-            """
+            # Decode at reduced size to bound memory use and API latency
+            max_size = max_size or self.MAX_IMAGE_SIZE
+            image = load_reduced(image_path, max_size)
+            logger.debug("Loaded %s at %sx%s", image_path, image.size[0], image.size[1])
             
-            # Generate response with timeout handling
-            print("Calling Gemini API for text extraction...")
-            response = self.model.generate_content(
-                [prompt, image],
-                request_options={'timeout': 120}  # 2 minute timeout
-            )
-            
-            # Check if response has text
-            if not response or not hasattr(response, 'text'):
-                raise ValueError("Gemini API returned empty response. Please check your API key and quota.")
-            
-            # Parse JSON response
-            response_text = response.text.strip()
-            print(f"Received response from Gemini API (length: {len(response_text)})")
-            
-            # Remove markdown code blocks if present
-            if response_text.startswith('```json'):
-                response_text = response_text[7:]
-            if response_text.startswith('```'):
-                response_text = response_text[3:]
-            if response_text.endswith('```'):
-                response_text = response_text[:-3]
-            
-            response_text = response_text.strip()
-            
-            # Parse JSON
-            students_data = json.loads(response_text)
-            print(f"Successfully extracted data for {len(students_data)} student(s)")
+            students_data = self._generate(PROMPT, image, 'full', max_size)
+            logger.info("Extracted %d student(s) from %s", len(students_data), image_path)
             
             return students_data
             
+        except ImageTooLargeError:
+            raise
         except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {e}")
-            print(f"Response text: {response_text[:500]}")
+            logger.warning("Could not parse the AI response for %s as JSON: %s", image_path, e)
             raise ValueError(f"Failed to parse AI response as JSON: {e}")
         except Exception as e:
-            print(f"AI extraction error: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
+            logger.exception("AI extraction of %s failed", image_path)
             raise Exception(f"Error extracting data with AI: {str(e)}")
     
+    def extract_students(self, image_path, roll_numbers, max_size=None):
+        """
+        Re-extract only the given students from a marksheet image
+        
+        Much cheaper than a full extraction when a few students came back
+        inconsistent: the output only covers those students.
+        
+        Args:
+            image_path: Path to the marksheet image
+            roll_numbers: Roll numbers of the students to read again
+            max_size: Longest side sent to the model (default MAX_IMAGE_SIZE)
+            
+        Returns:
+            List of dictionaries containing student data
+        """
+        max_size = max_size or self.MAX_IMAGE_SIZE
+        image = load_reduced(image_path, max_size)
+        prompt = TARGETED_PROMPT.format(roll_numbers=', '.join(roll_numbers))
+        try:
+            return self._generate(prompt, image, 'targeted', max_size)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Failed to parse AI response as JSON: {e}")
+    
+    def _generate(self, prompt, image, kind, max_size):
+        """
+        Send one image to the model and decode its structured response
+        
+        The response schema keeps the output short (see extraction_schema),
+        which is what generation time mostly depends on. The call's token
+        usage is appended to ``calls`` whether or not the response decodes.
+        
+        Returns:
+            List of student dictionaries
+        """
+        logger.debug("Calling Gemini (%s extraction)", kind)
+        started = time.perf_counter()
+        response = self.model.generate_content(
+            [prompt, image],
+            generation_config={
+                'response_mime_type': 'application/json',
+                'response_schema': RESPONSE_SCHEMA,
+                'temperature': 0,
+            },
+            request_options={'timeout': 120}  # 2 minute timeout
+        )
+        usage = call_usage(response, kind, image, max_size, time.perf_counter() - started)
+        self.calls.append(usage)
+        
+        # Check if response has text
+        if not response or not hasattr(response, 'text'):
+            raise ValueError("Gemini API returned empty response. Please check your API key and quota.")
+        
+        response_text = response.text.strip()
+        logger.info(
+            "Gemini %s extraction: %d characters, %d output tokens in %.1fs",
+            kind, len(response_text), usage['output_tokens'], usage['seconds']
+        )
+        return decode_response(json.loads(response_text))
+    
     def validate_student_data(self, student_data):
         """
         Validate extracted student data
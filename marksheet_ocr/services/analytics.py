@@ -0,0 +1,255 @@
+"""
+Subject analytics maintained incrementally from the marks
+
+SubjectSummary holds the statistics of each (upload, subject) pair and
+SubjectTrend those of each (subject, month). Writing or deleting a mark
+marks its pair as changed (see signals); once the transaction commits, the
+pair's summary is recounted from that upload's marks of the subject alone,
+and the month's trend is re-added from its summaries. Reading analytics
+never touches the marks.
+
+Bulk writers wrap their changes in ``deferred()`` so each pair is recounted
+once at the end rather than once per commit.
+
+Archived uploads (see services.archive) keep their summaries; rebuilding
+counts their marks from the archives.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import Mark, MarksheetUpload, Subject, SubjectSummary, SubjectTrend, UploadArchive
+from .records import unpack_records
+
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+# Rows written per INSERT when rebuilding
+BATCH_SIZE = 1000
+
+MARK_VALUES = ['theory_ese', 'theory_internal', 'practical_marks', 'practical_internal']
+
+
+def _pending():
+    if not hasattr(_local, 'summaries'):
+        _local.summaries = set()
+        _local.trends = set()
+        _local.deferred = 0
+    return _local
+
+
+def summary_changed(upload_id, subject_id):
+    """Recount the summary of a subject on an upload after the transaction commits"""
+    pending = _pending()
+    pending.summaries.add((upload_id, subject_id))
+    if not pending.deferred:
+        transaction.on_commit(flush)
+
+
+def trend_changed(subject_id, period):
+    """Re-add a subject's trend for a month after the transaction commits"""
+    pending = _pending()
+    pending.trends.add((subject_id, period))
+    if not pending.deferred:
+        transaction.on_commit(flush)
+
+
+@contextmanager
+def deferred():
+    """Collect changes until the block ends, then refresh each affected row once"""
+    pending = _pending()
+    pending.deferred += 1
+    try:
+        yield
+    finally:
+        pending.deferred -= 1
+        if not pending.deferred:
+            transaction.on_commit(flush)
+
+
+def flush():
+    """Refresh the summaries and trends changed in this thread"""
+    pending = _pending()
+    summaries, pending.summaries = pending.summaries, set()
+    trends, pending.trends = pending.trends, set()
+    if not summaries and not trends:
+        return
+    try:
+        SubjectAnalytics().refresh(summaries, trends)
+    except Exception:
+        # The marks are committed either way; rebuild_analytics repairs the tables
+        logger.exception("Could not refresh subject analytics")
+
+
+def month_of(moment):
+    """First day of the (local) month of a datetime"""
+    return timezone.localdate(moment).replace(day=1)
+
+
+class SubjectAnalytics:
+    """Maintain and read the subject summary tables"""
+
+    def refresh(self, summaries, trends=()):
+        """
+        Recount (upload, subject) summaries and re-add the trends they feed
+
+        Args:
+            summaries: Iterable of (upload_id, subject_id)
+            trends: Further (subject_id, period) trends to re-add
+        """
+        trends = set(trends)
+        for upload_id, subject_id in summaries:
+            trends |= self.refresh_summary(upload_id, subject_id)
+        for subject_id, period in trends:
+            self.refresh_trend(subject_id, period)
+
+    def refresh_summary(self, upload_id, subject_id):
+        """
+        Recount one upload's marks of one subject
+
+        Returns:
+            Set of the (subject_id, period) trends affected
+        """
+        previous = set(
+            SubjectSummary.objects.filter(upload_id=upload_id, subject_id=subject_id)
+            .values_list('subject_id', 'period')
+        )
+        uploaded_at = MarksheetUpload.objects.filter(pk=upload_id).values_list('uploaded_at', flat=True).first()
+        summary = SubjectSummary(upload_id=upload_id, subject_id=subject_id)
+        if uploaded_at is not None:
+            summary.period = month_of(uploaded_at)
+            marks = Mark.objects.filter(student__upload_id=upload_id, subject_id=subject_id)
+            for values in marks.values_list(*MARK_VALUES):
+                summary.add_mark(Mark(**dict(zip(MARK_VALUES, values))))
+
+        if not summary.students:
+            SubjectSummary.objects.filter(upload_id=upload_id, subject_id=subject_id).delete()
+            return previous
+
+        SubjectSummary.objects.update_or_create(
+            upload_id=upload_id, subject_id=subject_id,
+            defaults={field: getattr(summary, field) for field in self._stat_fields() + ['period']},
+        )
+        return previous | {(subject_id, summary.period)}
+
+    def refresh_trend(self, subject_id, period):
+        """Re-add a subject's trend for a month from its upload summaries"""
+        trend = SubjectTrend(subject_id=subject_id, period=period)
+        for summary in SubjectSummary.objects.filter(subject_id=subject_id, period=period):
+            trend.merge(summary)
+            trend.sheets += 1
+
+        if not trend.students:
+            SubjectTrend.objects.filter(subject_id=subject_id, period=period).delete()
+            return
+        SubjectTrend.objects.update_or_create(
+            subject_id=subject_id, period=period,
+            defaults={field: getattr(trend, field) for field in self._stat_fields() + ['sheets']},
+        )
+
+    def rebuild(self):
+        """
+        Recompute every summary and trend from the marks and archives
+
+        The marks are streamed in (upload, subject) order, so only one pair
+        is counted at a time; archives are read one upload at a time.
+
+        Returns:
+            Tuple of (summaries, trends) written
+        """
+        marks = (
+            Mark.objects.order_by('student__upload_id', 'subject_id')
+            .values_list('student__upload_id', 'subject_id', 'student__upload__uploaded_at', *MARK_VALUES)
+        )
+        summaries = []
+        trends = {}
+        current = None
+
+        def finish(summary):
+            if summary is None or not summary.students:
+                return
+            summaries.append(summary)
+            key = (summary.subject_id, summary.period)
+            trend = trends.setdefault(key, SubjectTrend(subject_id=key[0], period=key[1]))
+            trend.merge(summary)
+            trend.sheets += 1
+
+        with transaction.atomic():
+            # Nothing references these tables; a plain DELETE skips loading
+            # every row to send it to the summary_deleted handler
+            SubjectTrend.objects.all()._raw_delete(SubjectTrend.objects.db)
+            SubjectSummary.objects.all()._raw_delete(SubjectSummary.objects.db)
+            # Everything is recounted below; nothing is left to refresh
+            _pending().trends.clear()
+
+            for upload_id, subject_id, uploaded_at, *values in marks.iterator(chunk_size=5000):
+                if current is None or (current.upload_id, current.subject_id) != (upload_id, subject_id):
+                    finish(current)
+                    if len(summaries) >= BATCH_SIZE:
+                        SubjectSummary.objects.bulk_create(summaries)
+                        summaries = []
+                    current = SubjectSummary(
+                        upload_id=upload_id, subject_id=subject_id, period=month_of(uploaded_at)
+                    )
+                current.add_mark(Mark(**dict(zip(MARK_VALUES, values))))
+            finish(current)
+
+            subject_ids = {(code, name): pk for pk, code, name in Subject.objects.values_list('pk', 'code', 'name')}
+            archives = UploadArchive.objects.values_list('upload_id', 'upload__uploaded_at', 'payload')
+            for upload_id, uploaded_at, payload in archives.iterator(chunk_size=100):
+                counted = {}
+                for record in unpack_records(payload):
+                    for mark in record.marks:
+                        key = (mark.subject_code[:50], mark.subject_name[:200])
+                        if key not in subject_ids:
+                            subject_ids[key] = Subject.objects.get_or_create(code=key[0], name=key[1])[0].pk
+                        subject_id = subject_ids[key]
+                        if subject_id not in counted:
+                            counted[subject_id] = SubjectSummary(
+                                upload_id=upload_id, subject_id=subject_id, period=month_of(uploaded_at)
+                            )
+                        counted[subject_id].add_mark(Mark(**{field: getattr(mark, field) for field in MARK_VALUES}))
+                for summary in counted.values():
+                    finish(summary)
+
+            SubjectSummary.objects.bulk_create(summaries, batch_size=BATCH_SIZE)
+            SubjectTrend.objects.bulk_create(trends.values(), batch_size=BATCH_SIZE)
+
+        return SubjectSummary.objects.count(), len(trends)
+
+    def subjects(self, upload=None):
+        """
+        Statistics of every subject, overall or on one upload
+
+        Args:
+            upload: MarksheetUpload to restrict to (with its pages, for a PDF)
+
+        Returns:
+            List of (Subject, SubjectStats) in subject code order
+        """
+        if upload is None:
+            rows = SubjectTrend.objects.all()
+        elif upload.is_document():
+            rows = SubjectSummary.objects.filter(upload__parent=upload)
+        else:
+            rows = SubjectSummary.objects.filter(upload=upload)
+
+        merged = {}
+        for row in rows.select_related('subject').order_by():
+            if row.subject_id not in merged:
+                merged[row.subject_id] = (row.subject, SubjectTrend())
+            merged[row.subject_id][1].merge(row)
+        return sorted(merged.values(), key=lambda item: (item[0].code, item[0].name))
+
+    def trend(self, subject):
+        """SubjectTrend rows of a subject, oldest month first"""
+        return list(SubjectTrend.objects.filter(subject=subject).order_by('period'))
+
+    @staticmethod
+    def _stat_fields():
+        return ['students', 'passed', 'marks_obtained', 'marks_maximum', 'histogram', 'grades']
@@ -0,0 +1,167 @@
+"""
+Cold storage of old uploads' students and marks
+
+Archiving a completed upload replaces its Student, Mark and search token
+rows with a single UploadArchive row holding the records compressed (see
+records.pack_records), and sets its status to 'archived'. The upload, its
+image and its subject summaries stay, so the history, analytics and exports
+keep working; exports and the students API read the records from the
+archive. Restoring writes the rows back and removes the archive.
+
+A PDF upload is archived and restored with all of its pages; each page
+upload with students gets an archive of its own.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import Mark, MarksheetUpload, UploadArchive
+from ..signals import row_handlers_suspended
+from . import analytics
+from .processing import UploadProcessor
+from .records import ExtractedStudent, pack_records, unpack_records
+
+
+logger = logging.getLogger(__name__)
+
+
+class ArchivedStudents:
+    """
+    Records of an archived upload, read when first iterated
+
+    Lets a view hand an archived upload to the exporters in place of its
+    Student queryset; decompression then happens in the export thread.
+    """
+
+    def __init__(self, upload):
+        self.upload = upload
+
+    def __iter__(self):
+        return iter(UploadArchiver().records(self.upload))
+
+
+class UploadArchiver:
+    """Move uploads' students and marks in and out of UploadArchive"""
+
+    def archivable(self, days):
+        """
+        Completed uploads older than ``days``, PDF pages excluded (they go with their PDF)
+
+        Returns:
+            QuerySet of MarksheetUpload, oldest first
+        """
+        cutoff = timezone.now() - timedelta(days=days)
+        return MarksheetUpload.objects.filter(
+            status='completed', parent__isnull=True, uploaded_at__lt=cutoff
+        ).order_by('uploaded_at', 'id')
+
+    def archive(self, upload):
+        """
+        Archive the students and marks of a completed upload
+
+        Args:
+            upload: Completed MarksheetUpload (not a PDF page)
+
+        Returns:
+            Tuple of (students, marks, compressed bytes) archived
+
+        Raises:
+            ValueError: If the upload is not completed
+        """
+        if upload.status != 'completed':
+            raise ValueError(f"Upload {upload.id} is {upload.status}; only completed uploads are archived")
+
+        totals = [0, 0, 0]
+        with transaction.atomic():
+            for target in self._targets(upload, 'completed'):
+                students = target.students.prefetch_related('marks__subject').order_by('roll_number', 'id')
+                records = [ExtractedStudent.from_model(student) for student in students]
+                payload = pack_records(records)
+                marks = sum(len(record.marks) for record in records)
+                UploadArchive.objects.update_or_create(
+                    upload=target,
+                    defaults={'students': len(records), 'marks': marks, 'payload': payload},
+                )
+                # The subject summaries stay: the archived marks still count
+                with row_handlers_suspended():
+                    target.students.all().delete()
+                self._set_status(target, 'archived')
+                totals[0] += len(records)
+                totals[1] += marks
+                totals[2] += len(payload)
+            if upload.is_document():
+                self._set_status(upload, 'archived')
+
+        logger.info(
+            "Archived upload %s: %d students, %d marks in %d bytes",
+            upload.id, totals[0], totals[1], totals[2]
+        )
+        return tuple(totals)
+
+    def restore(self, upload):
+        """
+        Write the students and marks of an archived upload back and drop its archive
+
+        Args:
+            upload: Archived MarksheetUpload (not a PDF page)
+
+        Returns:
+            Number of students restored
+
+        Raises:
+            ValueError: If the upload is not archived
+        """
+        if upload.status != 'archived':
+            raise ValueError(f"Upload {upload.id} is {upload.status}, not archived")
+
+        processor = UploadProcessor()
+        restored = 0
+        with transaction.atomic(), analytics.deferred():
+            for target in self._targets(upload, 'archived'):
+                archive = UploadArchive.objects.filter(upload=target).first()
+                if archive is not None:
+                    # Summaries are recounted once per subject rather than once per mark
+                    with row_handlers_suspended():
+                        for record in unpack_records(archive.payload):
+                            processor.save_student(target, record)
+                            restored += 1
+                    archive.delete()
+                subject_ids = Mark.objects.filter(student__upload=target).values_list('subject_id', flat=True)
+                for subject_id in set(subject_ids):
+                    analytics.summary_changed(target.id, subject_id)
+                self._set_status(target, 'completed')
+            if upload.is_document():
+                self._set_status(upload, 'completed')
+
+        logger.info("Restored upload %s: %d students", upload.id, restored)
+        return restored
+
+    def records(self, upload):
+        """
+        Archived records of an upload, or of all pages of a PDF upload
+
+        Returns:
+            List of ExtractedStudent in roll number order
+        """
+        if upload.is_document():
+            archives = UploadArchive.objects.filter(upload__parent=upload).order_by('upload__page_number')
+        else:
+            archives = UploadArchive.objects.filter(upload=upload)
+
+        records = []
+        for payload in archives.values_list('payload', flat=True):
+            records.extend(unpack_records(payload))
+        records.sort(key=lambda record: record.roll_number)
+        return records
+
+    def _targets(self, upload, status):
+        """The uploads holding students: the upload itself, or the PDF's pages in ``status``"""
+        if upload.is_document():
+            return list(upload.pages.filter(status=status).order_by('page_number'))
+        return [upload]
+
+    def _set_status(self, upload, status):
+        upload.set_progress(status=status)
+        MarksheetUpload.bump_results_version(upload.id)
@@ -1,9 +1,33 @@
 """
 CSV and Excel export service for marksheet data
+
+pandas and openpyxl are imported inside the methods that use them: they take
+longer to import than the rest of the app together, and most requests never
+export anything.
 """
-import pandas as pd
+import zipfile
 from io import BytesIO
-from openpyxl.utils import get_column_letter
+
+from .records import ExtractedStudent
+
+
+class _ChunkBuffer:
+    """Write-only file object that hands back what was written since the last call"""
+    
+    def __init__(self):
+        self.chunks = []
+    
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
 
 
 class CSVExporter:
@@ -14,148 +38,171 @@ class CSVExporter:
         Export student data to CSV format
         
         Args:
-            students: QuerySet or list of Student objects
+            students: Students (QuerySet or list) or ExtractedStudent records
             
         Returns:
             BytesIO object containing CSV data
         """
-        df = self._prepare_summary_dataframe(students)
-        
-        # Export to CSV
-        output = BytesIO()
-        df.to_csv(output, index=False, encoding='utf-8-sig')  # utf-8-sig for Excel compatibility
-        output.seek(0)
-        
-        return output
+        return self._write_csv(self._prepare_summary_dataframe(students))
     
     def export_students_to_excel(self, students):
         """
         Export student data to Excel format
         
         Args:
-            students: QuerySet or list of Student objects
+            students: Students (QuerySet or list) or ExtractedStudent records
             
         Returns:
             BytesIO object containing Excel data
         """
-        df = self._prepare_summary_dataframe(students)
-        
-        # Export to Excel
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Marksheet Summary')
-            
-            # Auto-adjust column widths
-            worksheet = writer.sheets['Marksheet Summary']
-            for idx, col in enumerate(df.columns):
-                max_length = max(
-                    df[col].astype(str).apply(len).max(),
-                    len(str(col))
-                ) + 2
-                # Use get_column_letter for proper column naming (A, B, ..., Z, AA, AB, ...)
-                column_letter = get_column_letter(idx + 1)
-                worksheet.column_dimensions[column_letter].width = min(max_length, 50)
-        
-        output.seek(0)
-        return output
+        return self._write_excel(self._prepare_summary_dataframe(students), 'Marksheet Summary', 50)
     
     def export_detailed_csv(self, students):
         """
         Export detailed CSV with one row per student per subject
         
         Args:
-            students: QuerySet or list of Student objects
+            students: Students (QuerySet or list) or ExtractedStudent records
             
         Returns:
             BytesIO object containing CSV data
         """
-        df = self._prepare_detailed_dataframe(students)
-        
-        # Export to CSV
-        output = BytesIO()
-        df.to_csv(output, index=False, encoding='utf-8-sig')
-        output.seek(0)
-        
-        return output
+        return self._write_csv(self._prepare_detailed_dataframe(students))
     
     def export_detailed_excel(self, students):
         """
         Export detailed Excel with one row per student per subject
         
         Args:
-            students: QuerySet or list of Student objects
+            students: Students (QuerySet or list) or ExtractedStudent records
             
         Returns:
             BytesIO object containing Excel data
         """
-        df = self._prepare_detailed_dataframe(students)
+        return self._write_excel(self._prepare_detailed_dataframe(students), 'Detailed Marks', 30)
+    
+    def iter_bundle(self, students, upload_id, compresslevel=6):
+        """
+        Stream a ZIP holding the summary and detailed exports in CSV and Excel
+        
+        The students are fetched and both tables built once for all four
+        files. Each file is yielded as soon as it is compressed, so the whole
+        archive is never held in memory. The Excel files are already
+        compressed and are stored as they are.
+        
+        Args:
+            students: Students (prefetch marks__subject) or ExtractedStudent records
+            upload_id: Used in the file names, as in the single downloads
+            compresslevel: Deflate level (0-9) for the CSV files
+            
+        Yields:
+            Chunks of the ZIP file
+        """
+        students = self._records(students)
+        summary = self._prepare_summary_dataframe(students)
+        detailed = self._prepare_detailed_dataframe(students)
+        members = [
+            (f'marksheet_summary_{upload_id}.csv', lambda: self._write_csv(summary), zipfile.ZIP_DEFLATED),
+            (f'marksheet_detailed_{upload_id}.csv', lambda: self._write_csv(detailed), zipfile.ZIP_DEFLATED),
+            (f'marksheet_summary_{upload_id}.xlsx',
+             lambda: self._write_excel(summary, 'Marksheet Summary', 50), zipfile.ZIP_STORED),
+            (f'marksheet_detailed_{upload_id}.xlsx',
+             lambda: self._write_excel(detailed, 'Detailed Marks', 30), zipfile.ZIP_STORED),
+        ]
+        
+        buffer = _ChunkBuffer()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for name, write, compression in members:
+                archive.writestr(name, write().getvalue(), compress_type=compression, compresslevel=compresslevel)
+                yield buffer.take()
+        yield buffer.take()
+    
+    def _write_csv(self, df):
+        output = BytesIO()
+        df.to_csv(output, index=False, encoding='utf-8-sig')  # utf-8-sig for Excel compatibility
+        output.seek(0)
+        return output
+    
+    def _write_excel(self, df, sheet_name, max_width):
+        import pandas as pd
+        from openpyxl.utils import get_column_letter
         
-        # Export to Excel
         output = BytesIO()
         with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Detailed Marks')
+            df.to_excel(writer, index=False, sheet_name=sheet_name)
             
             # Auto-adjust column widths
-            worksheet = writer.sheets['Detailed Marks']
+            worksheet = writer.sheets[sheet_name]
             for idx, col in enumerate(df.columns):
-                max_length = max(
-                    df[col].astype(str).apply(len).max(),
-                    len(str(col))
-                ) + 2
+                # Blank cells are NaN, which pandas 3 keeps as NaN through astype(str)
+                lengths = df[col].fillna('').map(lambda value: len(str(value)))
+                max_length = max([len(str(col)), *lengths]) + 2
                 # Use get_column_letter for proper column naming (A, B, ..., Z, AA, AB, ...)
                 column_letter = get_column_letter(idx + 1)
-                worksheet.column_dimensions[column_letter].width = min(max_length, 30)
+                worksheet.column_dimensions[column_letter].width = min(max_length, max_width)
         
         output.seek(0)
         return output
     
+    @staticmethod
+    def _records(students):
+        """
+        ExtractedStudent records of Students (or records, passed through)
+        
+        The exports below read only records, so they work the same on saved
+        students and on a stored extraction result.
+        """
+        return [
+            student if isinstance(student, ExtractedStudent) else ExtractedStudent.from_model(student)
+            for student in students
+        ]
+    
     def _prepare_summary_dataframe(self, students):
         """Prepare summary DataFrame with one row per student - CLEAN FORMAT"""
+        import pandas as pd
+        
         rows = []
         
-        for student in students:
+        for student in self._records(students):
             # Start with basic student info
             row = {
                 'Roll Number': student.roll_number,
                 'Student Name': student.name,
-                'Father Name': student.father_name if student.father_name else '',
+                'Father Name': student.father_name,
             }
             
             # Add enrollment number if available
             if student.enrollment_number:
                 row['Enrollment Number'] = student.enrollment_number
             
-            # Get all marks for this student
-            marks = student.marks.all().select_related('subject').order_by('subject__code')
-            
             # Group marks by subject for cleaner display
-            for mark in marks:
-                subject_code = mark.subject.code
-                subject_name = mark.subject.name
+            for mark in student.sorted_marks():
+                subject_code = mark.subject_code
                 
                 # Add subject name as context (only once per subject)
-                row[f'{subject_code} - Subject'] = subject_name
+                row[f'{subject_code} - Subject'] = mark.subject_name
                 
                 # Add marks in a clean format
                 # Theory section
-                if mark.theory_ese is not None or mark.theory_internal is not None:
-                    row[f'{subject_code} - Theory ESE'] = mark.theory_ese if mark.theory_ese is not None else 0
-                    row[f'{subject_code} - Theory Internal'] = mark.theory_internal if mark.theory_internal is not None else 0
-                    row[f'{subject_code} - Theory Total'] = mark.get_theory_total()
+                if mark.has_theory():
+                    row[f'{subject_code} - Theory ESE'] = mark.theory_ese or 0
+                    row[f'{subject_code} - Theory Internal'] = mark.theory_internal or 0
+                    row[f'{subject_code} - Theory Total'] = mark.theory_total()
                 
                 # Practical section
-                if mark.practical_marks is not None or mark.practical_internal is not None:
-                    row[f'{subject_code} - Practical'] = mark.practical_marks if mark.practical_marks is not None else 0
-                    row[f'{subject_code} - Practical Int'] = mark.practical_internal if mark.practical_internal is not None else 0
-                    row[f'{subject_code} - Practical Total'] = mark.get_practical_total()
+                if mark.has_practical():
+                    row[f'{subject_code} - Practical'] = mark.practical_marks or 0
+                    row[f'{subject_code} - Practical Int'] = mark.practical_internal or 0
+                    row[f'{subject_code} - Practical Total'] = mark.practical_total()
                 
                 # Subject total
-                row[f'{subject_code} - Total Marks'] = mark.get_total_marks()
+                row[f'{subject_code} - Total Marks'] = mark.total()
             
             # Add grand totals at the end
-            row['Grand Total'] = student.get_total_marks()
-            row['Percentage'] = f"{student.get_percentage():.2f}%"
-            row['Result'] = student.get_result_status()
+            summary = student.summary()
+            row['Grand Total'] = summary['total']
+            row['Percentage'] = f"{summary['percentage']:.2f}%"
+            row['Result'] = summary['result']
             
             rows.append(row)
         
@@ -163,44 +210,46 @@ class CSVExporter:
     
     def _prepare_detailed_dataframe(self, students):
         """Prepare detailed DataFrame with one row per student per subject - CLEAN FORMAT"""
+        import pandas as pd
+        
+        students = self._records(students)
         rows = []
         
         for student in students:
-            marks = student.marks.all().select_related('subject').order_by('subject__code')
-            
-            for mark in marks:
+            for mark in student.sorted_marks():
                 row = {
                     'Roll Number': student.roll_number,
                     'Student Name': student.name,
-                    'Father Name': student.father_name if student.father_name else '',
-                    'Subject Code': mark.subject.code,
-                    'Subject Name': mark.subject.name,
+                    'Father Name': student.father_name,
+                    'Subject Code': mark.subject_code,
+                    'Subject Name': mark.subject_name,
                 }
                 
                 # Only add theory marks if they exist
-                if mark.theory_ese is not None or mark.theory_internal is not None:
-                    row['Theory ESE'] = mark.theory_ese if mark.theory_ese is not None else 0
-                    row['Theory Internal'] = mark.theory_internal if mark.theory_internal is not None else 0
-                    row['Theory Total'] = mark.get_theory_total()
+                if mark.has_theory():
+                    row['Theory ESE'] = mark.theory_ese or 0
+                    row['Theory Internal'] = mark.theory_internal or 0
+                    row['Theory Total'] = mark.theory_total()
                 
                 # Only add practical marks if they exist
-                if mark.practical_marks is not None or mark.practical_internal is not None:
-                    row['Practical'] = mark.practical_marks if mark.practical_marks is not None else 0
-                    row['Practical Internal'] = mark.practical_internal if mark.practical_internal is not None else 0
-                    row['Practical Total'] = mark.get_practical_total()
+                if mark.has_practical():
+                    row['Practical'] = mark.practical_marks or 0
+                    row['Practical Internal'] = mark.practical_internal or 0
+                    row['Practical Total'] = mark.practical_total()
                 
                 # Subject total and status
-                row['Subject Total'] = mark.get_total_marks()
+                row['Subject Total'] = mark.total()
                 row['Status'] = 'FAIL' if mark.is_failed() else 'PASS'
                 
                 rows.append(row)
         
         # Add summary row for each student
         for student in students:
+            summary = student.summary()
             summary_row = {
                 'Roll Number': student.roll_number,
                 'Student Name': student.name,
-                'Father Name': student.father_name if student.father_name else '',
+                'Father Name': student.father_name,
                 'Subject Code': '----',
                 'Subject Name': 'GRAND TOTAL',
                 'Theory ESE': '',
@@ -209,8 +258,8 @@ class CSVExporter:
                 'Practical': '',
                 'Practical Internal': '',
                 'Practical Total': '',
-                'Subject Total': student.get_total_marks(),
-                'Status': student.get_result_status()
+                'Subject Total': summary['total'],
+                'Status': summary['result']
             }
             rows.append(summary_row)
         
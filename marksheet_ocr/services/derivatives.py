@@ -0,0 +1,139 @@
+"""
+Derived images of an upload: the normalized extraction input and thumbnails
+"""
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import tempfile
+
+from ..models import MarksheetUpload
+from ..storage import ContentAddressedStorage, marksheet_storage
+from .imaging import load_reduced
+
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVES_DIR = 'marksheets/derivatives'
+
+
+class DerivativeSpec:
+    """
+    How to derive an image from an original
+
+    Args:
+        name: Short name used in file names, e.g. 'thumbnail'
+        max_size: Longest side in pixels (smaller images are not upscaled)
+        format: PIL format to encode with
+        quality: Encoder quality for lossy formats
+    """
+
+    def __init__(self, name, max_size, format, quality=None):
+        self.name = name
+        self.max_size = max_size
+        self.format = format
+        self.quality = quality
+
+    @property
+    def extension(self):
+        return '.' + self.format.lower()
+
+    @property
+    def key(self):
+        """Short digest of the parameters, so changing them regenerates the file"""
+        params = json.dumps([self.max_size, self.format, self.quality])
+        return hashlib.sha1(params.encode()).hexdigest()[:8]
+
+
+THUMBNAIL = DerivativeSpec('thumbnail', 320, 'WEBP', quality=70)
+
+
+def extraction_input(max_size):
+    """
+    Input sent to the AI model at one rung of the resolution ladder
+
+    Lossless, so re-extraction at the same size sees the same pixels.
+    """
+    return DerivativeSpec('extraction', max_size, 'PNG')
+
+
+class DerivativeStore:
+    """
+    Generate derived images once and reuse them
+
+    Derivatives are stored under marksheets/derivatives/ and named after the
+    content hash of the original plus the spec's parameters, so uploads of
+    the same scan share them and they outlive compression or eviction of the
+    original. Missing derivatives are generated on first access.
+    """
+
+    def __init__(self, storage=None):
+        self.storage = storage or marksheet_storage
+
+    def source_hash(self, upload):
+        """Content hash of the original, computed and saved for older uploads"""
+        if not upload.content_hash:
+            with upload.image.open('rb') as f:
+                upload.content_hash = ContentAddressedStorage.hash_content(f)
+            MarksheetUpload.objects.filter(pk=upload.pk).update(content_hash=upload.content_hash)
+        return upload.content_hash
+
+    def name_for(self, upload, spec):
+        digest = self.source_hash(upload)
+        return posixpath.join(
+            DERIVATIVES_DIR, digest[:2], f'{digest}-{spec.name}-{spec.key}{spec.extension}'
+        )
+
+    def get(self, upload, spec):
+        """
+        Storage name of a derivative, generating it if needed
+
+        Raises:
+            FileNotFoundError: If the derivative is missing and the original
+                has been evicted
+        """
+        name = self.name_for(upload, spec)
+        if not self.storage.exists(name):
+            if not upload.image:
+                raise FileNotFoundError(f"Original image of upload {upload.id} is no longer stored")
+            self._generate(upload, spec, name)
+        return name
+
+    def path(self, upload, spec):
+        """Local filesystem path of a derivative, generating it if needed"""
+        return self.storage.path(self.get(upload, spec))
+
+    def ensure_all(self, upload, extraction_size):
+        """
+        Generate derivatives at ingest; only the extraction input is required
+
+        Args:
+            upload: MarksheetUpload with its original image
+            extraction_size: Size of the first extraction attempt
+        """
+        self.get(upload, extraction_input(extraction_size))
+        try:
+            self.get(upload, THUMBNAIL)
+        except Exception:
+            logger.exception("Could not create thumbnail for upload %s", upload.id)
+
+    def _generate(self, upload, spec, name):
+        with upload.image.open('rb') as f:
+            image = load_reduced(f, spec.max_size)
+
+        options = {'quality': spec.quality} if spec.quality else {}
+        path = self.storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write then rename, so concurrent workers never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                image.save(out, format=spec.format, **options)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        logger.info("Created %s derivative of upload %s (%s)", spec.name, upload.id, image.size)
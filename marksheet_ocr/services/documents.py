@@ -0,0 +1,206 @@
+"""
+Multi-page PDF and TIFF ingestion
+
+A PDF or multi-page TIFF upload becomes a parent MarksheetUpload with one
+child upload per page. Pages are rasterized lazily, when their own extraction
+job starts, one page at a time and straight to the size extraction uses, so
+a 200-page result gazette never has more than a page per worker in memory,
+and every page is read at the full extraction resolution.
+
+PDF support needs pypdfium2 (``pip install pypdfium2``); it is imported on
+first use, and PDFs are rejected at upload time if it is missing. TIFFs are
+read with Pillow, one frame at a time.
+"""
+import hashlib
+import io
+import logging
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import models
+
+from ..models import MarksheetUpload
+from ..upload_handlers import SNIFF_BYTES, sniff_image_type
+from .imaging import count_frames, load_reduced
+
+
+logger = logging.getLogger(__name__)
+
+# PDF points per inch
+POINTS_PER_INCH = 72
+
+# pdfium is not thread-safe; background workers take turns with it
+_pdfium_lock = threading.Lock()
+
+
+def _pdfium():
+    try:
+        import pypdfium2
+    except ImportError:
+        raise ValueError('PDF uploads are not supported on this server (pypdfium2 is not installed).')
+    return pypdfium2
+
+
+def _is_tiff(source):
+    """Whether a readable binary file object holds a TIFF (else it is taken for a PDF)"""
+    source.seek(0)
+    header = source.read(SNIFF_BYTES)
+    source.seek(0)
+    return sniff_image_type(header) == 'tiff'
+
+
+def count_pages(source):
+    """
+    Number of pages of a PDF or frames of a TIFF
+
+    Args:
+        source: Readable binary file object
+
+    Raises:
+        ValueError: If the file cannot be read or PDF support is missing
+    """
+    if _is_tiff(source):
+        try:
+            return count_frames(source)
+        except OSError as e:
+            raise ValueError(f'Could not read TIFF: {e}')
+
+    pdfium = _pdfium()
+    with _pdfium_lock:
+        try:
+            document = pdfium.PdfDocument(source)
+        except pdfium.PdfiumError as e:
+            raise ValueError(f'Could not read PDF: {e}')
+        try:
+            return len(document)
+        finally:
+            document.close()
+
+
+def render_page(source, index, max_size, dpi=None):
+    """
+    Rasterize one page of a PDF or TIFF without loading the others
+
+    PDF pages are rendered at ``dpi`` (MARKSHEET_PDF_DPI by default), scaled
+    down further if that would make the longest side larger than
+    ``max_size``; TIFF frames are decoded within ``max_size``.
+
+    Args:
+        source: Readable binary file object
+        index: Zero-based page index
+        max_size: Longest side of the result in pixels
+        dpi: Render resolution of PDF pages
+
+    Returns:
+        PIL Image of the page (grayscale for PDFs)
+
+    Raises:
+        ValueError: If the page cannot be rendered or PDF support is missing
+    """
+    if _is_tiff(source):
+        try:
+            return load_reduced(source, max_size, frame=index)
+        except OSError as e:
+            raise ValueError(f'Could not render page {index + 1}: {e}')
+
+    pdfium = _pdfium()
+    dpi = dpi or getattr(settings, 'MARKSHEET_PDF_DPI', 200)
+    with _pdfium_lock:
+        try:
+            document = pdfium.PdfDocument(source)
+        except pdfium.PdfiumError as e:
+            raise ValueError(f'Could not read PDF: {e}')
+        try:
+            page = document[index]
+            try:
+                width, height = page.get_size()
+                scale = min(dpi / POINTS_PER_INCH, max_size / max(width, height, 1))
+                bitmap = page.render(scale=scale, grayscale=True)
+                try:
+                    return bitmap.to_pil().copy()
+                finally:
+                    bitmap.close()
+            finally:
+                page.close()
+        except pdfium.PdfiumError as e:
+            raise ValueError(f'Could not render page {index + 1}: {e}')
+        finally:
+            document.close()
+
+
+class DocumentSplitter:
+    """Turn a PDF or multi-page TIFF upload into page uploads and rasterize them on demand"""
+
+    def split(self, document):
+        """
+        Create the missing page uploads of a document upload
+
+        Idempotent: pages that already exist are left alone, so a document
+        whose splitting was interrupted can simply be split again.
+
+        Args:
+            document: MarksheetUpload with page_count set
+
+        Returns:
+            List of the document's page uploads, in page order
+        """
+        existing = set(document.pages.values_list('page_number', flat=True))
+        MarksheetUpload.objects.bulk_create([
+            MarksheetUpload(parent=document, page_number=number, submission=document.submission)
+            for number in range(1, document.page_count + 1)
+            if number not in existing
+        ])
+        return list(document.pages.order_by('page_number'))
+
+    def rasterize(self, page, max_size):
+        """
+        Render a page upload's page from its parent document and store it as its image
+
+        Args:
+            page: Page MarksheetUpload without an image yet
+            max_size: Longest side of the rendered page in pixels
+        """
+        document = page.parent
+        with document.image.open('rb') as source:
+            image = render_page(source, page.page_number - 1, max_size)
+
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG', optimize=True)
+        data = buffer.getvalue()
+        page.content_hash = hashlib.sha256(data).hexdigest()
+        page.image.save(f'page-{page.page_number}.png', ContentFile(data), save=False)
+        page.save(update_fields=['image', 'content_hash'])
+        logger.info(
+            "Rasterized page %s of upload %s as %s (%d bytes)",
+            page.page_number, document.id, image.size, len(data)
+        )
+
+    def refresh_progress(self, document_id):
+        """
+        Recount the finished pages of a document and finish it with the last one
+
+        The document completes once every page has finished, and fails only
+        if no page could be extracted.
+        """
+        counts = MarksheetUpload.objects.filter(parent_id=document_id).aggregate(
+            finished=models.Count('id', filter=models.Q(status__in=['completed', 'failed'])),
+            failed=models.Count('id', filter=models.Q(status='failed')),
+        )
+        document = MarksheetUpload.objects.get(pk=document_id)
+        document.pages_finished = counts['finished']
+        document.save(update_fields=['pages_finished', 'updated_at'])
+        MarksheetUpload.bump_results_version(document_id)
+
+        if counts['finished'] < document.page_count:
+            document.set_progress(stage='extracting', status='processing')
+        elif counts['failed'] == document.page_count:
+            document.error_message = 'No page of the document could be extracted.'
+            document.save(update_fields=['error_message'])
+            document.set_progress(stage='done', status='failed')
+        else:
+            document.error_message = (
+                f"{counts['failed']} of {document.page_count} page(s) failed." if counts['failed'] else None
+            )
+            document.save(update_fields=['error_message'])
+            document.set_progress(stage='done', status='completed')
@@ -0,0 +1,116 @@
+"""
+Compact output contract between AIExtractor and Gemini
+
+The model fills RESPONSE_SCHEMA in structured-output mode instead of free
+JSON: keys are one letter, subject names are listed once per sheet and
+referenced by index, and marks are positional rows. decode_response expands
+it back into the dictionaries the rest of the app uses:
+
+    {"roll_number", "name", "father_name", "mother_name", "enrollment_number",
+     "subjects": [{"code", "name", "theory_ese", "theory_internal",
+                   "practical", "practical_internal"}],
+     "percentage", "result"}
+"""
+
+# Order of the marks in each row of a student's "k" list, after the subject index
+MARK_COLUMNS = ['theory_ese', 'theory_internal', 'practical', 'practical_internal']
+
+RESPONSE_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'subjects': {
+            'type': 'array',
+            'description': 'Every subject on the sheet, listed once, as [code, name]',
+            'items': {'type': 'array', 'items': {'type': 'string'}},
+        },
+        'students': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'r': {'type': 'string', 'description': 'Roll number'},
+                    'n': {'type': 'string', 'description': "Student's name"},
+                    'f': {'type': 'string', 'nullable': True, 'description': "Father's/husband's name"},
+                    'm': {'type': 'string', 'nullable': True, 'description': "Mother's name"},
+                    'e': {'type': 'string', 'nullable': True, 'description': 'Enrollment number'},
+                    'k': {
+                        'type': 'array',
+                        'description': (
+                            'One row per subject: [subject index, theory ESE, theory internal, '
+                            'practical, practical internal], null where a mark is not shown'
+                        ),
+                        'items': {'type': 'array', 'items': {'type': 'integer', 'nullable': True}},
+                    },
+                    'p': {'type': 'number', 'nullable': True, 'description': 'Aggregate percentage'},
+                    's': {'type': 'string', 'nullable': True, 'description': 'Result, e.g. PASS FIRST'},
+                },
+                'required': ['r', 'n', 'k'],
+            },
+        },
+    },
+    'required': ['subjects', 'students'],
+}
+
+PROMPT = """
+Extract every student on this marksheet.
+
+List each subject once in "subjects" as [code, name], e.g. ["01", "PC HINDI LANGUAGE"].
+For each student give roll number (r), name (n), father's/husband's name (f),
+mother's name (m), enrollment number (e), aggregate percentage (p) and result (s).
+In "k" give one row per subject the student took:
+[index into "subjects", theory ESE, theory internal, practical, practical internal].
+Use null for marks that are not shown or printed as "...". Copy numbers exactly.
+"""
+
+# Re-reads a few students whose first extraction was inconsistent
+TARGETED_PROMPT = PROMPT + """
+Only extract the students with these roll numbers: {roll_numbers}.
+Re-read their marks carefully; the printed percentage and result must match the marks.
+"""
+
+
+def decode_response(payload):
+    """
+    Expand a compact response into the list of student dictionaries
+
+    Lists are passed through unchanged, so responses in the older verbose
+    format (a JSON array of students) still decode.
+
+    Raises:
+        ValueError: If the payload does not follow the contract
+    """
+    if isinstance(payload, list):
+        return payload
+    if not isinstance(payload, dict) or not isinstance(payload.get('students'), list):
+        raise ValueError('AI response is missing the "students" list.')
+
+    subjects = []
+    for entry in payload.get('subjects') or []:
+        entry = list(entry or []) + ['', '']
+        subjects.append((str(entry[0] or ''), str(entry[1] or '')))
+
+    students = []
+    for student in payload['students']:
+        decoded_subjects = []
+        for row in student.get('k') or []:
+            if not row or not isinstance(row[0], int) or not 0 <= row[0] < len(subjects):
+                # Reference to a subject that was never listed; unusable
+                continue
+            code, name = subjects[row[0]]
+            marks = list(row[1:]) + [None] * len(MARK_COLUMNS)
+            decoded = {'code': code, 'name': name}
+            decoded.update(zip(MARK_COLUMNS, marks))
+            decoded_subjects.append(decoded)
+
+        students.append({
+            'roll_number': str(student.get('r') or ''),
+            'name': student.get('n') or '',
+            'father_name': student.get('f') or '',
+            'mother_name': student.get('m') or '',
+            'enrollment_number': student.get('e') or '',
+            'subjects': decoded_subjects,
+            'percentage': student.get('p'),
+            'result': student.get('s'),
+        })
+
+    return students
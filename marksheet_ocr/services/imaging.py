@@ -0,0 +1,130 @@
+"""
+Memory-bounded decoding of marksheet images
+
+A scan is only ever needed at a fraction of its resolution (the extractor
+works at 1024px), but Image.open() followed by convert() and resize()
+decodes the full bitmap first: ~140MB for a 6000x8000 RGB scan. The helpers
+here decode directly at reduced size where the format allows it (JPEG
+draft mode scales by 1/2, 1/4 or 1/8 inside the decoder), read multi-page
+TIFFs one frame at a time, and refuse images whose decoded size would
+exceed a pixel budget.
+"""
+import logging
+import warnings
+
+from django.conf import settings
+from PIL import Image
+
+
+logger = logging.getLogger(__name__)
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when decoding an image would exceed the configured pixel budget"""
+
+
+def _limits():
+    return (
+        getattr(settings, 'MARKSHEET_MAX_IMAGE_PIXELS', 100_000_000),
+        getattr(settings, 'MARKSHEET_DECODE_PIXEL_BUDGET', 50_000_000),
+    )
+
+
+def _open(source):
+    max_pixels, _ = _limits()
+    try:
+        with warnings.catch_warnings():
+            # Pillow only warns between MAX_IMAGE_PIXELS and twice that; our
+            # own limits below decide what is acceptable
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            image = Image.open(source)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(f"Image rejected as a possible decompression bomb: {e}")
+
+    width, height = image.size
+    if width * height > max_pixels:
+        # Releases the file if Pillow opened it; a caller's file object stays open
+        with image:
+            pass
+        raise ImageTooLargeError(
+            f"Image is {width}x{height} ({width * height:,} pixels); the limit is {max_pixels:,} pixels."
+        )
+    return image
+
+
+def _decode_frame(image, max_size):
+    """Decode the current frame at no more than max_size on its longest side"""
+    _, budget = _limits()
+    width, height = image.size
+    scale = min(1.0, max_size / max(width, height))
+
+    if image.format == 'JPEG' and scale < 1:
+        # Let the decoder skip detail: picks the largest 1/n scale that still
+        # covers the requested size
+        mode = 'L' if image.mode == 'L' else 'RGB'
+        image.draft(mode, (max(1, int(width * scale)), max(1, int(height * scale))))
+
+    decoded_width, decoded_height = image.size
+    if decoded_width * decoded_height > budget:
+        raise ImageTooLargeError(
+            f"Decoding {decoded_width}x{decoded_height} pixels would exceed the budget of "
+            f"{budget:,} pixels. Rescan at a lower resolution or save as JPEG."
+        )
+
+    image.load()
+    frame = image
+    if max(frame.size) > max_size:
+        ratio = max_size / max(frame.size)
+        size = (max(1, round(frame.width * ratio)), max(1, round(frame.height * ratio)))
+        # reducing_gap does a cheap integer reduce before the LANCZOS pass
+        frame = frame.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    if frame.mode == '1':
+        # Bilevel fax-style scans
+        frame = frame.convert('L')
+    elif frame.mode not in ('RGB', 'L'):
+        frame = frame.convert('RGB')
+    if frame is image:
+        # Detach from the file, which is closed once the frame is decoded
+        frame = image.copy()
+
+    logger.debug("Decoded %sx%s frame as %s", width, height, frame.size)
+    return frame
+
+
+def count_frames(source):
+    """
+    Number of frames (pages) of an image, read from its headers
+
+    Raises:
+        ImageTooLargeError: If the image exceeds MARKSHEET_MAX_IMAGE_PIXELS
+    """
+    # Leaving the block closes the file only if Pillow opened it from a path
+    with _open(source) as image:
+        return getattr(image, 'n_frames', 1)
+
+
+def load_reduced(source, max_size, frame=0):
+    """
+    Open one frame of an image at no more than max_size pixels on its longest side
+
+    Multi-page TIFFs are split into one upload per page (see
+    services.documents), so each page gets the whole of max_size.
+
+    Args:
+        source: Path or binary file object
+        max_size: Longest side of the result in pixels
+        frame: Zero-based frame (page) of a multi-page image
+
+    Returns:
+        PIL Image in RGB or L mode
+
+    Raises:
+        ImageTooLargeError: If the image exceeds MARKSHEET_MAX_IMAGE_PIXELS or
+            decoding it would exceed MARKSHEET_DECODE_PIXEL_BUDGET
+        ValueError: If the image has no such frame
+    """
+    with _open(source) as image:
+        if not 0 <= frame < getattr(image, 'n_frames', 1):
+            raise ValueError(f"The image has no page {frame + 1}")
+        image.seek(frame)
+        return _decode_frame(image, max_size)
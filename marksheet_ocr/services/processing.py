@@ -0,0 +1,433 @@
+"""
+Marksheet processing pipeline: AI extraction and persistence of results
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from PIL import Image
+
+from ..models import MarksheetUpload, Student, Subject, Mark
+from ..signals import row_handlers_suspended
+from . import analytics
+from .ai_extractor import AIExtractor
+from .derivatives import DerivativeStore, extraction_input
+from .documents import DocumentSplitter
+from .imaging import ImageTooLargeError
+from .quality import find_problems, student_problems
+from .records import coerce_student, dump_records
+from .usage import usage_totals
+
+
+logger = logging.getLogger(__name__)
+
+
+class UploadProcessor:
+    """Extract students from an uploaded marksheet and save them to the database"""
+
+    def process(self, upload, replace_students=False):
+        """
+        Run extraction for a single upload, recording progress as it goes
+
+        Args:
+            upload: MarksheetUpload instance with a saved image
+            replace_students: Swap out the upload's existing students in a
+                single transaction once extraction has succeeded, so readers
+                see either the old or the new set, never a mix. Used when
+                reprocessing.
+
+        Returns:
+            Boolean indicating if processing completed successfully. For a
+            PDF upload, whether its pages were queued.
+        """
+        if upload.is_document():
+            return self.process_document(upload, replace_students)
+
+        upload.set_progress(stage='preparing', status='processing', students_total=0, students_saved=0)
+
+        extractor = None
+        try:
+            extractor = AIExtractor()
+            resolutions = get_extraction_resolutions()
+            if upload.parent_id and not upload.image:
+                # A document page is only rendered once its own job runs
+                DocumentSplitter().rasterize(upload, resolutions[-1])
+            # Decoded and resized once; retries reuse the stored derivatives
+            DerivativeStore().ensure_all(upload, resolutions[0])
+
+            upload.set_progress(stage='extracting')
+            students_data, resolution = self.extract_adaptive(upload, extractor, resolutions)
+            students_data = self.correct_inconsistent(upload, extractor, students_data, resolution, resolutions)
+            # Drop students that still do not pass validation before counting them
+            records = self.coerce(upload, students_data)
+            upload.extraction_resolution = resolution
+            upload.extraction_result = dump_records(records)
+            upload.save(update_fields=['extraction_resolution', 'extraction_result'])
+            upload.set_progress(stage='saving', students_total=len(records))
+
+            # Subject analytics are recounted once, after the last student
+            with analytics.deferred():
+                if replace_students:
+                    # The swap is invalidated once below rather than per student and mark
+                    with transaction.atomic(), row_handlers_suspended():
+                        subject_ids = self.subject_ids(upload)
+                        upload.students.all().delete()
+                        for record in records:
+                            self.save_student(upload, record)
+                        for subject_id in subject_ids | self.subject_ids(upload):
+                            analytics.summary_changed(upload.id, subject_id)
+                        MarksheetUpload.bump_results_version(upload.id)
+                    upload.set_progress(students_saved=len(records))
+                else:
+                    for saved, record in enumerate(records, start=1):
+                        # Each student commits on its own so pollers see the count move
+                        with transaction.atomic():
+                            self.save_student(upload, record)
+                        upload.set_progress(students_saved=saved)
+
+            upload.error_message = None
+            upload.save(update_fields=['error_message'])
+            upload.set_progress(stage='done', status='completed')
+            return True
+
+        except Exception as e:
+            logger.exception("Processing failed for upload %s", upload.id)
+            upload.error_message = str(e)
+            upload.save(update_fields=['error_message'])
+            upload.set_progress(stage='done', status='failed')
+            return False
+
+        finally:
+            if extractor is not None and extractor.calls:
+                try:
+                    self.record_usage(upload, extractor)
+                except Exception:
+                    # Accounting must not change the outcome of the extraction
+                    logger.exception("Could not record token usage of upload %s", upload.id)
+            if upload.parent_id:
+                DocumentSplitter().refresh_progress(upload.parent_id)
+
+    def process_document(self, document, replace_students=False):
+        """
+        Split a document upload into page uploads and queue those not yet completed
+
+        Each page is extracted as its own job on the background pool; the
+        document is completed by the last page to finish.
+
+        Args:
+            document: MarksheetUpload of a PDF or multi-page TIFF
+            replace_students: Also queue pages that already completed
+
+        Returns:
+            Boolean indicating if the pages were queued
+        """
+        document.set_progress(stage='preparing', status='processing')
+        try:
+            pages = DocumentSplitter().split(document)
+        except Exception as e:
+            logger.exception("Splitting failed for upload %s", document.id)
+            document.error_message = str(e)
+            document.save(update_fields=['error_message'])
+            document.set_progress(stage='done', status='failed')
+            return False
+
+        queued = [page for page in pages if replace_students or page.status != 'completed']
+        for page in queued:
+            MarksheetUpload.objects.filter(pk=page.pk).update(status='pending', stage='queued')
+        document.set_progress(stage='extracting')
+        for page in queued:
+            _get_executor().submit(_process_in_background, page.id, replace_students)
+
+        logger.info("Queued %d of %d page(s) of upload %s", len(queued), len(pages), document.id)
+        if not queued:
+            DocumentSplitter().refresh_progress(document.id)
+        return True
+
+    def extract_adaptive(self, upload, extractor, resolutions):
+        """
+        Extract at the lowest resolution whose output passes the quality checks
+
+        Starts at the first resolution and moves up the ladder while the
+        result has structural problems (see quality.find_problems). Rungs
+        larger than the original image are skipped, as they would send the
+        same pixels again.
+
+        Args:
+            upload: MarksheetUpload being processed
+            extractor: AIExtractor instance
+            resolutions: Ascending list of longest-side sizes in pixels
+
+        Returns:
+            Tuple of (students data, resolution it was extracted at). If no
+            resolution passes, the attempt with the fewest problems is kept.
+
+        Raises:
+            Exception: The error of the last attempt if every attempt failed
+        """
+        derivatives = DerivativeStore()
+        best = None
+        last_error = None
+
+        for resolution in resolutions:
+            image_path = derivatives.path(upload, extraction_input(resolution))
+            full_size = self.at_original_size(image_path, resolution)
+
+            try:
+                students_data = extractor.extract_marksheet_data(image_path, max_size=resolution)
+            except ImageTooLargeError:
+                raise
+            except Exception as e:
+                logger.warning("Extraction of upload %s at %spx failed: %s", upload.id, resolution, e)
+                last_error = e
+                if full_size:
+                    break
+                continue
+
+            problems = find_problems(students_data, extractor.validate_student_data)
+            if not problems:
+                return students_data, resolution
+
+            logger.info(
+                "Extraction of upload %s at %spx has %d problem(s), e.g. %s",
+                upload.id, resolution, len(problems), problems[0]
+            )
+            if best is None or len(problems) <= best[2]:
+                best = (students_data, resolution, len(problems))
+            if full_size:
+                # Already sent at the original's own size; larger rungs add nothing
+                break
+
+        if best is None:
+            raise last_error or ValueError("No extraction attempt was made.")
+        return best[0], best[1]
+
+    def correct_inconsistent(self, upload, extractor, students_data, resolution, resolutions):
+        """
+        Re-read only the students whose data is inconsistent and merge the fixes
+
+        A student is flagged when quality.student_problems finds anything,
+        e.g. a printed percentage the extracted marks do not reproduce.
+        Flagged students are requested again by roll number at the next
+        resolution up, and a correction replaces the original only if it has
+        fewer problems. Nothing is re-read when there is no larger rung or
+        the image was already sent at its original size: the model would
+        only see the same pixels again.
+
+        Args:
+            upload: MarksheetUpload being processed
+            extractor: AIExtractor instance
+            students_data: Output of extract_adaptive
+            resolution: Resolution students_data was extracted at
+            resolutions: The full resolution ladder
+
+        Returns:
+            List of student dictionaries with corrections merged in
+        """
+        validate = extractor.validate_student_data
+        flagged = {}
+        for student in students_data:
+            if isinstance(student, dict) and student.get('roll_number'):
+                problems = student_problems(student, validate)
+                if problems:
+                    flagged[str(student['roll_number'])] = problems
+        if not flagged:
+            return students_data
+
+        derivatives = DerivativeStore()
+        higher = [size for size in resolutions if size > resolution]
+        if not higher or self.at_original_size(derivatives.path(upload, extraction_input(resolution)), resolution):
+            logger.info(
+                "Not re-reading %d inconsistent student(s) of upload %s: no more detail than at %spx",
+                len(flagged), upload.id, resolution
+            )
+            return students_data
+
+        target = higher[0]
+        try:
+            image_path = derivatives.path(upload, extraction_input(target))
+            corrections = extractor.extract_students(image_path, list(flagged), max_size=target)
+        except Exception as e:
+            logger.warning("Targeted re-extraction of upload %s failed: %s", upload.id, e)
+            return students_data
+
+        by_roll = {
+            str(correction.get('roll_number')): correction
+            for correction in corrections if isinstance(correction, dict)
+        }
+        merged = []
+        corrected = 0
+        for student in students_data:
+            roll = str(student.get('roll_number')) if isinstance(student, dict) else None
+            correction = by_roll.get(roll) if roll in flagged else None
+            if correction is not None and len(student_problems(correction, validate)) < len(flagged[roll]):
+                merged.append(correction)
+                corrected += 1
+            else:
+                merged.append(student)
+
+        logger.info(
+            "Re-extracted %d inconsistent student(s) of upload %s at %spx, %d corrected",
+            len(flagged), upload.id, target, corrected
+        )
+        return merged
+
+    @staticmethod
+    def at_original_size(image_path, resolution):
+        """
+        Whether an extraction input is the original's full size
+
+        Inputs are only ever scaled down, so one smaller than its rung's
+        ``resolution`` holds every pixel of the original; larger rungs
+        would send the same image again.
+        """
+        with Image.open(image_path) as image:
+            return max(image.size) < resolution
+
+    def record_usage(self, upload, extractor):
+        """
+        Store the token usage of this extraction's calls on the upload
+
+        Replaces the usage of a previous extraction of the same upload.
+        """
+        upload.model_name = extractor.model_name
+        upload.token_usage = extractor.calls
+        for name, value in usage_totals(extractor.calls).items():
+            setattr(upload, name, value)
+        upload.save(update_fields=[
+            'model_name', 'token_usage', 'api_calls', 'prompt_tokens', 'image_tokens', 'output_tokens'
+        ])
+
+    def coerce(self, upload, students_data):
+        """
+        Convert extracted dictionaries to records, dropping unusable students
+
+        Args:
+            upload: MarksheetUpload being processed (for logging)
+            students_data: List of student dictionaries from the extractor
+
+        Returns:
+            List of ExtractedStudent
+        """
+        records = []
+        for student_data in students_data:
+            record, problems = coerce_student(student_data)
+            if record is None:
+                logger.warning("Dropped invalid student from upload %s: %s", upload.id, '; '.join(problems))
+                continue
+            if problems:
+                logger.info(
+                    "Student %s of upload %s saved with problems: %s",
+                    record.roll_number, upload.id, '; '.join(problems)
+                )
+            records.append(record)
+        return records
+
+    @staticmethod
+    def subject_ids(upload):
+        """Ids of the subjects the upload's students have marks for"""
+        return set(Mark.objects.filter(student__upload=upload).values_list('subject_id', flat=True))
+
+    def save_student(self, upload, record):
+        """
+        Create a Student and its Marks from one extracted record
+
+        Args:
+            upload: MarksheetUpload the student belongs to
+            record: ExtractedStudent
+
+        Returns:
+            The created Student
+        """
+        student = Student.objects.create(
+            upload=upload,
+            roll_number=record.roll_number[:50],
+            name=record.name[:200],
+            father_name=record.father_name[:200],
+            mother_name=record.mother_name[:200],
+            enrollment_number=record.enrollment_number[:100],
+            reported_percentage=record.reported_percentage,
+            reported_result=record.reported_result,
+        )
+
+        for mark in record.marks:
+            subject, created = Subject.objects.get_or_create(
+                code=mark.subject_code[:50],
+                name=mark.subject_name[:200]
+            )
+
+            Mark.objects.create(
+                student=student,
+                subject=subject,
+                theory_ese=mark.theory_ese,
+                theory_internal=mark.theory_internal,
+                practical_marks=mark.practical_marks,
+                practical_internal=mark.practical_internal
+            )
+
+        return student
+
+
+def get_extraction_resolutions():
+    """Resolution ladder from MARKSHEET_EXTRACTION_RESOLUTIONS, smallest first"""
+    return sorted(getattr(settings, 'MARKSHEET_EXTRACTION_RESOLUTIONS', [AIExtractor.MAX_IMAGE_SIZE]))
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'MARKSHEET_BACKGROUND_WORKERS', 2),
+                thread_name_prefix='marksheet-worker',
+            )
+        return _executor
+
+
+def _process_in_background(upload_id, replace_students=False):
+    try:
+        upload = MarksheetUpload.objects.get(pk=upload_id)
+        return UploadProcessor().process(upload, replace_students)
+    except Exception:
+        logger.exception("Background processing crashed for upload %s", upload_id)
+        return False
+    finally:
+        # Worker threads keep their own connection; release it between jobs
+        connection.close()
+
+
+async def process_upload_async(upload_id):
+    """
+    Process a saved upload on the worker pool and wait for the result
+
+    For async views: the event loop keeps serving other requests while the
+    extraction runs, and the pool bounds how many run at once.
+
+    Returns:
+        Boolean indicating if processing completed successfully
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), _process_in_background, upload_id)
+
+
+def enqueue_upload(upload_id, replace_students=False):
+    """
+    Process an upload on the in-process background worker pool
+
+    The request that created the upload can return immediately; progress
+    is then followed through the status API.
+
+    Args:
+        upload_id: Primary key of a saved MarksheetUpload
+        replace_students: Reprocess, replacing the students it already has
+    """
+    # Only start the job once the upload row is visible to other connections
+    transaction.on_commit(
+        lambda: _get_executor().submit(_process_in_background, upload_id, replace_students)
+    )
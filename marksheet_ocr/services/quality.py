@@ -0,0 +1,115 @@
+"""
+Structural checks on extracted marksheet data
+
+Used to decide whether an extraction is trustworthy, should be retried at a
+higher image resolution, or needs some students re-read. The checks only
+look at internal consistency of the AI output; they cannot tell a misread
+digit that happens to fit.
+"""
+import re
+from collections import Counter
+
+from django.conf import settings
+
+from .records import coerce_student
+
+
+# Allowed difference between the percentage printed on the sheet and the one
+# computed from the extracted marks, in percentage points
+PERCENTAGE_TOLERANCE = 1.0
+
+
+def normalize_result(result):
+    """Result text in one spelling: upper case, words separated by single spaces"""
+    return ' '.join(re.sub(r'[^A-Z0-9]+', ' ', str(result or '').upper()).split())
+
+
+def student_problems(student, validate=None, check_result=None):
+    """
+    Check one extracted student against itself
+
+    Flags what records.coerce_student reports (missing fields, marks that
+    are not whole numbers or outside 0-100), subjects without any marks, and
+    a printed percentage that ExtractedStudent.summary does not reproduce
+    within PERCENTAGE_TOLERANCE.
+
+    The printed result is only compared when ``check_result`` is set: boards
+    apply their own pass and division rules (a sheet may print PASS FIRST
+    next to an ESE of 24), so a result that differs from
+    Student.classify_result is usually not a misread.
+
+    Args:
+        student: Student dictionary as returned by the extractor
+        validate: Optional callable flagging invalid students, e.g.
+            AIExtractor.validate_student_data
+        check_result: Also compare the printed result with the one the marks
+            give (default MARKSHEET_QUALITY_CHECK_RESULT)
+
+    Returns:
+        List of problem descriptions; empty if the student is consistent
+    """
+    if check_result is None:
+        check_result = getattr(settings, 'MARKSHEET_QUALITY_CHECK_RESULT', False)
+
+    record, problems = coerce_student(student)
+    if record is None:
+        return problems
+    if validate is not None and not validate(student):
+        problems.append('missing roll number, name or subjects')
+
+    for mark in record.marks:
+        if not mark.has_theory() and not mark.has_practical():
+            problems.append(f'no marks for subject {mark.subject_code}')
+
+    summary = record.summary()
+    stated = record.reported_percentage
+    if stated is None and student.get('percentage') not in (None, ''):
+        problems.append(f"percentage {student.get('percentage')!r} is not a number")
+    if stated is not None and summary['maximum'] and abs(stated - summary['percentage']) > PERCENTAGE_TOLERANCE:
+        problems.append(f"stated percentage {stated:g} but marks add up to {summary['percentage']:g}")
+
+    stated_result = normalize_result(record.reported_result)
+    if check_result and stated_result and summary['result'] != 'N/A' and stated_result != summary['result']:
+        problems.append(f"stated result {stated_result} but marks give {summary['result']}")
+
+    return problems
+
+
+def find_problems(students_data, validate=None, check_result=None):
+    """
+    List structural problems in the output of AIExtractor
+
+    Args:
+        students_data: List of student dictionaries as returned by the extractor
+        validate: Optional callable flagging invalid students, e.g.
+            AIExtractor.validate_student_data
+        check_result: See student_problems
+
+    Returns:
+        List of human-readable problem descriptions; empty if the data looks sound
+    """
+    if not isinstance(students_data, list) or not students_data:
+        return ['no students extracted']
+
+    problems = []
+    subject_counts = Counter()
+    for index, student in enumerate(students_data, start=1):
+        label = f"student {student.get('roll_number') or index}" if isinstance(student, dict) else f'student {index}'
+        problems.extend(
+            f'{label}: {problem}' for problem in student_problems(student, validate, check_result)
+        )
+
+        subjects = student.get('subjects') if isinstance(student, dict) else None
+        if isinstance(subjects, list):
+            subject_counts[len(subjects)] += 1
+
+    # Every student on a sheet sits the same subjects; outliers were misread
+    if len(subject_counts) > 1:
+        usual, _ = subject_counts.most_common(1)[0]
+        for index, student in enumerate(students_data, start=1):
+            subjects = student.get('subjects') if isinstance(student, dict) else None
+            if isinstance(subjects, list) and len(subjects) != usual:
+                label = f"student {student.get('roll_number') or index}"
+                problems.append(f'{label}: {len(subjects)} subjects, most students have {usual}')
+
+    return problems
@@ -0,0 +1,280 @@
+"""
+Typed records of extracted students and marks
+
+The extractor's output is a list of nested dictionaries with loosely typed
+values ("24", "AB", "..."). coerce_student turns one of them into an
+ExtractedStudent in a single pass, converting marks to int or None and
+collecting what it could not make sense of. Records use model field names
+(``practical_marks``, not the extractor's ``practical``) and are what the
+persistence layer saves and the exporters write.
+
+Records also have a compact list form (to_compact / from_compact) for
+storing the raw extraction with its upload, and for archived uploads (see
+pack_records):
+
+    [roll_number, name, father_name, mother_name, enrollment_number,
+     [[subject_code, subject_name, theory_ese, theory_internal,
+       practical_marks, practical_internal], ...],
+     reported_percentage, reported_result]
+"""
+import json
+import zlib
+from dataclasses import dataclass, field
+
+from ..models import Student
+
+
+# Printed instead of a mark when there is none (absent, not applicable, ...)
+BLANK_MARKS = frozenset(['', '.', '..', '...', '-', '--', 'AB', 'ABS', 'ABSENT', 'NA', 'N/A', 'NIL'])
+
+# Mark fields in compact order, and the extractor's key for each
+MARK_FIELDS = [
+    ('theory_ese', 'theory_ese'),
+    ('theory_internal', 'theory_internal'),
+    ('practical_marks', 'practical'),
+    ('practical_internal', 'practical_internal'),
+]
+
+# Minimum marks to pass the theory ESE and the practical, as Mark.is_failed
+PASS_MARK = 33
+
+
+def coerce_mark(value):
+    """
+    Convert a mark as extracted to an int, or None if no mark is shown
+
+    Raises:
+        ValueError: If the value is neither a whole number nor a blank marker
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f'{value!r} is not a mark')
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(f'{value!r} is not a whole number')
+        return int(value)
+
+    text = str(value).strip().upper()
+    if text in BLANK_MARKS:
+        return None
+    number = float(text)
+    if not number.is_integer():
+        raise ValueError(f'{value!r} is not a whole number')
+    return int(number)
+
+
+def coerce_percentage(value):
+    """Convert a printed percentage ("67.5", "67.5%") to a float, or None"""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(str(value).strip().rstrip('%'))
+    except ValueError:
+        return None
+
+
+@dataclass(slots=True)
+class ExtractedMark:
+    """Marks of one subject; None where the sheet shows no mark"""
+    subject_code: str
+    subject_name: str
+    theory_ese: int | None = None
+    theory_internal: int | None = None
+    practical_marks: int | None = None
+    practical_internal: int | None = None
+
+    @classmethod
+    def from_model(cls, mark):
+        """Record of a saved Mark (its subject should be loaded)"""
+        return cls(
+            mark.subject.code, mark.subject.name,
+            mark.theory_ese, mark.theory_internal, mark.practical_marks, mark.practical_internal,
+        )
+
+    @classmethod
+    def from_compact(cls, row):
+        return cls(*row)
+
+    def to_compact(self):
+        return [
+            self.subject_code, self.subject_name,
+            self.theory_ese, self.theory_internal, self.practical_marks, self.practical_internal,
+        ]
+
+    def has_theory(self):
+        return self.theory_ese is not None or self.theory_internal is not None
+
+    def has_practical(self):
+        return self.practical_marks is not None or self.practical_internal is not None
+
+    def theory_total(self):
+        return (self.theory_ese or 0) + (self.theory_internal or 0)
+
+    def practical_total(self):
+        return (self.practical_marks or 0) + (self.practical_internal or 0)
+
+    def total(self):
+        return self.theory_total() + self.practical_total()
+
+    def maximum(self):
+        """100 for each of theory and practical the subject has marks for"""
+        return (100 if self.has_theory() else 0) + (100 if self.has_practical() else 0)
+
+    def is_failed(self):
+        return (
+            (self.theory_ese is not None and self.theory_ese < PASS_MARK)
+            or (self.practical_marks is not None and self.practical_marks < PASS_MARK)
+        )
+
+
+@dataclass(slots=True)
+class ExtractedStudent:
+    """One student with their marks, as extracted or as saved"""
+    roll_number: str
+    name: str
+    father_name: str = ''
+    mother_name: str = ''
+    enrollment_number: str = ''
+    marks: list = field(default_factory=list)
+    reported_percentage: float | None = None
+    reported_result: str = ''
+
+    @classmethod
+    def from_model(cls, student):
+        """Record of a saved Student (prefetch marks__subject to avoid a query each)"""
+        return cls(
+            student.roll_number, student.name, student.father_name, student.mother_name,
+            student.enrollment_number,
+            [ExtractedMark.from_model(mark) for mark in student.marks.all()],
+            student.reported_percentage, student.reported_result,
+        )
+
+    @classmethod
+    def from_compact(cls, row):
+        roll_number, name, father_name, mother_name, enrollment_number, marks, percentage, result = row
+        return cls(
+            roll_number, name, father_name, mother_name, enrollment_number,
+            [ExtractedMark.from_compact(mark) for mark in marks], percentage, result,
+        )
+
+    def to_compact(self):
+        return [
+            self.roll_number, self.name, self.father_name, self.mother_name, self.enrollment_number,
+            [mark.to_compact() for mark in self.marks], self.reported_percentage, self.reported_result,
+        ]
+
+    def sorted_marks(self):
+        """Marks in subject code order"""
+        return sorted(self.marks, key=lambda mark: mark.subject_code)
+
+    def summary(self):
+        """
+        Total, percentage and result, computed as Student.get_summary does
+
+        Returns:
+            Dictionary with total, maximum, percentage and result
+        """
+        total = 0
+        maximum = 0
+        has_failed = False
+        for mark in self.marks:
+            total += mark.total()
+            maximum += mark.maximum()
+            has_failed = has_failed or mark.is_failed()
+
+        percentage = round((total / maximum) * 100, 2) if maximum else 0
+        result = Student.classify_result(percentage, has_failed) if self.marks else 'N/A'
+        return {'total': total, 'maximum': maximum, 'percentage': percentage, 'result': result}
+
+
+def coerce_student(data):
+    """
+    Validate and convert one extracted student in a single pass
+
+    Students without a roll number, name or any subject, or with a subject
+    missing its code or name, are rejected. A mark that is not a number or
+    is outside 0-100 is kept as None and reported, so it is never saved;
+    the rest of the student is still usable. Roll and enrollment numbers
+    are upper-cased, as StudentSearch matches them.
+
+    Args:
+        data: Student dictionary as returned by AIExtractor
+
+    Returns:
+        Tuple of (ExtractedStudent or None if rejected, list of problems)
+    """
+    if not isinstance(data, dict):
+        return None, ['not an object']
+
+    problems = []
+    roll_number = str(data.get('roll_number') or '').strip().upper()
+    name = str(data.get('name') or '').strip()
+    if not roll_number:
+        problems.append('missing roll number')
+    if not name:
+        problems.append('missing name')
+
+    subjects = data.get('subjects')
+    if not isinstance(subjects, list) or not subjects:
+        problems.append('no subjects')
+        subjects = []
+
+    marks = []
+    rejected = bool(problems)
+    for subject in subjects:
+        if not isinstance(subject, dict) or 'code' not in subject or 'name' not in subject:
+            problems.append('subject without code or name')
+            rejected = True
+            continue
+        code = str(subject.get('code') or '')
+        values = []
+        for field_name, key in MARK_FIELDS:
+            try:
+                value = coerce_mark(subject.get(key))
+            except ValueError:
+                problems.append(f'{field_name} {subject.get(key)!r} in {code} is not a number')
+                value = None
+            if value is not None and not 0 <= value <= 100:
+                problems.append(f'{field_name} {value} in {code} is outside 0-100')
+                value = None
+            values.append(value)
+        marks.append(ExtractedMark(code, str(subject.get('name') or ''), *values))
+
+    if rejected:
+        return None, problems
+
+    record = ExtractedStudent(
+        roll_number=roll_number,
+        name=name,
+        father_name=str(data.get('father_name') or ''),
+        mother_name=str(data.get('mother_name') or ''),
+        enrollment_number=str(data.get('enrollment_number') or '').strip().upper(),
+        marks=marks,
+        reported_percentage=coerce_percentage(data.get('percentage')),
+        reported_result=str(data.get('result') or '')[:50],
+    )
+    return record, problems
+
+
+def dump_records(records):
+    """Compact, JSON-serializable form of a list of ExtractedStudent"""
+    return [record.to_compact() for record in records]
+
+
+def load_records(data):
+    """Inverse of dump_records"""
+    return [ExtractedStudent.from_compact(row) for row in data or []]
+
+
+def pack_records(records):
+    """zlib-compressed JSON of dump_records, as stored by UploadArchive"""
+    data = json.dumps(dump_records(records), separators=(',', ':'), ensure_ascii=False)
+    return zlib.compress(data.encode('utf-8'), 9)
+
+
+def unpack_records(payload):
+    """Inverse of pack_records"""
+    return load_records(json.loads(zlib.decompress(bytes(payload))))
@@ -0,0 +1,250 @@
+"""
+Garbage collection and retention policy for stored marksheet images
+"""
+import io
+import logging
+import posixpath
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import MarksheetUpload, UploadSessionFile
+from ..signals import row_handlers_suspended
+from ..storage import marksheet_storage
+from .derivatives import DERIVATIVES_DIR
+from .imaging import count_frames, load_reduced
+
+
+logger = logging.getLogger(__name__)
+
+
+class MarksheetRetention:
+    """
+    Remove image files no upload references and shrink old originals
+
+    Image files are shared between uploads (see ContentAddressedStorage), so
+    a file may only be touched once every upload referencing it allows it.
+
+    Args:
+        storage: Storage holding the images
+        dry_run: Report what would be done without changing anything
+    """
+
+    def __init__(self, storage=None, dry_run=False):
+        self.storage = storage or marksheet_storage
+        self.dry_run = dry_run
+
+    def reference_count(self, name):
+        """Number of uploads, and files of sessions not yet finalized, whose image is ``name``"""
+        return (
+            MarksheetUpload.objects.filter(image=name).count()
+            + self.pending_session_files().filter(stored_name=name).count()
+        )
+
+    def referenced_names(self):
+        uploads = MarksheetUpload.objects.exclude(image='').values_list('image', flat=True)
+        sessions = self.pending_session_files().values_list('stored_name', flat=True)
+        return set(uploads.distinct().iterator()) | set(sessions.iterator())
+
+    @staticmethod
+    def pending_session_files():
+        """Stored files of upload sessions that have not become uploads yet"""
+        return UploadSessionFile.objects.filter(upload__isnull=True).exclude(stored_name='')
+
+    def stored_files(self, directory='marksheets'):
+        """Yield the name of every file below ``directory``, including the temp dir"""
+        directories, files = self.storage.listdir(directory)
+        for filename in files:
+            yield posixpath.join(directory, filename)
+        for subdirectory in directories:
+            yield from self.stored_files(posixpath.join(directory, subdirectory))
+
+    def collect_garbage(self, grace_period=timedelta(hours=1)):
+        """
+        Delete image files and derivatives that no upload references
+
+        Files modified within ``grace_period`` are kept: they may belong to an
+        upload whose row has not been committed yet, or to a request that is
+        still streaming in.
+
+        Returns:
+            Tuple of (files removed, bytes freed)
+        """
+        referenced = self.referenced_names()
+        hashes = set(
+            MarksheetUpload.objects.exclude(content_hash='')
+            .values_list('content_hash', flat=True).distinct().iterator()
+        )
+        cutoff = timezone.now() - grace_period
+        removed = 0
+        freed = 0
+
+        for name in self.stored_files():
+            if name.startswith(DERIVATIVES_DIR + '/'):
+                # Derivatives are named <content hash>-<spec>; kept while any
+                # upload has that hash, even if its original was evicted
+                in_use = posixpath.basename(name).split('-', 1)[0] in hashes
+            else:
+                in_use = name in referenced
+            if in_use or self.storage.get_modified_time(name) > cutoff:
+                continue
+
+            size = self.storage.size(name)
+            logger.info("Removing unreferenced image %s (%d bytes)", name, size)
+            if not self.dry_run:
+                self.storage.delete(name)
+            removed += 1
+            freed += size
+
+        return removed, freed
+
+    def delete_uploads(self, uploads):
+        """
+        Delete uploads with their pages, students and marks, and the files only they used
+
+        The rows go in one transaction without the per-student and per-mark
+        cache invalidation (the uploads are gone). Images and derivatives
+        another upload still references, such as a re-upload of the same
+        scan, are kept.
+
+        Args:
+            uploads: QuerySet of MarksheetUpload
+
+        Returns:
+            Tuple of (uploads deleted, files removed, bytes freed)
+        """
+        ids = list(uploads.values_list('pk', flat=True))
+        doomed = list(
+            MarksheetUpload.objects.filter(Q(pk__in=ids) | Q(parent_id__in=ids))
+            .values_list('pk', 'image', 'content_hash')
+        )
+        doomed_ids = [pk for pk, _, _ in doomed]
+        names = {image for _, image, _ in doomed if image}
+        hashes = {digest for _, _, digest in doomed if digest}
+
+        if not self.dry_run:
+            with transaction.atomic(), row_handlers_suspended():
+                MarksheetUpload.objects.filter(pk__in=doomed_ids).delete()
+
+        others = MarksheetUpload.objects.exclude(pk__in=doomed_ids)
+        names -= set(others.filter(image__in=names).values_list('image', flat=True))
+        pending = self.pending_session_files().filter(stored_name__in=names)
+        names -= set(pending.values_list('stored_name', flat=True))
+        hashes -= set(others.filter(content_hash__in=hashes).values_list('content_hash', flat=True))
+
+        removed = 0
+        freed = 0
+        for name in sorted(names) + self._derivatives_of(hashes):
+            if not self.storage.exists(name):
+                continue
+            size = self.storage.size(name)
+            logger.info("Removing %s of a deleted upload (%d bytes)", name, size)
+            if not self.dry_run:
+                self.storage.delete(name)
+            removed += 1
+            freed += size
+
+        return len(doomed_ids), removed, freed
+
+    def _derivatives_of(self, hashes):
+        names = []
+        for prefix in sorted({digest[:2] for digest in hashes}):
+            directory = posixpath.join(DERIVATIVES_DIR, prefix)
+            if not self.storage.exists(directory):
+                continue
+            for filename in self.storage.listdir(directory)[1]:
+                if filename.split('-', 1)[0] in hashes:
+                    names.append(posixpath.join(directory, filename))
+        return names
+
+    def apply_retention(self, days, action, max_dimension=2048, quality=75):
+        """
+        Compress or evict the originals of completed or archived uploads older than ``days``
+
+        An image shared with an upload that is newer, pending or failed (and
+        may still be reprocessed) is left alone.
+
+        Args:
+            days: Age after which originals are compressed or evicted
+            action: 'compress' to re-encode as a smaller JPEG, 'evict' to delete
+            max_dimension: Longest side of compressed images, in pixels
+            quality: JPEG quality of compressed images
+
+        Returns:
+            Tuple of (images processed, bytes freed)
+        """
+        if action not in ('compress', 'evict'):
+            raise ValueError(f"Unknown retention action: {action}")
+
+        cutoff = timezone.now() - timedelta(days=days)
+        # Documents are kept: failed pages are rendered from them again on reprocessing
+        expired = MarksheetUpload.objects.filter(
+            status__in=['completed', 'archived'], uploaded_at__lt=cutoff, page_count=0
+        ).exclude(image='')
+        if action == 'compress':
+            expired = expired.filter(retention_state='')
+        else:
+            expired = expired.exclude(retention_state='evicted')
+
+        processed = 0
+        freed = 0
+        for name in expired.values_list('image', flat=True).distinct():
+            still_needed = MarksheetUpload.objects.filter(image=name).exclude(
+                status__in=['completed', 'archived'], uploaded_at__lt=cutoff
+            ).exists() or self.pending_session_files().filter(stored_name=name).exists()
+            if still_needed:
+                continue
+
+            if action == 'evict':
+                freed += self._evict(name)
+            else:
+                freed += self._compress(name, max_dimension, quality)
+            processed += 1
+
+        return processed, freed
+
+    def _evict(self, name):
+        size = self.storage.size(name) if self.storage.exists(name) else 0
+        logger.info("Evicting original %s (%d bytes)", name, size)
+        if not self.dry_run:
+            MarksheetUpload.objects.filter(image=name).update(image='', retention_state='evicted')
+            self.storage.delete(name)
+        return size
+
+    def _compress(self, name, max_dimension, quality):
+        if not self.storage.exists(name):
+            return 0
+
+        size = self.storage.size(name)
+        buffer = io.BytesIO()
+        with self.storage.open(name) as f:
+            pages = count_frames(f)
+            if pages == 1:
+                f.seek(0)
+                load_reduced(f, max_dimension).save(buffer, format='JPEG', quality=quality, optimize=True)
+
+        if pages > 1:
+            # A JPEG holds one page; multi-page originals are kept whole
+            logger.info("Keeping %s, it has %d pages", name, pages)
+            if not self.dry_run:
+                MarksheetUpload.objects.filter(image=name).update(retention_state='compressed')
+            return 0
+        if buffer.tell() >= size:
+            # Already smaller than the re-encoded version; keep the original
+            logger.info("Keeping %s, compression would not save space", name)
+            if not self.dry_run:
+                MarksheetUpload.objects.filter(image=name).update(retention_state='compressed')
+            return 0
+
+        saved = size - buffer.tell()
+        logger.info("Compressing original %s (%d -> %d bytes)", name, size, buffer.tell())
+        if not self.dry_run:
+            stem = posixpath.splitext(posixpath.basename(name))[0]
+            new_name = self.storage.save(f'marksheets/{stem}.jpg', ContentFile(buffer.getvalue()))
+            MarksheetUpload.objects.filter(image=name).update(image=new_name, retention_state='compressed')
+            if self.reference_count(name) == 0:
+                self.storage.delete(name)
+        return saved
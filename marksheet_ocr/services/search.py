@@ -0,0 +1,126 @@
+"""
+Student lookup across all uploads by roll number, enrollment number or name
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q
+
+from ..models import Student, StudentSearchToken
+
+
+# Sorts after any character that can appear in a token, so that
+# [prefix, prefix + _RANGE_END) is a prefix match every index can serve
+_RANGE_END = '\uffff'
+
+
+def normalize_tokens(text):
+    """
+    Split a name into lowercase ASCII word tokens
+
+    "SMT. INDER-BAI" -> ['smt', 'inder', 'bai']
+    """
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return [token for token in re.split(r'[^0-9a-z]+', text.lower()) if token]
+
+
+def _prefix(field, value):
+    """Prefix match written as a range so it can use a plain B-tree index"""
+    return Q(**{f'{field}__gte': value, f'{field}__lt': value + _RANGE_END})
+
+
+class StudentSearch:
+    """Find students by roll number, enrollment number or partial name"""
+
+    def uses_token_table(self):
+        """Whether names are searched through StudentSearchToken (no pg_trgm)"""
+        return connection.vendor != 'postgresql'
+
+    def search(self, query, limit=50):
+        """
+        Search students across every upload
+
+        Roll and enrollment numbers are stored upper-cased (see
+        records.coerce_student) and match by prefix. Each word of the query
+        must match a word of the name: by prefix through the token table, or
+        anywhere in the name through the trigram index on PostgreSQL.
+
+        Args:
+            query: Free text typed by the user
+            limit: Maximum number of students returned
+
+        Returns:
+            List of Students with their upload loaded and result aggregates
+            annotated (see StudentQuerySet.with_results)
+        """
+        query = (query or '').strip()
+        if not query:
+            return []
+
+        number = query.upper()
+        condition = _prefix('roll_number', number) | _prefix('enrollment_number', number)
+
+        name_condition = self._name_condition(query)
+        if name_condition is not None:
+            condition |= name_condition
+
+        students = (
+            Student.objects.filter(condition)
+            .select_related('upload')
+            .with_results(correlated=True)
+            .order_by('roll_number', 'id')[:limit]
+        )
+        return list(students)
+
+    def _name_condition(self, query):
+        tokens = normalize_tokens(query)
+        if not tokens:
+            return None
+
+        condition = Q()
+        for token in tokens:
+            if self.uses_token_table():
+                matching = StudentSearchToken.objects.filter(_prefix('token', token)).values('student_id')
+                condition &= Q(id__in=matching)
+            else:
+                condition &= Q(name__icontains=token)
+        return condition
+
+    def index_student(self, student):
+        """Refresh the name tokens of a single student"""
+        if not self.uses_token_table():
+            return
+
+        StudentSearchToken.objects.filter(student=student).delete()
+        StudentSearchToken.objects.bulk_create([
+            StudentSearchToken(student=student, token=token[:100])
+            for token in set(normalize_tokens(student.name))
+        ])
+
+    def rebuild_index(self, batch_size=2000):
+        """
+        Rebuild the whole token table from Student names
+
+        Returns:
+            Number of students indexed
+        """
+        if not self.uses_token_table():
+            return 0
+
+        StudentSearchToken.objects.all().delete()
+        indexed = 0
+        batch = []
+        for student_id, name in Student.objects.values_list('id', 'name').iterator(chunk_size=batch_size):
+            batch.extend(
+                StudentSearchToken(student_id=student_id, token=token[:100])
+                for token in set(normalize_tokens(name))
+            )
+            indexed += 1
+            if len(batch) >= batch_size:
+                StudentSearchToken.objects.bulk_create(batch)
+                batch = []
+
+        StudentSearchToken.objects.bulk_create(batch)
+        return indexed
@@ -0,0 +1,311 @@
+"""
+Resumable chunked uploads
+
+A client creates an UploadSession, adds its files one at a time (name and
+size), and writes each file in chunks of at most MARKSHEET_UPLOAD_CHUNK_SIZE
+bytes at an explicit offset. A chunk is accepted only at the file's current
+offset, so after a dropped connection the client asks for the offsets and
+carries on from there; no request holds more than one chunk.
+
+Chunks are appended to a part file under MEDIA_ROOT/upload-sessions/<key>/,
+streamed from the request in small pieces. When the last chunk of a file
+arrives it is validated like a form upload, hashed and moved into the
+marksheet storage, so no request handles more than one file. Finalizing
+the session then only creates the upload rows and enqueues them.
+
+Part files live outside the marksheets directory, and stored files of
+sessions not yet finalized count as referenced, so gc_marksheets does not
+collect either while a session is paused; it expires whole sessions
+instead (see expire).
+"""
+import logging
+import os
+import shutil
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from ..forms import MarksheetUploadForm
+from ..models import MarksheetUpload, UploadSession, UploadSessionFile
+from ..storage import marksheet_storage
+from .processing import enqueue_upload
+
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the request and written to disk at a time
+COPY_BUFFER_SIZE = 64 * 1024
+
+SESSIONS_DIR = 'upload-sessions'
+
+
+class OffsetMismatch(Exception):
+    """A chunk was sent for an offset other than the file's current one"""
+
+    def __init__(self, expected):
+        super().__init__(f'Expected a chunk at offset {expected}.')
+        self.expected = expected
+
+
+class SessionFinalized(Exception):
+    """The session no longer accepts files or chunks"""
+
+
+class PartFile(UploadedFile):
+    """
+    A received part file, opened for validation and the move into storage
+
+    Like the streaming upload handler's files it has a temporary_file_path,
+    so FileSystemStorage moves it into place instead of copying it.
+    """
+
+    def __init__(self, path, name, sha256=None):
+        super().__init__(open(path, 'rb'), name, size=os.path.getsize(path))
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            # Moved into storage
+            pass
+
+
+class UploadSessionStore:
+    """Create upload sessions, write their chunks and finalize them"""
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(settings.MEDIA_ROOT, SESSIONS_DIR)
+
+    def directory(self, session):
+        return os.path.join(self.root, session.key)
+
+    def part_path(self, session_file):
+        return os.path.join(self.directory(session_file.session), f'{session_file.id}.part')
+
+    def create(self, token=None):
+        """
+        Open a new session
+
+        Args:
+            token: ApiToken the session was created with, if any
+        """
+        session = UploadSession.objects.create(token=token)
+        os.makedirs(self.directory(session), exist_ok=True)
+        return session
+
+    def add_file(self, session, name, size):
+        """
+        Declare a file the client is about to send
+
+        Args:
+            session: UploadSession
+            name: Original file name
+            size: Size in bytes
+
+        Returns:
+            The new UploadSessionFile
+
+        Raises:
+            SessionFinalized: If the session was finalized
+            ValueError: If the name or size is invalid, or the session is full
+                (MARKSHEET_UPLOAD_SESSION_MAX_FILES files or
+                MARKSHEET_UPLOAD_SESSION_MAX_BYTES bytes declared)
+        """
+        if session.is_finalized():
+            raise SessionFinalized('The session was already finalized.')
+
+        name = os.path.basename(str(name or '').replace('\\', '/')).strip()
+        if not name:
+            raise ValueError('A file name is required.')
+        if isinstance(size, bool) or not isinstance(size, int) or size <= 0:
+            raise ValueError('The size must be a positive number of bytes.')
+        # The exact limit depends on the type, known once the first bytes arrive
+        largest = max(settings.MARKSHEET_MAX_UPLOAD_SIZE, settings.MARKSHEET_MAX_PDF_SIZE)
+        if size > largest:
+            raise ValueError(f'Files must be smaller than {largest // (1024 * 1024)}MB.')
+
+        max_files = settings.MARKSHEET_UPLOAD_SESSION_MAX_FILES
+        max_bytes = settings.MARKSHEET_UPLOAD_SESSION_MAX_BYTES
+        with transaction.atomic():
+            # Locked so concurrent requests cannot both take the last place
+            session = UploadSession.objects.select_for_update().get(pk=session.pk)
+            declared = session.files.aggregate(files=Count('id'), size=Sum('size'))
+            if declared['files'] >= max_files:
+                raise ValueError(f'At most {max_files} files per session.')
+            if (declared['size'] or 0) + size > max_bytes:
+                raise ValueError(f'Sessions may hold at most {max_bytes // (1024 * 1024)}MB.')
+
+            session_file = UploadSessionFile.objects.create(session=session, name=name[:255], size=size)
+        # An empty part file, so every chunk is written in place
+        os.makedirs(self.directory(session), exist_ok=True)
+        open(self.part_path(session_file), 'wb').close()
+        UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now())
+        return session_file
+
+    def write_chunk(self, session_file, offset, stream, length):
+        """
+        Write one chunk of a file at ``offset``, read from ``stream``
+
+        The chunk is written in place before the offset is advanced with a
+        conditional UPDATE, so a retried or duplicated chunk is harmless: it
+        overwrites the same bytes, and only one copy moves the offset.
+
+        Args:
+            session_file: UploadSessionFile
+            offset: Position of the chunk in the file
+            stream: Readable request body
+            length: Declared length of the chunk (Content-Length)
+
+        Returns:
+            The refreshed UploadSessionFile
+
+        Raises:
+            SessionFinalized: If the session was finalized
+            OffsetMismatch: If ``offset`` is not the file's current offset
+            ValueError: If the chunk is empty, too large, past the declared
+                size, or shorter than declared
+        """
+        if session_file.session.is_finalized():
+            raise SessionFinalized('The session was already finalized.')
+        if offset != session_file.received:
+            raise OffsetMismatch(session_file.received)
+        if length <= 0:
+            raise ValueError('Empty chunk.')
+        if length > settings.MARKSHEET_UPLOAD_CHUNK_SIZE:
+            raise ValueError(f'Chunks may be at most {settings.MARKSHEET_UPLOAD_CHUNK_SIZE} bytes.')
+        if offset + length > session_file.size:
+            raise ValueError(f'The chunk ends past the declared size of {session_file.size} bytes.')
+
+        written = 0
+        with open(self.part_path(session_file), 'r+b') as part:
+            part.seek(offset)
+            while written < length:
+                piece = stream.read(min(COPY_BUFFER_SIZE, length - written))
+                if not piece:
+                    break
+                part.write(piece)
+                written += len(piece)
+        if written != length:
+            raise ValueError(f'Received {written} of {length} bytes; send the chunk again.')
+
+        advanced = UploadSessionFile.objects.filter(pk=session_file.pk, received=offset).update(
+            received=offset + length
+        )
+        session_file.refresh_from_db()
+        if not advanced:
+            raise OffsetMismatch(session_file.received)
+        UploadSession.objects.filter(pk=session_file.session_id).update(updated_at=timezone.now())
+
+        if session_file.is_complete():
+            self._store(session_file)
+        return session_file
+
+    def _store(self, session_file):
+        """Check a complete file as the upload form would, hash it and move it into storage"""
+        part = PartFile(self.part_path(session_file), session_file.name)
+        try:
+            form = MarksheetUploadForm(files={'image': part})
+            if form.is_valid():
+                part.sha256 = marksheet_storage.hash_content(part)
+                session_file.content_hash = part.sha256
+                session_file.page_count = getattr(form, 'page_count', 0)
+                session_file.stored_name = marksheet_storage.save(
+                    MarksheetUpload.image.field.generate_filename(None, session_file.name), part
+                )
+                session_file.error = ''
+            else:
+                session_file.error = ' '.join(' '.join(errors) for errors in form.errors.values())
+        except OSError as e:
+            logger.exception(
+                "Could not store %s of upload session %s", session_file.name, session_file.session_id
+            )
+            session_file.error = f'The file could not be stored: {e}'
+        finally:
+            part.close()
+        session_file.save(update_fields=['content_hash', 'page_count', 'stored_name', 'error'])
+
+    def finalize(self, session):
+        """
+        Turn the session's complete, valid files into uploads and enqueue them
+
+        The files are already in storage, so this only writes rows. Runs in
+        one transaction with the session row locked, so concurrent calls
+        cannot create the uploads twice; finalizing again returns the same
+        uploads.
+
+        Returns:
+            Tuple of (UploadSessionFiles that became uploads, list of error messages)
+
+        Raises:
+            ValueError: If a file has not been received completely
+        """
+        finalized_now = False
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(pk=session.pk)
+            files = list(session.files.select_related('upload'))
+            if not session.is_finalized():
+                incomplete = [f for f in files if not f.is_complete()]
+                if incomplete:
+                    raise ValueError('Incomplete files: ' + ', '.join(
+                        f'{f.name} ({f.received} of {f.size} bytes)' for f in incomplete
+                    ))
+
+                for session_file in files:
+                    if session_file.error or not session_file.stored_name:
+                        continue
+                    upload = MarksheetUpload.objects.create(
+                        image=session_file.stored_name,
+                        content_hash=session_file.content_hash,
+                        page_count=session_file.page_count,
+                    )
+                    session_file.upload = upload
+                    session_file.save(update_fields=['upload'])
+                    # Started once the transaction commits
+                    enqueue_upload(upload.id)
+
+                session.finalized_at = timezone.now()
+                session.save(update_fields=['finalized_at', 'updated_at'])
+                finalized_now = True
+
+        if finalized_now:
+            shutil.rmtree(self.directory(session), ignore_errors=True)
+            logger.info("Finalized upload session %s with %d file(s)", session.id, len(files))
+
+        errors = [f'Error in {f.name}: {f.error}' for f in files if f.error]
+        return [f for f in files if f.upload is not None], errors
+
+    def expire(self, max_age, dry_run=False):
+        """
+        Delete sessions not touched for ``max_age``, with their part files
+
+        Uploads created by finalized sessions are kept.
+
+        Returns:
+            Tuple of (sessions deleted, bytes freed)
+        """
+        expired = UploadSession.objects.filter(updated_at__lt=timezone.now() - max_age)
+        freed = 0
+        count = 0
+        for session in expired:
+            directory = self.directory(session)
+            if os.path.isdir(directory):
+                freed += sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+                if not dry_run:
+                    shutil.rmtree(directory, ignore_errors=True)
+            if not dry_run:
+                session.delete()
+            count += 1
+        return count, freed
+
+
+def session_max_age():
+    """Idle time after which gc_marksheets deletes an upload session"""
+    return timedelta(hours=settings.MARKSHEET_UPLOAD_SESSION_HOURS)
@@ -0,0 +1,89 @@
+"""
+Gemini token accounting
+
+AIExtractor records the usage metadata of every call it makes; the
+processor stores the calls of an extraction with its upload, and
+``manage.py report_token_usage`` aggregates them.
+
+The SDK reports input tokens as a single count. Where it does not break
+them down by modality, the image's share is estimated from its size with
+Gemini's tiling rule (258 tokens per image up to 384px, else 258 per
+768px tile), and the rest is the text: the instructions plus the response
+schema, which is the same for every sheet.
+"""
+import math
+
+# Tokens of one image tile, and the tile and small-image sizes in pixels
+TOKENS_PER_TILE = 258
+TILE_SIZE = 768
+SMALL_IMAGE_SIZE = 384
+
+
+def estimate_image_tokens(width, height):
+    """Input tokens Gemini charges for an image of ``width`` x ``height`` pixels"""
+    if width <= SMALL_IMAGE_SIZE and height <= SMALL_IMAGE_SIZE:
+        return TOKENS_PER_TILE
+    return math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE) * TOKENS_PER_TILE
+
+
+def call_usage(response, kind, image, max_size, seconds):
+    """
+    Usage of one generate_content call, as stored in MarksheetUpload.token_usage
+
+    Args:
+        response: GenerateContentResponse
+        kind: 'full' or 'targeted'
+        image: PIL Image that was sent
+        max_size: Longest side the image was reduced to fit
+        seconds: Duration of the call
+
+    Returns:
+        Dictionary of plain values
+    """
+    usage = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+    output_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+
+    image_tokens = None
+    for detail in getattr(usage, 'prompt_tokens_details', None) or []:
+        if str(getattr(detail, 'modality', '')).upper().endswith('IMAGE'):
+            image_tokens = (image_tokens or 0) + detail.token_count
+    if image_tokens is None:
+        image_tokens = estimate_image_tokens(*image.size)
+    if prompt_tokens:
+        image_tokens = min(image_tokens, prompt_tokens)
+
+    return {
+        'kind': kind,
+        'width': image.size[0],
+        'height': image.size[1],
+        'max_size': max_size,
+        'text_tokens': max(prompt_tokens - image_tokens, 0),
+        'image_tokens': image_tokens,
+        'output_tokens': output_tokens,
+        'seconds': round(seconds, 2),
+    }
+
+
+def image_tokens_at(call, resolution):
+    """
+    Estimated image tokens of a recorded call had it been sent at ``resolution``
+
+    Images are only ever scaled down: one that was sent smaller than its
+    ``max_size`` was already at the original's size.
+    """
+    longest = max(call['width'], call['height'], 1)
+    scale = resolution / longest
+    if longest < call['max_size']:
+        scale = min(scale, 1)
+    return estimate_image_tokens(round(call['width'] * scale), round(call['height'] * scale))
+
+
+def usage_totals(calls):
+    """Per-upload totals of a list of call_usage dictionaries"""
+    return {
+        'api_calls': len(calls),
+        'prompt_tokens': sum(call['text_tokens'] for call in calls),
+        'image_tokens': sum(call['image_tokens'] for call in calls),
+        'output_tokens': sum(call['output_tokens'] for call in calls),
+    }
@@ -0,0 +1,92 @@
+"""
+Model signal handlers for the marksheet app
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import MarksheetUpload, Student, Subject, SubjectSummary, Mark
+from .services import analytics
+from .services.search import StudentSearch
+
+
+_local = threading.local()
+
+
+@contextmanager
+def row_handlers_suspended():
+    """
+    Skip the per-student and per-mark handlers below in this thread
+
+    For bulk changes whose caller invalidates the affected uploads itself,
+    or deletes them: deleting an upload otherwise costs an UPDATE for every
+    student and a lookup and UPDATE for every mark it cascades to.
+    """
+    previous = getattr(_local, 'suspended', False)
+    _local.suspended = True
+    try:
+        yield
+    finally:
+        _local.suspended = previous
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def student_changed(sender, instance, **kwargs):
+    """Invalidate the cached results page of the student's upload"""
+    if getattr(_local, 'suspended', False):
+        return
+    MarksheetUpload.bump_results_version(instance.upload_id)
+
+
+@receiver(post_save, sender=Student)
+def index_student_name(sender, instance, **kwargs):
+    """Keep the name search tokens in step with the student's name"""
+    StudentSearch().index_student(instance)
+
+
+@receiver(post_save, sender=Mark)
+@receiver(post_delete, sender=Mark)
+def mark_changed(sender, instance, **kwargs):
+    """Invalidate the cached results page of the upload the mark belongs to"""
+    if getattr(_local, 'suspended', False):
+        return
+    try:
+        upload_id = instance.student.upload_id
+    except Student.DoesNotExist:
+        # Deleted together with its student, which already bumped the version
+        return
+    MarksheetUpload.bump_results_version(upload_id)
+
+
+@receiver(post_save, sender=Subject)
+def subject_changed(sender, instance, created, **kwargs):
+    """Subject names are rendered on every upload that has marks for them"""
+    if created:
+        return
+    upload_ids = Student.objects.filter(marks__subject=instance).values('upload_id')
+    MarksheetUpload.objects.filter(pk__in=upload_ids).update(
+        results_version=models.F('results_version') + 1
+    )
+
+
+@receiver(post_save, sender=Mark)
+@receiver(post_delete, sender=Mark)
+def mark_counted(sender, instance, **kwargs):
+    """Recount the subject summary of the mark's upload"""
+    if getattr(_local, 'suspended', False):
+        return
+    try:
+        upload_id = instance.student.upload_id
+    except Student.DoesNotExist:
+        return
+    analytics.summary_changed(upload_id, instance.subject_id)
+
+
+@receiver(post_delete, sender=SubjectSummary)
+def summary_deleted(sender, instance, **kwargs):
+    """A summary deleted with its upload or subject no longer adds to its trend"""
+    analytics.trend_changed(instance.subject_id, instance.period)
@@ -13,6 +13,45 @@ document.addEventListener('DOMContentLoaded', function () {
 
     if (!uploadArea || !fileInput) return;
 
+    // Limits advertised by the server on the form (see the upload view)
+    const advertised = uploadForm ? uploadForm.dataset : {};
+    const limits = {
+        // Per form POST; upload sessions take up to maxSessionFiles
+        maxFiles: parseInt(advertised.maxFiles, 10) || 5,
+        maxSessionFiles: parseInt(advertised.maxSessionFiles, 10) || 0,
+        sessionUrl: advertised.sessionUrl,
+        historyUrl: advertised.historyUrl,
+        chunkSize: 4 * 1024 * 1024,
+        maxImageSize: parseInt(advertised.maxImageSize, 10) || 10 * 1024 * 1024,
+        maxPdfSize: parseInt(advertised.maxPdfSize, 10) || 100 * 1024 * 1024,
+        // Longest side images are downscaled to before sending; 0 sends originals
+        maxDimension: parseInt(advertised.maxDimension, 10) || 0,
+        quality: (parseInt(advertised.quality, 10) || 85) / 100
+    };
+
+    // Formats the browser may be able to decode and re-encode. TIFFs are sent
+    // as they are: a canvas would keep only the first of their pages
+    const resizableTypes = ['image/jpeg', 'image/jpg', 'image/png', 'image/bmp'];
+
+    // Formats that may hold many pages, and get the larger limit
+    const documentTypes = ['application/pdf', 'image/tiff'];
+
+    function canDownscale(file) {
+        return limits.maxDimension > 0 && resizableTypes.includes(file.type) && !!window.Blob;
+    }
+
+    function canUseSessions() {
+        return !!(window.fetch && limits.sessionUrl && limits.maxSessionFiles);
+    }
+
+    function maxSizeOf(file) {
+        return documentTypes.includes(file.type) ? limits.maxPdfSize : limits.maxImageSize;
+    }
+
+    function formatMB(bytes) {
+        return `${(bytes / (1024 * 1024)).toFixed(1)}MB`;
+    }
+
     // Drag and drop events
     uploadArea.addEventListener('dragover', function (e) {
         e.preventDefault();
@@ -54,15 +93,16 @@ document.addEventListener('DOMContentLoaded', function () {
     // Handle files selection
     function handleFilesSelect(files) {
         // Validate file count
-        if (files.length > 5) {
-            alert('Maximum 5 files allowed per upload.');
+        const maxFiles = canUseSessions() ? limits.maxSessionFiles : limits.maxFiles;
+        if (files.length > maxFiles) {
+            alert(`Maximum ${maxFiles} files allowed per upload.`);
             fileInput.value = '';
             fileInfo.style.display = 'none';
             imagePreview.style.display = 'none';
             return;
         }
 
-        const validTypes = ['image/jpeg', 'image/jpg', 'image/png', 'image/bmp', 'image/tiff'];
+        const validTypes = ['image/jpeg', 'image/jpg', 'image/png', 'image/bmp', 'image/tiff', 'application/pdf'];
         let validFiles = true;
         let fileNames = [];
 
@@ -71,13 +111,15 @@ document.addEventListener('DOMContentLoaded', function () {
             const file = files[i];
 
             if (!validTypes.includes(file.type)) {
-                alert(`File "${file.name}" is not a valid image. Please select JPEG, PNG, BMP, or TIFF.`);
+                alert(`File "${file.name}" is not a valid image. Please select JPEG, PNG, BMP, TIFF, or PDF.`);
                 validFiles = false;
                 break;
             }
 
-            if (file.size > 10 * 1024 * 1024) {
-                alert(`File "${file.name}" exceeds 10MB limit.`);
+            // PDFs hold many pages and get a larger limit. Images that will be
+            // downscaled are checked again once they have been
+            if (file.size > maxSizeOf(file) && !canDownscale(file)) {
+                alert(`File "${file.name}" exceeds ${formatMB(maxSizeOf(file))} limit.`);
                 validFiles = false;
                 break;
             }
@@ -91,7 +133,10 @@ document.addEventListener('DOMContentLoaded', function () {
         }
 
         // Show file info
-        if (files.length === 1) {
+        if (files.length === 1 && files[0].type === 'application/pdf') {
+            fileName.textContent = files[0].name;
+            imagePreview.style.display = 'none';
+        } else if (files.length === 1) {
             fileName.textContent = files[0].name;
             // Show image preview for single file
             const reader = new FileReader();
@@ -121,6 +166,362 @@ document.addEventListener('DOMContentLoaded', function () {
             // Show processing indicator
             submitBtn.disabled = true;
             processingIndicator.style.display = 'block';
+
+            // Without fetch the form falls back to a regular (blocking) POST
+            if (!canUseSessions()) return;
+
+            e.preventDefault();
+            submitUploads();
+        });
+    }
+
+    // Send the files through a resumable upload session, then follow their progress.
+    // Each image is downscaled just before it is sent, so only one is held in memory
+    function submitUploads() {
+        const originals = Array.prototype.slice.call(fileInput.files);
+        const errors = [];
+        const totals = { original: 0, sent: 0 };
+        let session = null;
+        setProcessingStatus('Starting upload...');
+
+        sessionRequest('POST', limits.sessionUrl)
+            .then(function (response) {
+                if (!response.ok) throw new Error(response.data.error || 'Could not start the upload.');
+                session = response.data;
+                limits.chunkSize = session.chunk_size;
+
+                return originals.reduce(function (previous, original, index) {
+                    return previous.then(function () {
+                        const label = `${original.name} (${index + 1}/${originals.length})`;
+                        setProcessingStatus(`Preparing ${label}...`);
+                        return downscale(original).then(function (file) {
+                            if (file.size > maxSizeOf(file)) {
+                                errors.push(`File "${original.name}" exceeds ${formatMB(maxSizeOf(file))} limit.`);
+                                return;
+                            }
+                            totals.original += original.size;
+                            totals.sent += file.size;
+                            return sessionRequest('POST', session.files_url, { name: file.name, size: file.size })
+                                .then(function (response) {
+                                    if (!response.ok) {
+                                        errors.push(`Error in ${original.name}: ${response.data.error}`);
+                                        return;
+                                    }
+                                    return sendFile(file, response.data, label).catch(function (error) {
+                                        if (!error.fatal) throw error;
+                                        errors.push(`Error in ${original.name}: ${error.message}`);
+                                    });
+                                });
+                        });
+                    });
+                }, Promise.resolve()).then(function () {
+                    setProcessingStatus(totals.sent < totals.original
+                        ? `Queueing (sent ${formatMB(totals.sent)}, reduced from ${formatMB(totals.original)})...`
+                        : 'Queueing...');
+                    return sessionRequest('POST', session.finalize_url);
+                });
+            })
+            .then(function (response) {
+                const data = response.data;
+                if (data.error) errors.push(data.error);
+                showQueued(data.uploads || [], errors.concat(data.errors || []));
+            })
+            .catch(function (error) {
+                if (session === null && originals.length <= limits.maxFiles) {
+                    // No session could be opened: let the server handle the files the old way
+                    uploadForm.submit();
+                    return;
+                }
+                alert(`Upload interrupted: ${error.message}`);
+                resetForm();
+            });
+    }
+
+    // JSON request to the upload session API, resolving with the status and body
+    function sessionRequest(method, url, body) {
+        return fetch(url, {
+            method: method,
+            body: body ? JSON.stringify(body) : undefined,
+            headers: {
+                'Accept': 'application/json',
+                'Content-Type': 'application/json',
+                'X-CSRFToken': csrfToken()
+            },
+            credentials: 'same-origin'
+        }).then(function (response) {
+            return response.json().then(function (data) {
+                return { ok: response.ok, status: response.status, data: data };
+            });
+        });
+    }
+
+    function csrfToken() {
+        const field = uploadForm.querySelector('[name=csrfmiddlewaretoken]');
+        return field ? field.value : '';
+    }
+
+    // Send a file chunk by chunk from the offset the server has. After a
+    // network or server error, wait, ask the server how much arrived and
+    // carry on from there; give up after a few failures in a row
+    function sendFile(file, entry, label) {
+        let failures = 0;
+
+        function next() {
+            if (entry.received >= file.size) return Promise.resolve(entry);
+            const percent = Math.floor((entry.received / file.size) * 100);
+            setProcessingStatus(`Uploading ${label}: ${percent}%`);
+
+            return sendChunk(file, entry).then(
+                function () {
+                    failures = 0;
+                    return next();
+                },
+                function (error) {
+                    failures += 1;
+                    if (error.fatal || failures > 5) throw error;
+                    setProcessingStatus(`Connection lost, retrying ${label}...`);
+                    return wait(1000 * Math.pow(2, failures - 1))
+                        .then(function () { return sessionRequest('GET', entry.chunk_url); })
+                        .then(function (response) {
+                            if (response.ok) entry.received = response.data.received;
+                        }, function () { /* still offline; the next chunk finds out */ })
+                        .then(next);
+                }
+            );
+        }
+
+        return next();
+    }
+
+    // PUT one chunk at the file's current offset. A 409 carries the offset
+    // the server has, which the next chunk starts from
+    function sendChunk(file, entry) {
+        const end = Math.min(entry.received + limits.chunkSize, file.size);
+        return fetch(`${entry.chunk_url}?offset=${entry.received}`, {
+            method: 'PUT',
+            body: file.slice(entry.received, end),
+            headers: {
+                'Accept': 'application/json',
+                'Content-Type': 'application/octet-stream',
+                'X-CSRFToken': csrfToken()
+            },
+            credentials: 'same-origin'
+        }).then(function (response) {
+            return response.json().then(function (data) {
+                if (response.ok || (response.status === 409 && data.received !== undefined)) {
+                    entry.received = data.received;
+                    return;
+                }
+                const error = new Error(data.error || `Server error ${response.status}`);
+                // Server errors may pass; a refused chunk will not
+                error.fatal = response.status < 500;
+                throw error;
+            });
+        });
+    }
+
+    function wait(milliseconds) {
+        return new Promise(function (resolve) { setTimeout(resolve, milliseconds); });
+    }
+
+    // Resize an image to the advertised longest side and re-encode it as JPEG.
+    // Resolves with the original file when the browser cannot decode it, or
+    // when the result would not be smaller
+    function downscale(file) {
+        if (!canDownscale(file)) return Promise.resolve(file);
+
+        return decodeImage(file)
+            .then(function (image) {
+                const scale = Math.min(1, limits.maxDimension / Math.max(image.width, image.height));
+                const width = Math.max(1, Math.round(image.width * scale));
+                const height = Math.max(1, Math.round(image.height * scale));
+                return encodeJpeg(image, width, height).then(function (blob) {
+                    if (image.close) image.close();
+                    if (!blob || blob.size >= file.size) return file;
+                    const name = file.name.replace(/\.[^.]*$/, '') + '.jpg';
+                    return new File([blob], name, { type: 'image/jpeg', lastModified: file.lastModified });
+                });
+            })
+            .catch(function () { return file; });
+    }
+
+    // Decode upright: both paths apply the EXIF orientation of phone photos
+    function decodeImage(file) {
+        if (window.createImageBitmap) {
+            return createImageBitmap(file, { imageOrientation: 'from-image' })
+                .catch(function () { return decodeWithElement(file); });
+        }
+        return decodeWithElement(file);
+    }
+
+    function decodeWithElement(file) {
+        return new Promise(function (resolve, reject) {
+            const url = URL.createObjectURL(file);
+            const image = new Image();
+            image.onload = function () {
+                URL.revokeObjectURL(url);
+                resolve(image);
+            };
+            image.onerror = function () {
+                URL.revokeObjectURL(url);
+                reject(new Error(`Could not decode ${file.name}`));
+            };
+            image.src = url;
+        });
+    }
+
+    // Draw onto an OffscreenCanvas where supported (no DOM layout), else a detached canvas
+    function encodeJpeg(image, width, height) {
+        let canvas;
+        if (window.OffscreenCanvas && OffscreenCanvas.prototype.convertToBlob) {
+            canvas = new OffscreenCanvas(width, height);
+        } else {
+            canvas = document.createElement('canvas');
+            canvas.width = width;
+            canvas.height = height;
+        }
+
+        const context = canvas.getContext('2d');
+        // JPEG has no alpha: flatten transparent PNGs onto white, not black
+        context.fillStyle = '#fff';
+        context.fillRect(0, 0, width, height);
+        context.imageSmoothingEnabled = true;
+        context.imageSmoothingQuality = 'high';
+        context.drawImage(image, 0, 0, width, height);
+
+        if (canvas.convertToBlob) {
+            return canvas.convertToBlob({ type: 'image/jpeg', quality: limits.quality });
+        }
+        return new Promise(function (resolve) {
+            canvas.toBlob(resolve, 'image/jpeg', limits.quality);
         });
     }
+
+    // Follow the queued uploads to the end, or leave a large batch to the upload history
+    function showQueued(uploads, errors) {
+        if (uploads.length === 0) {
+            alert(errors.join('\n') || 'Upload failed.');
+            resetForm();
+            return;
+        }
+        if (errors.length > 0) alert(errors.join('\n'));
+
+        if (uploads.length > limits.maxFiles) {
+            window.location.href = limits.historyUrl;
+            return;
+        }
+
+        return Promise.all(uploads.map(followUpload)).then(function (results) {
+            const completed = results.filter(function (r) { return r.status === 'completed'; });
+            if (uploads.length === 1 && completed.length === 1) {
+                window.location.href = completed[0].results_url;
+            } else {
+                window.location.reload();
+            }
+        });
+    }
+
+    // Resolve with the final status payload once the upload finishes
+    function followUpload(upload) {
+        return new Promise(function (resolve) {
+            if (!window.EventSource) {
+                pollStatus(upload.status_url, resolve);
+                return;
+            }
+
+            const source = new EventSource(upload.events_url);
+            source.addEventListener('progress', function (e) {
+                showProgress(upload, JSON.parse(e.data));
+            });
+            source.addEventListener('done', function (e) {
+                source.close();
+                const payload = JSON.parse(e.data);
+                showProgress(upload, payload);
+                resolve(payload);
+            });
+            source.onerror = function () {
+                // Stream unavailable (e.g. proxy buffering): poll instead
+                source.close();
+                pollStatus(upload.status_url, resolve, function (payload) {
+                    showProgress(upload, payload);
+                });
+            };
+        });
+    }
+
+    // Poll the status endpoint; the browser revalidates with If-None-Match
+    function pollStatus(url, onDone, onProgress) {
+        fetch(url, { cache: 'no-cache', credentials: 'same-origin' })
+            .then(function (response) { return response.json(); })
+            .then(function (payload) {
+                if (onProgress) onProgress(payload);
+                if (payload.status === 'completed' || payload.status === 'failed') {
+                    onDone(payload);
+                } else {
+                    setTimeout(function () { pollStatus(url, onDone, onProgress); }, 2000);
+                }
+            })
+            .catch(function () {
+                setTimeout(function () { pollStatus(url, onDone, onProgress); }, 5000);
+            });
+    }
+
+    const stageLabels = {
+        queued: 'Queued',
+        preparing: 'Preparing image',
+        extracting: 'Extracting with AI',
+        saving: 'Saving students',
+        done: 'Done'
+    };
+
+    function showProgress(upload, payload) {
+        let text = `${upload.name}: ${stageLabels[payload.stage] || payload.stage}`;
+        if (payload.stage === 'saving' && payload.students_total > 0) {
+            text += ` (${payload.students_saved}/${payload.students_total} students)`;
+        }
+        if (payload.status === 'failed') {
+            text = `${upload.name}: failed - ${payload.error_message}`;
+        }
+        setProcessingStatus(text);
+    }
+
+    function setProcessingStatus(text) {
+        const status = document.getElementById('processing-status');
+        if (status) status.textContent = text;
+    }
+
+    function resetForm() {
+        submitBtn.disabled = false;
+        processingIndicator.style.display = 'none';
+    }
+});
+
+// Refresh the recent uploads list once pending rows finish processing
+document.addEventListener('DOMContentLoaded', function () {
+    const pendingRows = document.querySelectorAll('tr[data-status-url]');
+    if (pendingRows.length === 0 || !window.fetch) return;
+
+    function check() {
+        const requests = Array.prototype.map.call(pendingRows, function (row) {
+            return fetch(row.dataset.statusUrl, { cache: 'no-cache', credentials: 'same-origin' })
+                .then(function (response) { return response.json(); });
+        });
+
+        Promise.all(requests)
+            .then(function (payloads) {
+                const finished = payloads.some(function (p) {
+                    return p.status === 'completed' || p.status === 'failed';
+                });
+                if (finished) {
+                    window.location.reload();
+                } else {
+                    setTimeout(check, 5000);
+                }
+            })
+            .catch(function () {
+                setTimeout(check, 10000);
+            });
+    }
+
+    setTimeout(check, 5000);
 });
@@ -0,0 +1,93 @@
+"""
+Content-addressed storage for marksheet images
+"""
+import hashlib
+import posixpath
+import threading
+
+from django.core.files.storage import FileSystemStorage
+
+from .upload_handlers import SNIFF_BYTES, TYPE_EXTENSIONS, sniff_image_type
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Store each image under the SHA-256 of its content
+
+    ``marksheets/scan.jpeg`` is saved as ``marksheets/ab/cd/abcd…ef.jpg``, the
+    extension following the format sniffed from the content rather than the
+    name it was uploaded under. If a file with the same content already exists
+    it is reused and the new copy discarded, so re-uploading a scan costs no
+    disk space. Files are shared
+    between MarksheetUpload rows; the number of rows pointing at a name is its
+    reference count, and ``manage.py gc_marksheets`` removes files no row
+    references any more.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._writing = threading.local()
+
+    def get_available_name(self, name, max_length=None):
+        if name == getattr(self._writing, 'name', None):
+            # FileSystemStorage._save found the file created since the exists()
+            # check and asks for another name; end its retry loop instead
+            raise FileExistsError(name)
+        # The final name is derived from the content in _save, and an existing
+        # file with that name is the same content, so never add a suffix
+        return name
+
+    def _save(self, name, content):
+        digest = getattr(content, 'sha256', None) or self.hash_content(content)
+        file_type = getattr(content, 'sniffed_type', None) or self.sniff_content(content)
+        name = self.content_name(name, digest, file_type)
+
+        if self.exists(name):
+            return name
+        self._writing.name = name
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            if not self.exists(name):
+                raise
+            # Another request stored the same content at the same moment
+            return name
+        finally:
+            self._writing.name = None
+
+    def content_name(self, name, digest, file_type):
+        """
+        Content-addressed name for a file called ``name``
+
+        Args:
+            name: Name the file was saved under; only its directory is kept
+            digest: SHA-256 of the content
+            file_type: Format sniffed from the content (see sniff_image_type)
+        """
+        directory = posixpath.dirname(name)
+        extension = TYPE_EXTENSIONS[file_type][0] if file_type in TYPE_EXTENSIONS else ''
+        return posixpath.join(directory, digest[:2], digest[2:4], f'{digest}{extension}')
+
+    @staticmethod
+    def hash_content(content):
+        hasher = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            hasher.update(chunk)
+        content.seek(0)
+        return hasher.hexdigest()
+
+    @staticmethod
+    def sniff_content(content):
+        content.seek(0)
+        header = content.read(SNIFF_BYTES)
+        content.seek(0)
+        return sniff_image_type(header)
+
+
+marksheet_storage = ContentAddressedStorage()
+
+
+def get_marksheet_storage():
+    """Storage used by MarksheetUpload.image (callable so migrations stay stable)"""
+    return marksheet_storage
@@ -0,0 +1,121 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from marksheet_ocr.models import Mark, MarksheetUpload, Student, SubjectSummary, SubjectTrend
+from marksheet_ocr.services.analytics import SubjectAnalytics
+from marksheet_ocr.services.archive import UploadArchiver
+from marksheet_ocr.services.processing import UploadProcessor
+
+from .utils import completed_upload, student_record
+
+
+STATS = ['students', 'passed', 'marks_obtained', 'marks_maximum', 'histogram', 'grades']
+
+
+def snapshot():
+    """Every summary and trend row, comparable across rebuilds"""
+    def row(obj, *keys):
+        return tuple(keys) + tuple(json.dumps(getattr(obj, field), sort_keys=True) for field in STATS)
+
+    summaries = sorted(
+        row(summary, summary.upload_id, summary.subject.code, summary.period)
+        for summary in SubjectSummary.objects.select_related('subject')
+    )
+    trends = sorted(
+        row(trend, trend.subject.code, trend.period, trend.sheets)
+        for trend in SubjectTrend.objects.select_related('subject')
+    )
+    return summaries, trends
+
+
+class IncrementalAnalyticsTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first = completed_upload(
+                student_record(1, ('PHY', 48, 17, 35, 10), ('HIN', 52, 18, None, None)),
+                student_record(2, ('PHY', 20, 10, 40, 12), ('HIN', 81, None, None, None)),
+            )
+            self.second = completed_upload(
+                student_record(7, ('HIN', 30, 5, None, None), ('ENG', 66, 20, None, None)),
+            )
+            # A month earlier, so it lands in another trend period
+            self.older = completed_upload(student_record(9, ('ENG', 90, 10, None, None)))
+        MarksheetUpload.objects.filter(pk=self.older.pk).update(uploaded_at=timezone.now() - timedelta(days=40))
+        SubjectAnalytics().rebuild()
+
+    def assertMatchesRebuild(self):
+        incremental = snapshot()
+        SubjectAnalytics().rebuild()
+        self.assertEqual(incremental, snapshot())
+
+    def test_rebuild_counts_every_upload_and_subject(self):
+        summaries, _ = snapshot()
+
+        self.assertEqual(len(summaries), 5)
+        self.assertEqual(SubjectTrend.objects.filter(subject__code='HIN').get().sheets, 2)
+        self.assertEqual(SubjectTrend.objects.filter(subject__code='ENG').count(), 2)
+
+    def test_mark_edited(self):
+        mark = Mark.objects.get(student__roll_number='2', subject__code='PHY')
+        mark.theory_ese = 70
+        with self.captureOnCommitCallbacks(execute=True):
+            mark.save()
+
+        self.assertMatchesRebuild()
+
+    def test_student_added_and_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            UploadProcessor().save_student(self.second, student_record(8, ('HIN', 12, 3, None, None)))
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Student.objects.get(roll_number='1').delete()
+        self.assertMatchesRebuild()
+
+    def test_upload_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.delete()
+
+        self.assertMatchesRebuild()
+        self.assertFalse(SubjectSummary.objects.filter(upload_id=self.first.pk).exists())
+
+    def test_archived_upload_still_counts(self):
+        before = snapshot()
+        UploadArchiver().archive(self.first)
+
+        self.assertEqual(snapshot(), before)
+        self.assertMatchesRebuild()
+
+    def test_reprocessing_replaces_the_counts(self):
+        students = [{
+            'roll_number': '3', 'name': 'Student 3',
+            'subjects': [{'code': 'PHY', 'name': 'Subject PHY', 'theory_ese': 90, 'theory_internal': 9}],
+        }]
+        with mock.patch('marksheet_ocr.services.processing.AIExtractor'), \
+                mock.patch('marksheet_ocr.services.processing.DerivativeStore'), \
+                mock.patch.object(UploadProcessor, 'extract_adaptive', return_value=(students, 1024)), \
+                mock.patch.object(UploadProcessor, 'correct_inconsistent', side_effect=lambda *args: args[2]), \
+                mock.patch.object(UploadProcessor, 'record_usage'), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(UploadProcessor().process(self.first, replace_students=True))
+
+        self.assertEqual(Student.objects.filter(upload=self.first).count(), 1)
+        # HIN is gone from the upload, PHY now counts one student
+        self.assertEqual(
+            list(SubjectSummary.objects.filter(upload=self.first).values_list('subject__code', 'students')),
+            [('PHY', 1)],
+        )
+        self.assertMatchesRebuild()
+
+    def test_rebuild_replaces_stale_rows(self):
+        SubjectSummary.objects.filter(upload=self.first).update(students=99)
+        SubjectTrend.objects.all().update(sheets=0)
+
+        SubjectAnalytics().rebuild()
+
+        self.assertEqual(SubjectSummary.objects.filter(upload=self.first, subject__code='PHY').get().students, 2)
+        self.assertFalse(SubjectTrend.objects.filter(sheets=0).exists())
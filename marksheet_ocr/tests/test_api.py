@@ -0,0 +1,82 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+
+from marksheet_ocr.models import ApiSubmission, ApiToken, MarksheetUpload
+
+from .utils import TempMediaMixin, image_bytes
+
+
+class SubmissionApiTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.token = ApiToken.objects.create(name='scanner')
+        self.url = reverse('api_uploads')
+
+    def submit(self, files, key='batch-1', token=None):
+        headers = {'HTTP_AUTHORIZATION': f'Token {(token or self.token).key}'}
+        if key is not None:
+            headers['HTTP_IDEMPOTENCY_KEY'] = key
+        return self.client.post(self.url, {'image': files}, **headers)
+
+    def test_requires_token(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Token wrong')
+        self.assertEqual(response.status_code, 401)
+
+    def test_requires_idempotency_key(self):
+        response = self.submit([SimpleUploadedFile('a.png', image_bytes())], key=None)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(MarksheetUpload.objects.exists())
+
+    def test_retry_returns_original_jobs(self):
+        response = self.submit([
+            SimpleUploadedFile('a.png', image_bytes()),
+            SimpleUploadedFile('b.jpg', image_bytes('JPEG', color=(0, 90, 0))),
+        ])
+        self.assertEqual(response.status_code, 202)
+        first = response.json()
+
+        retry = self.submit([SimpleUploadedFile('a.png', image_bytes())])
+
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first)
+        self.assertEqual(MarksheetUpload.objects.count(), 2)
+        self.assertEqual(ApiSubmission.objects.count(), 1)
+
+    def test_same_key_is_per_token(self):
+        other = ApiToken.objects.create(name='office')
+        self.submit([SimpleUploadedFile('a.png', image_bytes())])
+
+        response = self.submit([SimpleUploadedFile('a.png', image_bytes())], token=other)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(ApiSubmission.objects.count(), 2)
+
+    def test_invalid_file_saves_nothing_and_frees_the_key(self):
+        response = self.submit([
+            SimpleUploadedFile('a.png', image_bytes()),
+            SimpleUploadedFile('notes.png', b'not an image'),
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('notes.png', response.json()['errors'][0])
+        self.assertFalse(MarksheetUpload.objects.exists())
+
+        response = self.submit([SimpleUploadedFile('a.png', image_bytes())])
+        self.assertEqual(response.status_code, 202)
+
+    def test_status_is_scoped_to_the_token(self):
+        upload_id = self.submit([SimpleUploadedFile('a.png', image_bytes())]).json()['uploads'][0]['id']
+        unrelated = MarksheetUpload.objects.create(image='marksheets/other.png')
+        other = ApiToken.objects.create(name='office')
+
+        own = self.client.get(
+            self.url, {'ids': f'{upload_id},{unrelated.id}'}, HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        ).json()
+        foreign = self.client.get(
+            self.url, {'ids': str(upload_id)}, HTTP_AUTHORIZATION=f'Token {other.key}'
+        ).json()
+
+        self.assertEqual([job['id'] for job in own['uploads']], [upload_id])
+        self.assertEqual(foreign['uploads'], [])
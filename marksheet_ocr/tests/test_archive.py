@@ -0,0 +1,91 @@
+from django.test import TestCase
+
+from marksheet_ocr.models import MarksheetUpload, Student, SubjectSummary, UploadArchive
+from marksheet_ocr.services.archive import UploadArchiver
+from marksheet_ocr.services.records import ExtractedStudent
+
+from .utils import completed_upload, student_record
+
+
+def saved_records(upload):
+    students = Student.objects.filter(upload=upload).prefetch_related('marks__subject').order_by('roll_number')
+    return [ExtractedStudent.from_model(student) for student in students]
+
+
+def summaries():
+    return sorted(SubjectSummary.objects.values_list(
+        'upload_id', 'subject__code', 'students', 'passed', 'marks_obtained', 'marks_maximum'
+    ))
+
+
+class UploadArchiverTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload = completed_upload(
+                student_record(1, ('PHY', 48, 17, 35, 10), ('HIN', 52, 18, None, None)),
+                student_record(2, ('PHY', 20, 10, 40, 12), ('HIN', 61, None, None, None)),
+            )
+        self.records = saved_records(self.upload)
+
+    def test_archive_replaces_rows_with_one_archive(self):
+        before = summaries()
+        self.assertEqual(len(before), 2)
+
+        students, marks, size = UploadArchiver().archive(self.upload)
+
+        self.assertEqual((students, marks), (2, 4))
+        self.upload.refresh_from_db()
+        self.assertEqual(self.upload.status, 'archived')
+        self.assertFalse(Student.objects.filter(upload=self.upload).exists())
+        archive = UploadArchive.objects.get(upload=self.upload)
+        self.assertEqual((archive.students, archive.marks, len(archive.payload)), (2, 4, size))
+        self.assertEqual(UploadArchiver().records(self.upload), self.records)
+        # Archived marks still count towards the analytics
+        self.assertEqual(summaries(), before)
+
+    def test_restore_round_trip(self):
+        before = summaries()
+        archiver = UploadArchiver()
+        archiver.archive(self.upload)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            restored = archiver.restore(MarksheetUpload.objects.get(pk=self.upload.pk))
+
+        self.assertEqual(restored, 2)
+        self.upload.refresh_from_db()
+        self.assertEqual(self.upload.status, 'completed')
+        self.assertFalse(UploadArchive.objects.exists())
+        self.assertEqual(saved_records(self.upload), self.records)
+        self.assertEqual(summaries(), before)
+
+    def test_only_completed_uploads_are_archived(self):
+        self.upload.set_progress(status='processing')
+        with self.assertRaises(ValueError):
+            UploadArchiver().archive(self.upload)
+        with self.assertRaises(ValueError):
+            UploadArchiver().restore(self.upload)
+
+    def test_document_is_archived_page_by_page(self):
+        document = MarksheetUpload.objects.create(image='marksheets/batch.pdf', page_count=2, status='completed')
+        for number, roll_number in ((1, 5), (2, 3)):
+            completed_upload(student_record(roll_number, ('ENG', 50, 20, None, None)),
+                             parent=document, page_number=number)
+        archiver = UploadArchiver()
+
+        archiver.archive(document)
+
+        self.assertEqual(UploadArchive.objects.filter(upload__parent=document).count(), 2)
+        self.assertEqual(set(document.pages.values_list('status', flat=True)), {'archived'})
+        self.assertEqual([record.roll_number for record in archiver.records(document)], ['3', '5'])
+
+        document.refresh_from_db()
+        self.assertEqual(archiver.restore(document), 2)
+        self.assertEqual(Student.objects.filter(upload__parent=document).count(), 2)
+        self.assertEqual(MarksheetUpload.objects.get(pk=document.pk).status, 'completed')
+
+    def test_archivable_skips_pages_and_recent_uploads(self):
+        MarksheetUpload.objects.filter(pk=self.upload.pk).update(uploaded_at='2020-01-01T00:00:00Z')
+        completed_upload(parent=self.upload, page_number=1)
+        completed_upload()
+
+        self.assertEqual(list(UploadArchiver().archivable(30)), [MarksheetUpload.objects.get(pk=self.upload.pk)])
@@ -0,0 +1,189 @@
+import hashlib
+import io
+from unittest import mock
+
+import pypdfium2
+from django.core.files.base import ContentFile
+from django.test import TestCase
+from PIL import Image
+
+from marksheet_ocr.models import MarksheetUpload
+from marksheet_ocr.services.documents import DocumentSplitter, count_pages
+from marksheet_ocr.services.processing import UploadProcessor
+
+from .utils import TempMediaMixin, image_bytes
+
+
+def pdf_bytes(pages, size=(300, 400)):
+    """Blank PDF with the given number of pages, ``size`` in points"""
+    document = pypdfium2.PdfDocument.new()
+    for _ in range(pages):
+        document.new_page(*size)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    document.close()
+    return buffer.getvalue()
+
+
+class DocumentTestMixin(TempMediaMixin):
+    def document(self, name, data, **fields):
+        with io.BytesIO(data) as source:
+            page_count = count_pages(source)
+        document = MarksheetUpload(page_count=page_count, **fields)
+        document.image.save(name, ContentFile(data))
+        return document
+
+
+class DocumentSplitterTests(DocumentTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.splitter = DocumentSplitter()
+
+    def test_split_tiff(self):
+        document = self.document('gazette.tif', image_bytes('TIFF', frames=3))
+
+        pages = self.splitter.split(document)
+
+        self.assertEqual(document.page_count, 3)
+        self.assertEqual([page.page_number for page in pages], [1, 2, 3])
+        self.assertTrue(all(page.parent_id == document.id and not page.image for page in pages))
+
+    def test_split_pdf(self):
+        document = self.document('gazette.pdf', pdf_bytes(2))
+
+        pages = self.splitter.split(document)
+
+        self.assertEqual([page.page_number for page in pages], [1, 2])
+
+    def test_split_only_creates_missing_pages(self):
+        document = self.document('gazette.tif', image_bytes('TIFF', frames=3))
+        second = MarksheetUpload.objects.create(parent=document, page_number=2, status='completed')
+
+        pages = self.splitter.split(document)
+
+        self.assertEqual([page.page_number for page in pages], [1, 2, 3])
+        self.assertEqual(pages[1], second)
+        self.assertEqual(self.splitter.split(document), pages)
+
+    def test_rasterize_tiff_frame(self):
+        document = self.document('gazette.tif', image_bytes('TIFF', size=(80, 60), frames=3))
+        page = self.splitter.split(document)[2]
+
+        self.splitter.rasterize(page, max_size=40)
+
+        page.refresh_from_db()
+        with page.image.open('rb') as stored:
+            data = stored.read()
+        self.assertEqual(page.content_hash, hashlib.sha256(data).hexdigest())
+        with Image.open(io.BytesIO(data)) as image:
+            self.assertLessEqual(max(image.size), 40)
+            # Frames are told apart by their blue channel (see image_bytes)
+            self.assertEqual(image.convert('RGB').getpixel((0, 0))[2], 2)
+
+    def test_rasterize_pdf_page_within_max_size(self):
+        document = self.document('gazette.pdf', pdf_bytes(2))
+        page = self.splitter.split(document)[1]
+
+        self.splitter.rasterize(page, max_size=200)
+
+        with page.image.open('rb') as stored, Image.open(stored) as image:
+            self.assertEqual(image.mode, 'L')
+            self.assertEqual(max(image.size), 200)
+
+
+class RefreshProgressTests(TestCase):
+    def setUp(self):
+        self.document = MarksheetUpload.objects.create(
+            image='marksheets/gazette.pdf', page_count=3, status='processing', stage='extracting'
+        )
+        self.pages = [
+            MarksheetUpload.objects.create(parent=self.document, page_number=number, status='processing')
+            for number in (1, 2, 3)
+        ]
+
+    def finish(self, *statuses):
+        for page, status in zip(self.pages, statuses):
+            MarksheetUpload.objects.filter(pk=page.pk).update(status=status)
+        DocumentSplitter().refresh_progress(self.document.id)
+        self.document.refresh_from_db()
+
+    def test_still_extracting(self):
+        self.finish('completed', 'failed')
+
+        self.assertEqual((self.document.status, self.document.stage), ('processing', 'extracting'))
+        self.assertEqual(self.document.pages_finished, 2)
+
+    def test_completed_when_every_page_succeeded(self):
+        self.finish('completed', 'completed', 'completed')
+
+        self.assertEqual((self.document.status, self.document.stage), ('completed', 'done'))
+        self.assertIsNone(self.document.error_message)
+
+    def test_completed_when_some_pages_failed(self):
+        self.finish('completed', 'failed', 'completed')
+
+        self.assertEqual(self.document.status, 'completed')
+        self.assertEqual(self.document.error_message, '1 of 3 page(s) failed.')
+
+    def test_failed_when_every_page_failed(self):
+        self.finish('failed', 'failed', 'failed')
+
+        self.assertEqual((self.document.status, self.document.stage), ('failed', 'done'))
+        self.assertEqual(self.document.error_message, 'No page of the document could be extracted.')
+
+
+class ProcessDocumentTests(DocumentTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        executor = mock.patch('marksheet_ocr.services.processing._get_executor')
+        self.submit = executor.start().return_value.submit
+        self.addCleanup(executor.stop)
+
+    def submitted(self):
+        return [call.args[1:] for call in self.submit.call_args_list]
+
+    def test_pages_are_queued_on_the_pool(self):
+        document = self.document('gazette.tif', image_bytes('TIFF', frames=2))
+
+        self.assertTrue(UploadProcessor().process(document))
+
+        pages = list(document.pages.order_by('page_number'))
+        self.assertEqual(self.submitted(), [(page.id, False) for page in pages])
+        self.assertEqual({(page.status, page.stage) for page in pages}, {('pending', 'queued')})
+        document.refresh_from_db()
+        self.assertEqual((document.status, document.stage), ('processing', 'extracting'))
+
+    def test_completed_pages_are_only_queued_when_replacing(self):
+        document = self.document('gazette.tif', image_bytes('TIFF', frames=2))
+        done = MarksheetUpload.objects.create(parent=document, page_number=1, status='completed')
+
+        UploadProcessor().process_document(document)
+        self.assertEqual(len(self.submitted()), 1)
+        self.assertNotEqual(self.submitted()[0][0], done.id)
+
+        self.submit.reset_mock()
+        UploadProcessor().process_document(document, replace_students=True)
+        self.assertEqual(len(self.submitted()), 2)
+        self.assertEqual(self.submitted()[0], (done.id, True))
+
+    def test_document_with_every_page_done_is_recounted(self):
+        document = self.document('gazette.tif', image_bytes('TIFF', frames=2))
+        for number in (1, 2):
+            MarksheetUpload.objects.create(parent=document, page_number=number, status='completed')
+
+        self.assertTrue(UploadProcessor().process_document(document))
+
+        self.submit.assert_not_called()
+        document.refresh_from_db()
+        self.assertEqual((document.status, document.pages_finished), ('completed', 2))
+
+    def test_split_failure_fails_the_document(self):
+        document = self.document('gazette.pdf', pdf_bytes(1))
+
+        with mock.patch.object(DocumentSplitter, 'split', side_effect=ValueError('Could not read PDF')), \
+                self.assertLogs('marksheet_ocr.services.processing', 'ERROR'):
+            self.assertFalse(UploadProcessor().process_document(document))
+
+        document.refresh_from_db()
+        self.assertEqual((document.status, document.error_message), ('failed', 'Could not read PDF'))
+        self.submit.assert_not_called()
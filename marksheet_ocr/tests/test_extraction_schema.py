@@ -0,0 +1,58 @@
+from django.test import SimpleTestCase
+
+from marksheet_ocr.services.extraction_schema import decode_response
+
+
+def response(*rows, **student):
+    return {
+        'subjects': [['01', 'HINDI'], ['02', 'PHYSICS']],
+        'students': [{'r': 2301, 'n': 'Ravi Kumar', 'k': list(rows), **student}],
+    }
+
+
+class DecodeResponseTests(SimpleTestCase):
+    def test_expands_compact_rows(self):
+        students = decode_response(response([0, 52, 18, None, None], [1, 40, 20, 25, 5], p=53.33, s='PASS'))
+
+        self.assertEqual(students, [{
+            'roll_number': '2301', 'name': 'Ravi Kumar', 'father_name': '', 'mother_name': '',
+            'enrollment_number': '',
+            'subjects': [
+                {'code': '01', 'name': 'HINDI', 'theory_ese': 52, 'theory_internal': 18,
+                 'practical': None, 'practical_internal': None},
+                {'code': '02', 'name': 'PHYSICS', 'theory_ese': 40, 'theory_internal': 20,
+                 'practical': 25, 'practical_internal': 5},
+            ],
+            'percentage': 53.33, 'result': 'PASS',
+        }])
+
+    def test_out_of_range_subject_index_is_dropped(self):
+        students = decode_response(response([0, 52, 18], [2, 40, 20], [-1, 30, 10], [None, 1], []))
+
+        self.assertEqual([subject['code'] for subject in students[0]['subjects']], ['01'])
+
+    def test_short_row_is_padded_with_none(self):
+        subject = decode_response(response([1, 40]))[0]['subjects'][0]
+
+        self.assertEqual(subject, {
+            'code': '02', 'name': 'PHYSICS', 'theory_ese': 40, 'theory_internal': None,
+            'practical': None, 'practical_internal': None,
+        })
+
+    def test_incomplete_subject_entries(self):
+        payload = response([0, 50], [1, 60])
+        payload['subjects'] = [['01'], None]
+
+        subjects = decode_response(payload)[0]['subjects']
+
+        self.assertEqual([(subject['code'], subject['name']) for subject in subjects], [('01', ''), ('', '')])
+
+    def test_verbose_list_is_passed_through(self):
+        verbose = [{'roll_number': '1', 'name': 'Asha', 'subjects': []}]
+
+        self.assertIs(decode_response(verbose), verbose)
+
+    def test_missing_students_list(self):
+        for payload in ({'subjects': []}, {'students': None}, 'text', None):
+            with self.subTest(payload=payload), self.assertRaisesMessage(ValueError, '"students" list'):
+                decode_response(payload)
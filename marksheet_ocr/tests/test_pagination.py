@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from marksheet_ocr.models import MarksheetUpload
+from marksheet_ocr.pagination import InvalidCursor, KeysetPaginator
+
+
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        # Pairs share a timestamp, so the id has to break the ties
+        for index in range(7):
+            upload = MarksheetUpload.objects.create(image=f'marksheets/{index}.png')
+            MarksheetUpload.objects.filter(pk=upload.pk).update(uploaded_at=now - timedelta(hours=index // 2))
+
+    def walk(self, paginator):
+        pages = []
+        cursor = None
+        while True:
+            page = paginator.page(cursor)
+            pages.append([upload.id for upload in page])
+            if not page.has_next:
+                return pages
+            cursor = page.next_cursor
+
+    def test_pages_cover_every_row_once_in_order(self):
+        ordering = ('-uploaded_at', '-id')
+        paginator = KeysetPaginator(MarksheetUpload.objects.all(), ordering, per_page=3)
+
+        pages = self.walk(paginator)
+
+        expected = list(MarksheetUpload.objects.order_by(*ordering).values_list('id', flat=True))
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual([upload_id for page in pages for upload_id in page], expected)
+
+    def test_ascending_ordering(self):
+        paginator = KeysetPaginator(MarksheetUpload.objects.all(), ('uploaded_at', 'id'), per_page=4)
+
+        pages = self.walk(paginator)
+
+        expected = list(MarksheetUpload.objects.order_by('uploaded_at', 'id').values_list('id', flat=True))
+        self.assertEqual(pages[0] + pages[1], expected)
+
+    def test_last_full_page_has_no_next(self):
+        paginator = KeysetPaginator(MarksheetUpload.objects.all(), ('-id',), per_page=7)
+
+        page = paginator.page()
+
+        self.assertEqual(len(page), 7)
+        self.assertFalse(page.has_next)
+
+    def test_invalid_cursor(self):
+        paginator = KeysetPaginator(MarksheetUpload.objects.all(), ('-uploaded_at', '-id'))
+
+        for cursor in ('garbage', 'WzFd', paginator.encode_cursor(MarksheetUpload.objects.first()) + 'x'):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+
+    def test_history_view(self):
+        response = self.client.get(reverse('upload_history'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['uploads']), 7)
+
+        self.assertEqual(self.client.get(reverse('upload_history'), {'cursor': 'garbage'}).status_code, 404)
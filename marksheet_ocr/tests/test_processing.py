@@ -0,0 +1,76 @@
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+
+from marksheet_ocr.models import MarksheetUpload
+from marksheet_ocr.services.processing import UploadProcessor
+
+from .utils import TempMediaMixin, image_bytes
+
+
+def student(roll_number, percentage, ese=52):
+    # 52 + 18 of 100 marks gives 70%
+    return {
+        'roll_number': roll_number,
+        'name': f'Student {roll_number}',
+        'subjects': [{'code': 'HIN', 'name': 'Hindi', 'theory_ese': ese, 'theory_internal': 18}],
+        'percentage': percentage,
+    }
+
+
+class CorrectInconsistentTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload = MarksheetUpload()
+        self.upload.image.save('scan.png', ContentFile(image_bytes('PNG', size=(40, 30))))
+        self.extractor = mock.Mock()
+        self.extractor.validate_student_data.return_value = True
+        self.students = [student('101', 70), student('102', 80)]
+
+    def correct(self, resolution, resolutions):
+        return UploadProcessor().correct_inconsistent(
+            self.upload, self.extractor, self.students, resolution, resolutions
+        )
+
+    def test_correction_with_fewer_problems_is_merged(self):
+        corrected = student('102', 80, ese=62)
+        self.extractor.extract_students.return_value = [corrected]
+
+        merged = self.correct(20, [20, 60])
+
+        self.assertEqual(merged, [self.students[0], corrected])
+        call = self.extractor.extract_students.call_args
+        self.assertEqual((call.args[1], call.kwargs), (['102'], {'max_size': 60}))
+        self.assertTrue(call.args[0].endswith('.png'))
+
+    def test_correction_with_as_many_problems_is_discarded(self):
+        self.extractor.extract_students.return_value = [student('102', 90)]
+
+        self.assertEqual(self.correct(20, [20, 60]), self.students)
+
+    def test_failed_re_read_keeps_the_original(self):
+        self.extractor.extract_students.side_effect = ValueError('Invalid JSON')
+
+        with self.assertLogs('marksheet_ocr.services.processing', 'WARNING'):
+            self.assertEqual(self.correct(20, [20, 60]), self.students)
+
+    def test_no_re_read_at_the_original_size(self):
+        # The 40px original was already sent whole at the 60px rung
+        self.assertEqual(self.correct(60, [60, 120]), self.students)
+
+        self.extractor.extract_students.assert_not_called()
+
+    def test_no_re_read_without_a_larger_rung_or_problems(self):
+        self.assertEqual(self.correct(20, [20]), self.students)
+
+        self.students = [student('101', 70)]
+        self.assertEqual(self.correct(20, [20, 60]), self.students)
+
+        self.extractor.extract_students.assert_not_called()
+
+    def test_at_original_size(self):
+        path = self.upload.image.path
+
+        self.assertTrue(UploadProcessor.at_original_size(path, 60))
+        self.assertFalse(UploadProcessor.at_original_size(path, 40))
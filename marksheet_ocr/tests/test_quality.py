@@ -0,0 +1,93 @@
+from django.test import SimpleTestCase, override_settings
+
+from marksheet_ocr.services.quality import find_problems, normalize_result, student_problems
+
+
+def student(roll_number='101', **overrides):
+    data = {
+        'roll_number': roll_number,
+        'name': 'Asha Verma',
+        'subjects': [
+            {'code': 'HIN', 'name': 'Hindi', 'theory_ese': '52', 'theory_internal': 18},
+            {'code': 'PHY', 'name': 'Physics', 'theory_ese': 40, 'theory_internal': '20',
+             'practical': 25, 'practical_internal': 5},
+        ],
+        # (70 + 60 + 30) of 300 marks
+        'percentage': '53.33%',
+        'result': 'PASS SECOND',
+    }
+    data.update(overrides)
+    return data
+
+
+class StudentProblemsTests(SimpleTestCase):
+    def test_consistent_student(self):
+        self.assertEqual(student_problems(student()), [])
+
+    def test_percentage_the_marks_do_not_give(self):
+        problems = student_problems(student(percentage='63.33'))
+
+        self.assertEqual(problems, ['stated percentage 63.33 but marks add up to 53.33'])
+
+    def test_percentage_within_tolerance(self):
+        self.assertEqual(student_problems(student(percentage=54)), [])
+
+    def test_marks_outside_range_and_not_numbers(self):
+        subjects = [
+            {'code': 'HIN', 'name': 'Hindi', 'theory_ese': 152},
+            {'code': 'ENG', 'name': 'English', 'theory_ese': 'x7', 'theory_internal': 10},
+        ]
+
+        problems = student_problems(student(subjects=subjects, percentage=None))
+
+        self.assertIn('theory_ese 152 in HIN is outside 0-100', problems)
+        self.assertIn("theory_ese 'x7' in ENG is not a number", problems)
+
+    def test_subject_without_marks(self):
+        subjects = [{'code': 'HIN', 'name': 'Hindi', 'theory_ese': 'AB'}]
+
+        problems = student_problems(student(subjects=subjects, percentage=None))
+
+        self.assertEqual(problems, ['no marks for subject HIN'])
+
+    def test_rejected_student(self):
+        self.assertEqual(student_problems(student(name='')), ['missing name'])
+        self.assertEqual(student_problems(['not', 'a', 'dict']), ['not an object'])
+
+    def test_validate_callback(self):
+        problems = student_problems(student(), validate=lambda data: False)
+
+        self.assertEqual(problems, ['missing roll number, name or subjects'])
+
+    def test_result_is_only_compared_when_asked(self):
+        # A failed ESE (24 < 33) by this app's rules; some boards still print PASS
+        subjects = [{'code': 'HIN', 'name': 'Hindi', 'theory_ese': 24, 'theory_internal': 46}]
+        data = student(subjects=subjects, percentage=70, result='Pass')
+
+        self.assertEqual(student_problems(data), [])
+        self.assertEqual(student_problems(data, check_result=True), ['stated result PASS but marks give FAIL'])
+        with override_settings(MARKSHEET_QUALITY_CHECK_RESULT=True):
+            self.assertEqual(len(student_problems(data)), 1)
+
+    def test_normalize_result(self):
+        self.assertEqual(normalize_result(' pass-first  division '), 'PASS FIRST DIVISION')
+        self.assertEqual(normalize_result(None), '')
+
+
+class FindProblemsTests(SimpleTestCase):
+    def test_nothing_extracted(self):
+        self.assertEqual(find_problems([]), ['no students extracted'])
+        self.assertEqual(find_problems({'students': []}), ['no students extracted'])
+
+    def test_problems_are_labelled_by_roll_number(self):
+        problems = find_problems([student(), student('102', percentage='90')])
+
+        self.assertEqual(problems, ['student 102: stated percentage 90 but marks add up to 53.33'])
+
+    def test_subject_count_outlier(self):
+        short = student('103', percentage=None)
+        short['subjects'] = short['subjects'][:1]
+
+        problems = find_problems([student(), student('102'), short])
+
+        self.assertEqual(problems, ['student 103: 1 subjects, most students have 2'])
@@ -0,0 +1,152 @@
+from django.test import SimpleTestCase, TestCase
+
+from marksheet_ocr.models import MarksheetUpload, Student
+from marksheet_ocr.services.processing import UploadProcessor
+from marksheet_ocr.services.records import (
+    ExtractedMark, ExtractedStudent, coerce_mark, coerce_percentage, coerce_student,
+    dump_records, load_records, pack_records, unpack_records,
+)
+
+
+def extracted(**overrides):
+    data = {
+        'roll_number': ' 2301 ',
+        'name': 'Ravi Kumar',
+        'father_name': 'Mohan Kumar',
+        'enrollment_number': 'EN-77',
+        'subjects': [
+            {'code': 'PHY', 'name': 'Physics', 'theory_ese': '48', 'theory_internal': 17.0,
+             'practical': '35', 'practical_internal': '...'},
+            {'code': 'HIN', 'name': 'हिन्दी', 'theory_ese': 'AB', 'theory_internal': 12},
+        ],
+        'percentage': '37.33%',
+        'result': 'PASS THIRD',
+    }
+    data.update(overrides)
+    return data
+
+
+class CoerceTests(SimpleTestCase):
+    def test_coerce_mark(self):
+        for value, expected in ((None, None), (41, 41), (41.0, 41), (' 41 ', 41), ('41.0', 41),
+                                ('...', None), ('ab', None), ('', None), ('N/A', None)):
+            with self.subTest(value=value):
+                self.assertEqual(coerce_mark(value), expected)
+
+    def test_coerce_mark_rejects(self):
+        for value in (True, 41.5, '41.5', 'x', '4l'):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                coerce_mark(value)
+
+    def test_coerce_percentage(self):
+        self.assertEqual(coerce_percentage('67.5%'), 67.5)
+        self.assertEqual(coerce_percentage(80), 80.0)
+        self.assertIsNone(coerce_percentage('n/a'))
+        self.assertIsNone(coerce_percentage(False))
+
+    def test_coerce_student(self):
+        record, problems = coerce_student(extracted())
+
+        self.assertEqual(problems, [])
+        self.assertEqual(record.roll_number, '2301')
+        self.assertEqual(record.mother_name, '')
+        self.assertEqual(record.reported_percentage, 37.33)
+        self.assertEqual(record.marks[0], ExtractedMark('PHY', 'Physics', 48, 17, 35, None))
+        self.assertEqual(record.marks[1], ExtractedMark('HIN', 'हिन्दी', None, 12, None, None))
+
+    def test_bad_mark_is_reported_but_kept_as_none(self):
+        data = extracted()
+        data['subjects'][0]['practical'] = 'twenty'
+
+        record, problems = coerce_student(data)
+
+        self.assertIsNotNone(record)
+        self.assertIsNone(record.marks[0].practical_marks)
+        self.assertEqual(problems, ["practical_marks 'twenty' in PHY is not a number"])
+
+    def test_mark_outside_range_is_reported_and_kept_as_none(self):
+        data = extracted()
+        data['subjects'][0]['theory_ese'] = 148
+        data['subjects'][1]['theory_internal'] = -2
+
+        record, problems = coerce_student(data)
+
+        self.assertEqual((record.marks[0].theory_ese, record.marks[1].theory_internal), (None, None))
+        self.assertEqual(record.marks[0].theory_internal, 17)
+        self.assertEqual(problems, [
+            'theory_ese 148 in PHY is outside 0-100', 'theory_internal -2 in HIN is outside 0-100',
+        ])
+
+    def test_rejected_students(self):
+        for data, problem in (
+            (extracted(roll_number=''), 'missing roll number'),
+            (extracted(subjects=[]), 'no subjects'),
+            (extracted(subjects=[{'name': 'Physics', 'theory_ese': 40}]), 'subject without code or name'),
+            ('text', 'not an object'),
+        ):
+            with self.subTest(problem=problem):
+                record, problems = coerce_student(data)
+                self.assertIsNone(record)
+                self.assertIn(problem, problems)
+
+    def test_summary(self):
+        record, _ = coerce_student(extracted())
+
+        # Physics theory and practical (200) plus Hindi theory (100)
+        self.assertEqual(record.summary(), {'total': 112, 'maximum': 300, 'percentage': 37.33, 'result': 'PASS'})
+
+        record.marks[0].theory_ese = 30
+        self.assertEqual(record.summary()['result'], 'FAIL')
+        self.assertEqual(ExtractedStudent('1', 'Empty').summary()['result'], 'N/A')
+
+
+class CompactFormTests(SimpleTestCase):
+    def records(self):
+        return [
+            coerce_student(extracted())[0],
+            coerce_student(extracted(roll_number='2302', name='Sita', percentage=None, result=''))[0],
+        ]
+
+    def test_dump_load_round_trip(self):
+        records = self.records()
+
+        self.assertEqual(load_records(dump_records(records)), records)
+        self.assertEqual(load_records(None), [])
+
+    def test_pack_unpack_round_trip(self):
+        records = self.records()
+
+        payload = pack_records(records)
+
+        self.assertIsInstance(payload, bytes)
+        self.assertEqual(unpack_records(payload), records)
+        self.assertEqual(unpack_records(memoryview(payload)), records)
+
+
+class SavedRecordTests(TestCase):
+    def test_saved_student_matches_its_record(self):
+        record, _ = coerce_student(extracted())
+        upload = MarksheetUpload.objects.create(image='marksheets/scan.png')
+        UploadProcessor().save_student(upload, record)
+
+        student = Student.objects.prefetch_related('marks__subject').get()
+        saved = ExtractedStudent.from_model(student)
+
+        self.assertEqual(sorted(saved.marks, key=lambda m: m.subject_code), record.sorted_marks())
+        self.assertEqual(saved.reported_percentage, record.reported_percentage)
+        summary = student.get_summary()
+        self.assertEqual(
+            {key: summary[key] for key in ('total', 'maximum', 'percentage', 'result')}, record.summary()
+        )
+
+    def test_mark_outside_range_is_not_saved(self):
+        data = extracted()
+        data['subjects'][0]['practical'] = 350
+        record, _ = coerce_student(data)
+        upload = MarksheetUpload.objects.create(image='marksheets/scan.png')
+
+        UploadProcessor().save_student(upload, record)
+
+        mark = Student.objects.get().marks.get(subject__code='PHY')
+        self.assertIsNone(mark.practical_marks)
+        self.assertEqual(mark.theory_ese, 48)
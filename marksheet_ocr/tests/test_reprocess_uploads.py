@@ -0,0 +1,120 @@
+import io
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from marksheet_ocr.models import MarksheetUpload
+from marksheet_ocr.services.processing import UploadProcessor
+
+
+class ReprocessUploadsTests(TransactionTestCase):
+    def setUp(self):
+        self.processed = []
+        self.failing = set()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.checkpoint = os.path.join(directory, 'reprocess.checkpoint')
+
+    def fake_process(self, processor, upload, replace_students=False):
+        self.processed.append(upload.id)
+        ok = upload.id not in self.failing
+        MarksheetUpload.objects.filter(pk=upload.pk).update(status='completed' if ok else 'failed')
+        return ok
+
+    def run_command(self, **options):
+        out = io.StringIO()
+        with mock.patch.object(UploadProcessor, 'process', autospec=True, side_effect=self.fake_process):
+            call_command('reprocess_uploads', stdout=out, stderr=io.StringIO(), **options)
+        return out.getvalue()
+
+    def upload(self, status, minutes_idle=0, **fields):
+        upload = MarksheetUpload.objects.create(image='marksheets/scan.png', status=status, **fields)
+        MarksheetUpload.objects.filter(pk=upload.pk).update(
+            updated_at=timezone.now() - timedelta(minutes=minutes_idle)
+        )
+        return upload
+
+    def test_default_selects_failed_and_stuck_uploads(self):
+        failed = self.upload('failed')
+        stuck = self.upload('processing', minutes_idle=45)
+        self.upload('processing', minutes_idle=5)
+        self.upload('completed')
+        self.upload('pending')
+
+        output = self.run_command()
+
+        self.assertEqual(sorted(self.processed), [failed.id, stuck.id])
+        self.assertIn('Reprocessed 2 upload(s), 0 failed', output)
+
+    def test_filters(self):
+        failed = self.upload('failed', error_message='Rate limit exceeded')
+        other = self.upload('failed', error_message='Invalid JSON')
+        completed = self.upload('completed')
+
+        self.run_command(error_contains='rate limit')
+        self.assertEqual(self.processed, [failed.id])
+
+        self.processed.clear()
+        self.run_command(status=['completed'], ids=f'{other.id},{completed.id}')
+        self.assertEqual(self.processed, [completed.id])
+
+    def test_document_pages_are_reprocessed_instead_of_the_document(self):
+        document = self.upload('failed', page_count=3)
+        failed_page = self.upload('failed', parent=document, page_number=1)
+        self.upload('completed', parent=document, page_number=2)
+
+        self.run_command()
+
+        missing_page = MarksheetUpload.objects.get(parent=document, page_number=3)
+        # Each page once, although the failed page also matched on its own
+        self.assertEqual(sorted(self.processed), [failed_page.id, missing_page.id])
+
+    def test_checkpoint_records_completed_uploads_only(self):
+        done = self.upload('failed')
+        broken = self.upload('failed')
+        self.failing.add(broken.id)
+
+        self.run_command(checkpoint=self.checkpoint)
+        with open(self.checkpoint) as f:
+            self.assertEqual(f.read().split(), [str(done.id)])
+
+        # The rerun skips the completed upload and retries the failure
+        MarksheetUpload.objects.filter(pk=done.pk).update(status='failed')
+        self.processed.clear()
+        output = self.run_command(checkpoint=self.checkpoint)
+        self.assertEqual(self.processed, [broken.id])
+        self.assertIn('Skipping 1 upload(s)', output)
+
+        self.run_command(checkpoint=self.checkpoint, checkpoint_failed=True)
+        with open(self.checkpoint) as f:
+            self.assertEqual(sorted(f.read().split()), sorted([str(done.id), str(broken.id)]))
+
+    def test_limit(self):
+        uploads = [self.upload('failed') for _ in range(3)]
+
+        self.run_command(limit=2, concurrency=1)
+
+        self.assertEqual(self.processed, [upload.id for upload in uploads[:2]])
+
+    def test_dry_run_changes_nothing(self):
+        failed = self.upload('failed')
+        document = self.upload('failed', page_count=2)
+
+        output = self.run_command(dry_run=True)
+
+        self.assertEqual(self.processed, [])
+        self.assertIn(f'#{failed.id} failed', output)
+        self.assertIn('[dry run] 1 upload(s) would be reprocessed.', output)
+        self.assertFalse(document.pages.exists())
+
+    def test_invalid_options(self):
+        with self.assertRaises(CommandError):
+            self.run_command(ids='1,two')
+        with self.assertRaises(CommandError):
+            self.run_command(concurrency=0)
@@ -0,0 +1,77 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from marksheet_ocr.models import Student, StudentSearchToken
+from marksheet_ocr.services.records import coerce_student
+from marksheet_ocr.services.search import StudentSearch, normalize_tokens
+
+from .utils import completed_upload, student_record
+
+
+class StudentSearchTests(TestCase):
+    def setUp(self):
+        self.search = StudentSearch()
+        completed_upload(
+            student_record('22A101', ('HIN', 60, 20, None, None), name='SMT. Inder-Bai'),
+            student_record('22A102', ('HIN', 25, 10, None, None), name='Ravi Kumar'),
+        )
+        completed_upload(student_record('23B201', ('HIN', 70, 15, None, None), name='Indira Rao'))
+        Student.objects.filter(roll_number='23B201').update(enrollment_number='EN-4471')
+
+    def found(self, query, **kwargs):
+        return [student.roll_number for student in self.search.search(query, **kwargs)]
+
+    def test_roll_number_prefix_in_any_case(self):
+        self.assertEqual(self.found('22a10'), ['22A101', '22A102'])
+        self.assertEqual(self.found('22A102'), ['22A102'])
+
+    def test_enrollment_number_prefix_in_any_case(self):
+        self.assertEqual(self.found('en-44'), ['23B201'])
+
+    def test_name_words_match_by_prefix(self):
+        self.assertEqual(self.found('ind'), ['22A101', '23B201'])
+        self.assertEqual(self.found('bai inder'), ['22A101'])
+        self.assertEqual(self.found('inder rao'), [])
+
+    def test_results_are_annotated_and_limited(self):
+        students = self.search.search('22a', limit=1)
+
+        self.assertEqual([student.roll_number for student in students], ['22A101'])
+        with self.assertNumQueries(0):
+            summary = students[0].get_summary()
+            students[0].upload.status
+        self.assertEqual((summary['total'], summary['maximum']), (80, 100))
+        self.assertEqual(self.search.search('22a102')[0].get_summary()['result'], 'FAIL')
+
+    def test_blank_query(self):
+        self.assertEqual(self.search.search('  '), [])
+
+    def test_extracted_numbers_are_stored_upper_cased(self):
+        record, _ = coerce_student({
+            'roll_number': ' 22c9 ', 'name': 'Asha', 'enrollment_number': 'en-9',
+            'subjects': [{'code': 'HIN', 'name': 'Hindi', 'theory_ese': 50}],
+        })
+
+        self.assertEqual((record.roll_number, record.enrollment_number), ('22C9', 'EN-9'))
+
+
+class RebuildSearchIndexTests(TestCase):
+    def test_rebuilds_the_name_tokens(self):
+        completed_upload(student_record(1, name='Inder Bai'), student_record(2, name='Ravi Kumar'))
+        StudentSearchToken.objects.all().delete()
+        self.assertEqual(StudentSearch().search('inder'), [])
+
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+
+        self.assertIn('Indexed 2 student(s).', out.getvalue())
+        self.assertEqual(
+            sorted(StudentSearchToken.objects.values_list('token', flat=True)), ['bai', 'inder', 'kumar', 'ravi']
+        )
+        self.assertEqual([student.name for student in StudentSearch().search('inder')], ['Inder Bai'])
+
+    def test_normalize_tokens(self):
+        self.assertEqual(normalize_tokens('SMT. INDER-BAI'), ['smt', 'inder', 'bai'])
+        self.assertEqual(normalize_tokens('Zoë  Müller'), ['zoe', 'muller'])
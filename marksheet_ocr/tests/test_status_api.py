@@ -0,0 +1,79 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from marksheet_ocr.models import MarksheetUpload
+
+
+class UploadStatusTests(TestCase):
+    def setUp(self):
+        self.upload = MarksheetUpload.objects.create(image='marksheets/scan.png')
+        self.url = reverse('upload_status', args=[self.upload.id])
+
+    def test_reports_progress(self):
+        self.upload.set_progress(stage='saving', status='processing', students_total=12, students_saved=5)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(payload['status'], 'processing')
+        self.assertEqual(payload['stage'], 'saving')
+        self.assertEqual((payload['students_total'], payload['students_saved']), (12, 5))
+        self.assertIsNone(payload['results_url'])
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_results_url_once_completed(self):
+        self.upload.set_progress(stage='done', status='completed')
+
+        payload = self.client.get(self.url).json()
+
+        self.assertEqual(payload['results_url'], reverse('view_results', args=[self.upload.id]))
+
+    def test_unknown_upload(self):
+        response = self.client.get(reverse('upload_status', args=[self.upload.id + 1]))
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_not_modified_until_progress_changes(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        self.upload.set_progress(stage='extracting', status='processing')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_lists_pages_of_a_document(self):
+        document = MarksheetUpload.objects.create(image='marksheets/batch.pdf', page_count=2)
+        first = MarksheetUpload.objects.create(parent=document, page_number=1, status='completed')
+        MarksheetUpload.objects.create(parent=document, page_number=2)
+
+        payload = self.client.get(reverse('upload_status', args=[document.id])).json()
+
+        self.assertEqual(payload['page_count'], 2)
+        self.assertEqual([page['page_number'] for page in payload['pages']], [1, 2])
+        self.assertEqual(payload['pages'][0]['status'], 'completed')
+        self.assertEqual(payload['pages'][0]['status_url'], reverse('upload_status', args=[first.id]))
+
+    def test_get_only(self):
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+        self.assertEqual(self.client.post(reverse('upload_events', args=[self.upload.id])).status_code, 405)
+
+
+class UploadEventsTests(TestCase):
+    async def test_finished_upload_ends_with_done_event(self):
+        upload = await MarksheetUpload.objects.acreate(
+            image='marksheets/scan.png', status='completed', stage='done', students_total=3, students_saved=3
+        )
+
+        response = await self.async_client.get(reverse('upload_events', args=[upload.id]))
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(body.startswith('retry: '))
+        self.assertIn('event: done\n', body)
+        self.assertIn('"students_saved": 3', body)
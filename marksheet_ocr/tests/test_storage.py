@@ -0,0 +1,125 @@
+import hashlib
+import os
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+
+from marksheet_ocr.models import MarksheetUpload
+from marksheet_ocr.services.derivatives import DERIVATIVES_DIR
+from marksheet_ocr.services.retention import MarksheetRetention
+from marksheet_ocr.storage import marksheet_storage
+
+from .utils import TempMediaMixin, image_bytes
+
+
+def age(name, hours=2):
+    """Backdate a stored file past the garbage collector's grace period"""
+    path = marksheet_storage.path(name)
+    then = time.time() - hours * 3600
+    os.utime(path, (then, then))
+
+
+def write_derivative(digest, spec='thumb.webp'):
+    """Write a derivative file the way DerivativeStore names them"""
+    name = f'{DERIVATIVES_DIR}/{digest[:2]}/{digest}-{spec}'
+    path = marksheet_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'derivative')
+    return name
+
+
+class ContentAddressedStorageTests(TempMediaMixin, TestCase):
+    def test_same_content_is_stored_once(self):
+        data = image_bytes('PNG')
+
+        first = marksheet_storage.save('marksheets/scan.png', ContentFile(data))
+        second = marksheet_storage.save('marksheets/rescan.png', ContentFile(data))
+
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertEqual(first, f'marksheets/{digest[:2]}/{digest[2:4]}/{digest}.png')
+        self.assertEqual(second, first)
+        self.assertEqual(os.listdir(os.path.dirname(marksheet_storage.path(first))), [f'{digest}.png'])
+
+    def test_extension_follows_the_content(self):
+        name = marksheet_storage.save('marksheets/scan.jpeg', ContentFile(image_bytes('JPEG')))
+        self.assertTrue(name.endswith('.jpg'))
+
+        name = marksheet_storage.save('marksheets/scan.tif', ContentFile(image_bytes('PNG')))
+        self.assertTrue(name.endswith('.png'))
+
+    def test_losing_a_race_to_the_same_content_returns_its_name(self):
+        data = image_bytes('PNG')
+        stored = marksheet_storage.save('marksheets/scan.png', ContentFile(data))
+        result = []
+
+        def save_again():
+            # As if the other writer finished between exists() and the write
+            with mock.patch.object(type(marksheet_storage), 'exists', side_effect=[False, True]):
+                result.append(marksheet_storage.save('marksheets/rescan.png', ContentFile(data)))
+
+        thread = threading.Thread(target=save_again, daemon=True)
+        thread.start()
+        thread.join(timeout=5)
+
+        self.assertFalse(thread.is_alive(), 'save() kept retrying the content name')
+        self.assertEqual(result, [stored])
+
+    def test_unknown_content_gets_no_extension(self):
+        name = marksheet_storage.save('marksheets/notes.html', ContentFile(b'<html></html>'))
+
+        self.assertEqual(os.path.splitext(name)[1], '')
+
+
+class GarbageCollectionTests(TempMediaMixin, TestCase):
+    def store(self, color):
+        data = image_bytes('PNG', color=color)
+        name = marksheet_storage.save('marksheets/scan.png', ContentFile(data))
+        return name, hashlib.sha256(data).hexdigest()
+
+    def test_removes_only_old_unreferenced_files(self):
+        kept, kept_hash = self.store((1, 0, 0))
+        orphan, orphan_hash = self.store((2, 0, 0))
+        young, _ = self.store((3, 0, 0))
+        MarksheetUpload.objects.create(image=kept, content_hash=kept_hash)
+        derivative = write_derivative(kept_hash)
+        stale_derivative = write_derivative(orphan_hash)
+        for name in (kept, orphan, derivative, stale_derivative):
+            age(name)
+
+        removed, freed = MarksheetRetention().collect_garbage(timedelta(hours=1))
+
+        self.assertEqual(removed, 2)
+        self.assertGreater(freed, 0)
+        for name in (kept, young, derivative):
+            self.assertTrue(marksheet_storage.exists(name), name)
+        for name in (orphan, stale_derivative):
+            self.assertFalse(marksheet_storage.exists(name), name)
+
+    def test_dry_run_keeps_files(self):
+        orphan, _ = self.store((4, 0, 0))
+        age(orphan)
+
+        removed, _ = MarksheetRetention(dry_run=True).collect_garbage(timedelta(hours=1))
+
+        self.assertEqual(removed, 1)
+        self.assertTrue(marksheet_storage.exists(orphan))
+
+    def test_deleting_an_upload_keeps_files_shared_with_another(self):
+        shared, shared_hash = self.store((5, 0, 0))
+        own, own_hash = self.store((6, 0, 0))
+        first = MarksheetUpload.objects.create(image=shared, content_hash=shared_hash)
+        MarksheetUpload.objects.create(image=shared, content_hash=shared_hash)
+        second = MarksheetUpload.objects.create(image=own, content_hash=own_hash)
+
+        deleted, removed, _ = MarksheetRetention().delete_uploads(
+            MarksheetUpload.objects.filter(pk__in=[first.pk, second.pk])
+        )
+
+        self.assertEqual((deleted, removed), (2, 1))
+        self.assertTrue(marksheet_storage.exists(shared))
+        self.assertFalse(marksheet_storage.exists(own))
@@ -0,0 +1,87 @@
+import hashlib
+import os
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from marksheet_ocr.models import ApiToken, MarksheetUpload
+from marksheet_ocr.upload_handlers import get_incoming_dir, max_upload_size, sniff_image_type
+
+from .utils import TempMediaMixin, image_bytes
+
+
+class SniffImageTypeTests(SimpleTestCase):
+    def test_known_signatures(self):
+        for format, expected in (('PNG', 'png'), ('JPEG', 'jpeg'), ('BMP', 'bmp'), ('TIFF', 'tiff')):
+            with self.subTest(format=format):
+                self.assertEqual(sniff_image_type(image_bytes(format)[:16]), expected)
+        self.assertEqual(sniff_image_type(b'%PDF-1.7\n'), 'pdf')
+
+    def test_unknown_content(self):
+        self.assertIsNone(sniff_image_type(b'<html><body>'))
+        self.assertIsNone(sniff_image_type(b''))
+
+    @override_settings(MARKSHEET_MAX_UPLOAD_SIZE=100, MARKSHEET_MAX_PDF_SIZE=500)
+    def test_documents_get_the_document_limit(self):
+        self.assertEqual(max_upload_size('png'), 100)
+        self.assertEqual(max_upload_size('pdf'), 500)
+        self.assertEqual(max_upload_size('tiff'), 500)
+
+
+class StreamingUploadTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.token = ApiToken.objects.create(name='scanner')
+
+    def submit(self, *files, key='batch'):
+        return self.client.post(
+            reverse('api_uploads'), {'image': list(files)},
+            HTTP_AUTHORIZATION=f'Token {self.token.key}', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_stores_file_under_its_hash(self):
+        data = image_bytes('JPEG')
+
+        response = self.submit(SimpleUploadedFile('scan.jpeg', data))
+
+        self.assertEqual(response.status_code, 202)
+        upload = MarksheetUpload.objects.get()
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertEqual(upload.content_hash, digest)
+        self.assertEqual(upload.image.name, f'marksheets/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        with upload.image.open('rb') as stored:
+            self.assertEqual(stored.read(), data)
+        # The streamed temp file was moved into place, not left behind
+        self.assertEqual(os.listdir(get_incoming_dir()), [])
+
+    def test_type_comes_from_the_content(self):
+        response = self.submit(SimpleUploadedFile('scan.png', b'GIF89a' + b'\x00' * 64))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Invalid file type', response.json()['errors'][0])
+
+    def test_extension_must_match_the_content(self):
+        response = self.submit(SimpleUploadedFile('scan.html', image_bytes('PNG')))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('is a PNG', response.json()['errors'][0])
+
+    @override_settings(MARKSHEET_MAX_UPLOAD_SIZE=2000)
+    def test_oversized_file_is_rejected(self):
+        data = image_bytes('PNG') + b'\x00' * 3000
+
+        response = self.submit(SimpleUploadedFile('scan.png', data))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('less than', response.json()['errors'][0])
+        self.assertFalse(MarksheetUpload.objects.exists())
+
+    @override_settings(MARKSHEET_MAX_UPLOAD_SIZE=1000, MARKSHEET_MAX_PDF_SIZE=1000, MARKSHEET_API_MAX_FILES=1)
+    def test_request_over_the_total_limit_is_refused_before_reading(self):
+        data = image_bytes('PNG') + b'\x00' * (2 * 1024 * 1024)
+
+        response = self.submit(SimpleUploadedFile('scan.png', data))
+
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(MarksheetUpload.objects.exists())
@@ -0,0 +1,202 @@
+import hashlib
+import io
+import os
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from marksheet_ocr.models import ApiToken, MarksheetUpload, UploadSession
+from marksheet_ocr.services.retention import MarksheetRetention
+from marksheet_ocr.services.upload_sessions import SessionFinalized, UploadSessionStore
+from marksheet_ocr.storage import marksheet_storage
+
+from .utils import TempMediaMixin, image_bytes
+
+
+@override_settings(MARKSHEET_UPLOAD_CHUNK_SIZE=256)
+class UploadSessionApiTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.auth = {'HTTP_AUTHORIZATION': f"Token {ApiToken.objects.create(name='scanner').key}"}
+        self.session = self.client.post(reverse('api_upload_sessions'), **self.auth).json()
+
+    def declare(self, name, size):
+        return self.client.post(
+            self.session['files_url'], {'name': name, 'size': size}, content_type='application/json', **self.auth
+        )
+
+    def put(self, file, offset, chunk):
+        return self.client.put(
+            f"{file['chunk_url']}?offset={offset}", chunk, content_type='application/octet-stream', **self.auth
+        )
+
+    def send(self, name, data):
+        file = self.declare(name, len(data)).json()
+        for offset in range(0, len(data), 256):
+            response = self.put(file, offset, data[offset:offset + 256])
+            self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def finalize(self):
+        return self.client.post(self.session['finalize_url'], **self.auth)
+
+    def test_chunked_upload_and_finalize(self):
+        data = image_bytes('PNG', size=(300, 200)) + b'\x00' * 600
+        file = self.send('scan.png', data)
+        self.assertTrue(file['complete'])
+        self.assertEqual(file['error'], '')
+
+        response = self.finalize()
+
+        self.assertEqual(response.status_code, 202)
+        upload = MarksheetUpload.objects.get()
+        self.assertEqual(response.json()['uploads'][0]['id'], upload.id)
+        with upload.image.open('rb') as stored:
+            self.assertEqual(stored.read(), data)
+        # The part files are gone once the uploads are committed
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'upload-sessions', self.session['key'])))
+
+        # Finalizing again returns the same uploads
+        self.assertEqual(self.finalize().json()['uploads'][0]['id'], upload.id)
+        self.assertEqual(MarksheetUpload.objects.count(), 1)
+
+    def test_chunk_at_the_wrong_offset(self):
+        data = image_bytes('PNG') + b'\x00' * 400
+        file = self.declare('scan.png', len(data)).json()
+        self.put(file, 0, data[:256])
+
+        response = self.put(file, 0, data[:256])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['received'], 256)
+
+        self.assertEqual(self.put(file, 300, data[300:]).status_code, 409)
+        self.assertEqual(self.put(file, 256, data[256:]).json()['received'], len(data))
+
+    def test_chunk_over_the_size_limit(self):
+        file = self.declare('scan.png', 1000).json()
+
+        self.assertEqual(self.put(file, 0, b'\x00' * 300).status_code, 413)
+
+    def test_resume_reports_offsets(self):
+        data = image_bytes('PNG') + b'\x00' * 400
+        file = self.declare('scan.png', len(data)).json()
+        self.put(file, 0, data[:256])
+
+        session = self.client.get(self.session['status_url'], **self.auth).json()
+
+        self.assertEqual(
+            [(f['id'], f['received'], f['complete']) for f in session['files']], [(file['id'], 256, False)]
+        )
+
+    def test_incomplete_file_blocks_finalize(self):
+        file = self.declare('scan.png', 1000).json()
+        self.put(file, 0, b'\x89PNG\r\n\x1a\n' + b'\x00' * 100)
+
+        response = self.finalize()
+
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('scan.png (108 of 1000 bytes)', response.json()['error'])
+
+    def test_invalid_file_is_reported_and_skipped(self):
+        self.send('scan.png', image_bytes('PNG'))
+        self.send('notes.png', b'plain text, not a scan')
+
+        response = self.finalize().json()
+
+        self.assertEqual(len(response['uploads']), 1)
+        self.assertEqual(len(response['errors']), 1)
+        self.assertIn('notes.png', response['errors'][0])
+
+    def test_finalized_session_takes_no_more_files(self):
+        self.send('scan.png', image_bytes('PNG'))
+        self.finalize()
+
+        self.assertEqual(self.declare('late.png', 100).status_code, 409)
+
+    @override_settings(MARKSHEET_UPLOAD_SESSION_MAX_FILES=2, MARKSHEET_UPLOAD_SESSION_MAX_BYTES=1500)
+    def test_session_limits(self):
+        self.assertEqual(self.declare('a.png', 1000).status_code, 201)
+        self.assertEqual(self.declare('b.png', 600).status_code, 400)
+        self.assertEqual(self.declare('b.png', 500).status_code, 201)
+        response = self.declare('c.png', 1)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('At most 2 files', response.json()['error'])
+
+    def test_invalid_declarations(self):
+        for name, size in (('', 10), ('a.png', 0), ('a.png', '10'), ('a.png', True)):
+            with self.subTest(name=name, size=size):
+                self.assertEqual(self.declare(name, size).status_code, 400)
+
+
+class UploadSessionStoreTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = UploadSessionStore()
+        self.session = self.store.create()
+        self.data = image_bytes('PNG')
+        self.file = self.store.add_file(self.session, 'scan.png', len(self.data))
+        self.store.write_chunk(self.file, 0, io.BytesIO(self.data), len(self.data))
+
+    def test_complete_file_is_moved_into_storage(self):
+        self.assertEqual(self.file.error, '')
+        self.assertEqual(self.file.content_hash, hashlib.sha256(self.data).hexdigest())
+        with marksheet_storage.open(self.file.stored_name) as stored:
+            self.assertEqual(stored.read(), self.data)
+        self.assertFalse(os.path.exists(self.store.part_path(self.file)))
+
+    def test_finalize_only_writes_rows(self):
+        with mock.patch.object(marksheet_storage, 'save') as save:
+            finalized, errors = self.store.finalize(self.session)
+
+        save.assert_not_called()
+        self.assertEqual(errors, [])
+        self.assertEqual(finalized[0].upload.image.name, self.file.stored_name)
+        self.assertEqual(finalized[0].upload.content_hash, self.file.content_hash)
+
+    def test_finalize_can_be_retried_after_a_rollback(self):
+        with mock.patch('marksheet_ocr.services.upload_sessions.enqueue_upload', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.store.finalize(self.session)
+        self.assertFalse(MarksheetUpload.objects.exists())
+
+        finalized, errors = self.store.finalize(self.session)
+
+        self.assertEqual((len(finalized), errors), (1, []))
+        with finalized[0].upload.image.open('rb') as stored:
+            self.assertEqual(stored.read(), self.data)
+
+    def test_chunks_are_refused_after_finalize(self):
+        self.store.finalize(self.session)
+        self.file.refresh_from_db()
+
+        with self.assertRaises(SessionFinalized):
+            self.store.write_chunk(self.file, 0, None, 10)
+
+    def test_stored_files_of_open_sessions_are_not_collected(self):
+        path = marksheet_storage.path(self.file.stored_name)
+        os.utime(path, (time.time() - 7200, time.time() - 7200))
+        retention = MarksheetRetention()
+
+        retention.collect_garbage(timedelta(hours=1))
+        self.assertTrue(os.path.exists(path))
+
+        UploadSession.objects.filter(pk=self.session.pk).update(updated_at=timezone.now() - timedelta(hours=30))
+        self.store.expire(timedelta(hours=24))
+        retention.collect_garbage(timedelta(hours=1))
+        self.assertFalse(os.path.exists(path))
+
+    def test_expire_deletes_idle_sessions_with_their_parts(self):
+        partial = self.store.add_file(self.session, 'next.png', 1000)
+        self.store.write_chunk(partial, 0, io.BytesIO(b'\x89PNG\r\n\x1a\n' + b'\x00' * 92), 100)
+        UploadSession.objects.filter(pk=self.session.pk).update(updated_at=timezone.now() - timedelta(hours=30))
+        fresh = self.store.create()
+
+        count, freed = self.store.expire(timedelta(hours=24))
+
+        self.assertEqual((count, freed), (1, 100))
+        self.assertFalse(os.path.exists(self.store.directory(self.session)))
+        self.assertEqual(list(UploadSession.objects.all()), [fresh])
@@ -0,0 +1,122 @@
+from io import StringIO
+from types import SimpleNamespace
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+
+from marksheet_ocr.models import MarksheetUpload
+from marksheet_ocr.services.usage import (
+    TOKENS_PER_TILE, call_usage, estimate_image_tokens, image_tokens_at, usage_totals,
+)
+
+
+def response(prompt_tokens, output_tokens, details=None):
+    """Stand-in for a GenerateContentResponse with its usage_metadata"""
+    return SimpleNamespace(usage_metadata=SimpleNamespace(
+        prompt_token_count=prompt_tokens,
+        candidates_token_count=output_tokens,
+        prompt_tokens_details=[
+            SimpleNamespace(modality=modality, token_count=count) for modality, count in details or []
+        ],
+    ))
+
+
+def recorded_call(width, height, max_size, kind='full', text=900, image=None, output=400):
+    """A call as call_usage stores it"""
+    return {
+        'kind': kind, 'width': width, 'height': height, 'max_size': max_size, 'text_tokens': text,
+        'image_tokens': estimate_image_tokens(width, height) if image is None else image,
+        'output_tokens': output, 'seconds': 3.5,
+    }
+
+
+class CallUsageTests(SimpleTestCase):
+    def setUp(self):
+        self.image = Image.new('L', (1024, 724))
+
+    def test_image_tokens_reported_by_modality(self):
+        usage = call_usage(response(1400, 350, [('TEXT', 800), ('MediaModality.IMAGE', 600)]),
+                           'full', self.image, 1024, 4.567)
+
+        self.assertEqual(usage, {
+            'kind': 'full', 'width': 1024, 'height': 724, 'max_size': 1024,
+            'text_tokens': 800, 'image_tokens': 600, 'output_tokens': 350, 'seconds': 4.57,
+        })
+
+    def test_image_tokens_estimated_without_a_breakdown(self):
+        usage = call_usage(response(2000, 350), 'targeted', self.image, 1024, 1)
+
+        # 2 x 1 tiles of 768px
+        self.assertEqual((usage['image_tokens'], usage['text_tokens']), (516, 1484))
+
+    def test_estimate_never_exceeds_the_prompt(self):
+        usage = call_usage(response(300, 10), 'full', self.image, 1024, 1)
+
+        self.assertEqual((usage['image_tokens'], usage['text_tokens']), (300, 0))
+
+    def test_missing_usage_metadata(self):
+        usage = call_usage(SimpleNamespace(), 'full', Image.new('L', (300, 200)), 1024, 1)
+
+        self.assertEqual((usage['text_tokens'], usage['image_tokens'], usage['output_tokens']), (0, 258, 0))
+
+    def test_image_tokens_at(self):
+        call = recorded_call(1536, 1086, 1536)
+
+        self.assertEqual(image_tokens_at(call, 1536), estimate_image_tokens(1536, 1086))
+        self.assertEqual(image_tokens_at(call, 768), TOKENS_PER_TILE)
+        self.assertEqual(image_tokens_at(call, 2048), estimate_image_tokens(2048, 1448))
+
+    def test_image_tokens_at_does_not_scale_past_the_original(self):
+        # Sent at 1000px under a 1536px rung, so 1000px is all there is
+        call = recorded_call(1000, 700, 1536)
+
+        self.assertEqual(image_tokens_at(call, 3072), estimate_image_tokens(1000, 700))
+        self.assertEqual(image_tokens_at(call, 500), TOKENS_PER_TILE)
+
+    def test_usage_totals(self):
+        calls = [
+            recorded_call(1024, 724, 1024, image=516),
+            recorded_call(400, 300, 1024, kind='targeted', image=258),
+        ]
+
+        self.assertEqual(usage_totals(calls), {
+            'api_calls': 2, 'prompt_tokens': 1800, 'image_tokens': 774, 'output_tokens': 800,
+        })
+
+
+@override_settings(MARKSHEET_EXTRACTION_RESOLUTIONS=[1024, 1536])
+class ReportTokenUsageTests(TestCase):
+    def run_command(self, **options):
+        out = StringIO()
+        call_command('report_token_usage', stdout=out, **options)
+        return out.getvalue()
+
+    def upload(self, calls, resolution, students):
+        return MarksheetUpload.objects.create(
+            image='marksheets/scan.png', status='completed', model_name='gemini-test',
+            token_usage=calls, extraction_resolution=resolution, students_total=students,
+            **usage_totals(calls),
+        )
+
+    def test_report(self):
+        self.upload([recorded_call(1024, 724, 1024)], 1024, 8)
+        self.upload([recorded_call(1024, 724, 1024), recorded_call(1536, 1086, 1536)], 1536, 40)
+
+        output = self.run_command(input_price=0.3, output_price=2.5)
+
+        for heading in ('Overall', 'By day', 'By model', 'By sheet size', 'By accepted resolution',
+                        'Prompt', 'Full extraction calls by image size', 'Image tokens if every full call'):
+            self.assertIn(heading, output)
+        self.assertIn('gemini-test', output)
+        self.assertIn('Attempts rejected by the quality checks: 1 call(s)', output)
+        self.assertIn('USD/sheet', output)
+
+    def test_nothing_recorded(self):
+        self.assertIn('No extractions with recorded token usage.', self.run_command())
+
+    def test_invalid_options(self):
+        with self.assertRaises(CommandError):
+            self.run_command(days=-1)
+        with self.assertRaises(CommandError):
+            self.run_command(prompt_trim=2)
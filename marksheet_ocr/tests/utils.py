@@ -0,0 +1,59 @@
+"""
+Helpers shared by the marksheet_ocr tests
+"""
+import io
+import shutil
+import tempfile
+
+from django.test import override_settings
+from PIL import Image
+
+from marksheet_ocr.models import MarksheetUpload
+from marksheet_ocr.services.processing import UploadProcessor
+from marksheet_ocr.services.records import ExtractedMark, ExtractedStudent
+
+
+def image_bytes(format='PNG', size=(40, 30), color=(200, 0, 0), frames=1):
+    """Encoded test image; ``frames`` > 1 writes a multi-page TIFF"""
+    buffer = io.BytesIO()
+    images = [Image.new('RGB', size, (color[0], color[1], index)) for index in range(frames)]
+    if frames > 1:
+        images[0].save(buffer, format, save_all=True, append_images=images[1:])
+    else:
+        images[0].save(buffer, format)
+    return buffer.getvalue()
+
+
+def student_record(roll_number, *marks, name=None):
+    """
+    ExtractedStudent with the given marks
+
+    Args:
+        roll_number: Roll number; the name defaults to one derived from it
+        *marks: (subject_code, theory_ese, theory_internal, practical, practical_internal)
+    """
+    return ExtractedStudent(
+        str(roll_number), name or f'Student {roll_number}',
+        marks=[ExtractedMark(code, f'Subject {code}', *values) for code, *values in marks],
+    )
+
+
+def completed_upload(*records, **fields):
+    """Completed upload with the records saved as its students"""
+    upload = MarksheetUpload.objects.create(image='marksheets/scan.png', status='completed', **fields)
+    processor = UploadProcessor()
+    for record in records:
+        processor.save_student(upload, record)
+    return upload
+
+
+class TempMediaMixin:
+    """Point MEDIA_ROOT at a fresh directory for each test"""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp(prefix='marksheet-tests-')
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
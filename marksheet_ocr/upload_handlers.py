@@ -0,0 +1,176 @@
+"""
+Streaming upload handler for marksheet images
+
+Django's default handlers buffer an upload (in memory or a temp file) and
+leave validation, hashing and the copy into MEDIA_ROOT to later passes over
+the same bytes. MarksheetUploadHandler does all of it while the request body
+streams in: each chunk is hashed and written once, to a temp file on the same
+filesystem as the media storage, so saving the model is a rename.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.urls import reverse
+
+
+# Leading bytes of every format we accept; PDFs are split into one upload per page
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'BM', 'bmp'),
+    (b'II*\x00', 'tiff'),
+    (b'MM\x00*', 'tiff'),
+    (b'%PDF-', 'pdf'),
+]
+
+SNIFF_BYTES = 16
+
+# File name extensions accepted for each format; stored files get the first
+TYPE_EXTENSIONS = {
+    'jpeg': ['.jpg', '.jpeg'],
+    'png': ['.png'],
+    'bmp': ['.bmp'],
+    'tiff': ['.tiff', '.tif'],
+    'pdf': ['.pdf'],
+}
+
+
+def sniff_image_type(header):
+    """
+    Identify an image format from its first bytes
+
+    Args:
+        header: At least the first SNIFF_BYTES bytes of the file
+
+    Returns:
+        Format name ('jpeg', 'png', 'bmp', 'tiff', 'pdf') or None if unrecognised
+    """
+    for signature, image_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_type
+    return None
+
+
+def max_upload_size(file_type):
+    """
+    Size limit in bytes for an upload of the given sniffed type
+
+    TIFFs may hold many pages and get the PDF limit while streaming; the form
+    holds single-page TIFFs to the image limit once their pages are counted.
+    """
+    if file_type in ('pdf', 'tiff'):
+        return settings.MARKSHEET_MAX_PDF_SIZE
+    return settings.MARKSHEET_MAX_UPLOAD_SIZE
+
+
+def get_incoming_dir():
+    """Temp directory next to the upload target so the final save is a rename"""
+    path = os.path.join(settings.MEDIA_ROOT, 'marksheets', '.incoming')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class HashedUploadedFile(UploadedFile):
+    """
+    Upload streamed to disk, with its content hash and real type recorded
+
+    Behaves like Django's TemporaryUploadedFile, but the temp file lives under
+    MEDIA_ROOT so FileSystemStorage can move it into place.
+
+    Attributes:
+        sha256: Hex digest of the content
+        sniffed_type: Image format detected from the magic bytes, or None
+        oversized: True if the file exceeded the size limit (content truncated)
+    """
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(suffix='.upload' + ext, dir=get_incoming_dir())
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.sha256 = None
+        self.sniffed_type = None
+        self.oversized = False
+
+    def temporary_file_path(self):
+        """Return the full path of the file (used by storage to move it)"""
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            # The file was moved into storage and no longer exists here
+            pass
+
+
+class MarksheetUploadHandler(FileUploadHandler):
+    """
+    Validate, hash and store uploaded files in a single pass
+
+    - Requests whose declared body is larger than the per-request limit are
+      aborted before any file data is read.
+    - Each file's type is sniffed from its first bytes.
+    - Bytes beyond MARKSHEET_MAX_UPLOAD_SIZE (MARKSHEET_MAX_PDF_SIZE for
+      PDFs and TIFFs) are discarded and the file is flagged as oversized for the form
+      to reject.
+    """
+    request_too_large = False
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        max_size = settings.MARKSHEET_MAX_UPLOAD_SIZE
+        max_files = self._max_files()
+        # Allow some room for the multipart framing and form fields, and for
+        # one PDF, which may be larger than an image
+        allowance = max(settings.MARKSHEET_MAX_PDF_SIZE - max_size, 0) + 1024 * 1024
+        self.request_too_large = content_length > max_files * max_size + allowance
+        if self.request_too_large and self.request is not None:
+            self.request.upload_rejected = (
+                f'Upload too large: at most {max_files} files of {max_size // (1024 * 1024)}MB each.'
+            )
+
+    def _max_files(self):
+        if self.request is not None and self.request.path == reverse('api_uploads'):
+            return settings.MARKSHEET_API_MAX_FILES
+        return settings.MARKSHEET_MAX_FILES_PER_UPLOAD
+
+    def new_file(self, *args, **kwargs):
+        if self.request_too_large:
+            # Stop reading the body; the view reports request.upload_rejected
+            raise StopUpload(connection_reset=True)
+
+        super().new_file(*args, **kwargs)
+        self.file = HashedUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+        )
+        self.hasher = hashlib.sha256()
+        self.header = b''
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        if len(self.header) < SNIFF_BYTES:
+            self.header += raw_data[:SNIFF_BYTES - len(self.header)]
+
+        self.size += len(raw_data)
+        if self.size > max_upload_size(sniff_image_type(self.header)):
+            # Keep counting but stop storing; the form rejects the file
+            self.file.oversized = True
+            return None
+
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = self.size
+        self.file.sha256 = self.hasher.hexdigest()
+        self.file.sniffed_type = sniff_image_type(self.header)
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
@@ -1,9 +1,13 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.upload_marksheet, name='upload_marksheet'),
+    path('uploads/', views.upload_history, name='upload_history'),
+    path('search/', views.search_students, name='search_students'),
+    path('analytics/', views.subject_analytics, name='subject_analytics'),
     path('results/<int:upload_id>/', views.view_results, name='view_results'),
+    path('uploads/<int:upload_id>/thumbnail.webp', views.upload_thumbnail, name='upload_thumbnail'),
     
     # CSV Downloads
     path('download/csv/<int:upload_id>/', views.download_csv, name='download_csv'),
@@ -12,4 +16,31 @@ urlpatterns = [
     # Excel Downloads
     path('download/excel/<int:upload_id>/', views.download_excel, name='download_excel'),
     path('download/excel-detailed/<int:upload_id>/', views.download_detailed_excel, name='download_detailed_excel'),
+    
+    # Every format in one ZIP
+    path('download/all/<int:upload_id>/', views.download_bundle, name='download_bundle'),
+    
+    # Processing status
+    path('api/uploads/<int:upload_id>/status', api.upload_status, name='upload_status'),
+    path('api/uploads/<int:upload_id>/events', api.upload_events, name='upload_events'),
+    
+    # Resumable chunked uploads (upload.js, or scripts with a token)
+    path('api/upload-sessions', api.create_upload_session, name='api_upload_sessions'),
+    path('api/upload-sessions/<str:key>', api.upload_session, name='api_upload_session'),
+    path('api/upload-sessions/<str:key>/files', api.upload_session_files, name='api_upload_session_files'),
+    path(
+        'api/upload-sessions/<str:key>/files/<int:file_id>',
+        api.upload_session_file, name='api_upload_session_file'
+    ),
+    path(
+        'api/upload-sessions/<str:key>/finalize',
+        api.finalize_upload_session, name='api_upload_session_finalize'
+    ),
+    
+    # Token-authenticated API for scripted submission
+    path('api/uploads', api.uploads, name='api_uploads'),
+    path('api/uploads/<int:upload_id>/students', api.upload_students, name='api_upload_students'),
+    path('api/students/search', api.search_students, name='api_search_students'),
+    path('api/analytics/subjects', api.subject_statistics, name='api_subject_statistics'),
+    path('api/analytics/subjects/<int:subject_id>/trend', api.subject_trend, name='api_subject_trend'),
 ]
@@ -1,107 +1,82 @@
-from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, JsonResponse
+import logging
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Prefetch
+from django.shortcuts import aget_object_or_404, render, redirect, get_object_or_404
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
 from django.contrib import messages
-from .models import MarksheetUpload, Student, Subject, Mark
-from .forms import MarksheetUploadForm
-from .services.ai_extractor import AIExtractor
+from django.utils.cache import patch_cache_control
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_GET
+from .async_utils import iterate_in_thread, run_in_thread
+from .models import MarksheetUpload, Mark, Subject, SubjectSummary
+from .forms import MarksheetUploadForm, UploadHistoryFilterForm
+from .pagination import InvalidCursor, KeysetPaginator
+from .storage import marksheet_storage
+from .services.analytics import SubjectAnalytics
+from .services.archive import ArchivedStudents
 from .services.csv_exporter import CSVExporter
-import traceback
+from .services.derivatives import THUMBNAIL, DerivativeStore
+from .services.processing import enqueue_upload, process_upload_async
+from .services.search import StudentSearch
+
+
+logger = logging.getLogger(__name__)
+
 
+async def upload_marksheet(request):
+    """
+    Handle marksheet upload and display upload form
 
-def upload_marksheet(request):
-    """Handle marksheet upload and display upload form"""
+    Async so that the synchronous-processing path waits for the AI on the
+    worker pool instead of holding a server worker for the whole extraction.
+    """
     if request.method == 'POST':
-        files = request.FILES.getlist('image')
+        # Reading the multipart body touches the upload handlers; keep it off the loop
+        files = await sync_to_async(request.FILES.getlist)('image')
+        max_files = settings.MARKSHEET_MAX_FILES_PER_UPLOAD
         
-        if not files:
-            messages.error(request, 'No files selected.')
-        elif len(files) > 5:
-            messages.error(request, 'Maximum 5 files allowed per upload.')
+        error = None
+        if getattr(request, 'upload_rejected', None):
+            error = request.upload_rejected
+        elif not files:
+            error = 'No files selected.'
+        elif len(files) > max_files:
+            error = f'Maximum {max_files} files allowed per upload.'
+        
+        if error:
+            messages.error(request, error)
+            return redirect('upload_marksheet')
         else:
             success_count = 0
             error_count = 0
+            queued_count = 0
             last_upload_id = None
             
             for file in files:
-                # Create a mutable copy of POST data to validate each file individually if needed,
-                # but we simplest way is to manually instantiate the form/model or just validation.
-                # However, to reuse Form validation (file extension, size), we instantiate the form.
-                
-                # Note: 'image' field in form expects a single file. 
-                # We can construct a dict for files for each iteration.
+                # Note: 'image' field in form expects a single file, so validate
+                # each one through its own form instance.
                 form = MarksheetUploadForm(data=request.POST, files={'image': file})
                 
-                if form.is_valid():
+                if await run_in_thread(form.is_valid):
                     try:
-                        # Save upload
-                        upload = form.save()
+                        upload = await run_in_thread(form.save)
                         last_upload_id = upload.id
                         
-                        # Process image with AI
-                        upload.status = 'processing'
-                        upload.save()
-                        
-                        try:
-                            # Extract data using AI
-                            extractor = AIExtractor()
-                            students_data = extractor.extract_marksheet_data(upload.image.path)
-                            
-                            # Save extracted data to database
-                            for student_data in students_data:
-                                # Validate data
-                                if not extractor.validate_student_data(student_data):
-                                    continue
-                                
-                                # Create student
-                                student = Student.objects.create(
-                                    upload=upload,
-                                    roll_number=student_data.get('roll_number', ''),
-                                    name=student_data.get('name', ''),
-                                    father_name=student_data.get('father_name', ''),
-                                    mother_name=student_data.get('mother_name', ''),
-                                    enrollment_number=student_data.get('enrollment_number', '')
-                                )
-                                
-                                # Create subjects and marks
-                                for subject_data in student_data.get('subjects', []):
-                                    # Get or create subject
-                                    subject, created = Subject.objects.get_or_create(
-                                        code=subject_data.get('code', ''),
-                                        name=subject_data.get('name', '')
-                                    )
-                                    
-                                    # Create mark
-                                    Mark.objects.create(
-                                        student=student,
-                                        subject=subject,
-                                        theory_ese=subject_data.get('theory_ese'),
-                                        theory_internal=subject_data.get('theory_internal'),
-                                        practical_marks=subject_data.get('practical'),
-                                        practical_internal=subject_data.get('practical_internal')
-                                    )
-                            
-                            # Mark as completed
-                            upload.status = 'completed'
-                            upload.save()
+                        if upload.is_document():
+                            # Pages are extracted in the background, one job each
+                            await run_in_thread(enqueue_upload, upload.id)
+                            queued_count += 1
+                        elif await process_upload_async(upload.id):
                             success_count += 1
-                            
-                        except ValueError as e:
-                            upload.status = 'failed'
-                            upload.error_message = str(e)
-                            upload.save()
+                        else:
                             error_count += 1
-                            print(f"Processing error for {file.name}: {e}")
                             
-                        except Exception as e:
-                            upload.status = 'failed'
-                            upload.error_message = str(e)
-                            upload.save()
-                            error_count += 1
-                            print(f"Processing failed for {file.name}: {traceback.format_exc()}")
-                            
-                    except Exception as e:
+                    except Exception:
                         error_count += 1
-                        print(f"Upload failed for {file.name}: {e}")
+                        logger.exception("Upload failed for %s", file.name)
                 else:
                     error_count += 1
                     for error in form.errors.values():
@@ -110,6 +85,9 @@ def upload_marksheet(request):
             if success_count > 0:
                 messages.success(request, f'Successfully processed {success_count} marksheet(s).')
             
+            if queued_count > 0:
+                messages.info(request, f'Queued {queued_count} multi-page file(s); their pages are processed in the background.')
+            
             if error_count > 0:
                 messages.warning(request, f'Failed to process {error_count} marksheet(s). Check Recent Uploads for details.')
             
@@ -122,34 +100,167 @@ def upload_marksheet(request):
     else:
         form = MarksheetUploadForm()
     
-    # Get recent uploads
-    recent_uploads = MarksheetUpload.objects.all()[:10]
+    # Get recent uploads (pages of a PDF are listed under the PDF)
+    recent_uploads = MarksheetUpload.objects.filter(parent__isnull=True)[:10]
     
-    return render(request, 'marksheet_ocr/upload.html', {
+    return await sync_to_async(render)(request, 'marksheet_ocr/upload.html', {
         'form': form,
-        'recent_uploads': recent_uploads
+        'recent_uploads': recent_uploads,
+        # Advertised to upload.js, which checks and downscales files before sending
+        'upload_limits': {
+            'max_files': settings.MARKSHEET_MAX_FILES_PER_UPLOAD,
+            'max_session_files': settings.MARKSHEET_UPLOAD_SESSION_MAX_FILES,
+            'max_image_size': settings.MARKSHEET_MAX_UPLOAD_SIZE,
+            'max_pdf_size': settings.MARKSHEET_MAX_PDF_SIZE,
+            'max_dimension': settings.MARKSHEET_CLIENT_MAX_DIMENSION,
+            'quality': settings.MARKSHEET_CLIENT_JPEG_QUALITY,
+        },
     })
 
 
-def view_results(request, upload_id):
+def upload_history(request):
+    """Browse every upload, newest first, filtered by status and date"""
+    filter_form = UploadHistoryFilterForm(request.GET or None)
+    uploads = MarksheetUpload.objects.filter(parent__isnull=True)
+    if filter_form.is_valid():
+        uploads = filter_form.filter_queryset(uploads)
+    
+    paginator = KeysetPaginator(uploads, ('-uploaded_at', '-id'), per_page=25)
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404('Invalid page.')
+    
+    # Page links keep the active filters
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    first_query = params.urlencode()
+    next_query = None
+    if page.has_next:
+        params['cursor'] = page.next_cursor
+        next_query = params.urlencode()
+    
+    return render(request, 'marksheet_ocr/history.html', {
+        'filter_form': filter_form,
+        'uploads': page,
+        'is_first_page': 'cursor' not in request.GET,
+        'first_query': first_query,
+        'next_query': next_query,
+    })
+
+
+def search_students(request):
+    """Look up students across all uploads by roll/enrollment number or name"""
+    query = request.GET.get('q', '').strip()
+    students = StudentSearch().search(query) if query else []
+    for student in students:
+        student.summary = student.get_summary()
+    
+    return render(request, 'marksheet_ocr/search.html', {
+        'query': query,
+        'students': students,
+    })
+
+
+def subject_analytics(request):
+    """
+    Subject statistics overall or for one upload (?upload=), and a subject's
+    monthly trend (?subject=), read from the summary tables only
+    """
+    analytics = SubjectAnalytics()
+    upload = None
+    upload_id = request.GET.get('upload', '').strip().lstrip('#')
+    if upload_id:
+        if not upload_id.isdigit():
+            raise Http404('Invalid upload.')
+        upload = get_object_or_404(MarksheetUpload, id=upload_id)
+    
+    subject = None
+    trend = []
+    subject_id = request.GET.get('subject', '')
+    if subject_id:
+        if not subject_id.isdigit():
+            raise Http404('Invalid subject.')
+        subject = get_object_or_404(Subject, id=subject_id)
+        trend = analytics.trend(subject)
+    
+    return render(request, 'marksheet_ocr/analytics.html', {
+        'upload': upload,
+        'subjects': analytics.subjects(upload),
+        'subject': subject,
+        'trend': trend,
+        'grades': SubjectSummary.GRADES,
+    })
+
+
+async def view_results(request, upload_id):
     """Display extracted results"""
-    upload = get_object_or_404(MarksheetUpload, id=upload_id)
-    students = upload.students.all().prefetch_related('marks__subject')
+    upload = await aget_object_or_404(MarksheetUpload, id=upload_id)
     
-    return render(request, 'marksheet_ocr/results.html', {
+    cursor = request.GET.get('cursor') or None
+    paginator = KeysetPaginator(
+        upload.get_students().prefetch_related(
+            Prefetch('marks', queryset=Mark.objects.select_related('subject'))
+        ),
+        ('roll_number', 'id'),
+        per_page=settings.MARKSHEET_RESULTS_PAGE_SIZE,
+    )
+    if cursor:
+        try:
+            paginator.decode_cursor(cursor)
+        except InvalidCursor:
+            raise Http404('Invalid page.')
+    
+    # Rendering may run the student queries (on a cache miss)
+    return await sync_to_async(render)(request, 'marksheet_ocr/results.html', {
         'upload': upload,
-        'students': students
+        'cursor': cursor or '',
+        # Only evaluated by the template when the cached fragment is missing
+        'students': partial(_students_with_summaries, paginator, cursor),
+        'cache_timeout': settings.MARKSHEET_RESULTS_CACHE_TIMEOUT,
     })
 
 
-def download_csv(request, upload_id):
-    """Download results as CSV"""
+def _students_with_summaries(paginator, cursor):
+    """One page of students with totals precomputed for the results template"""
+    page = paginator.page(cursor)
+    for student in page:
+        student.summary = student.get_summary()
+    return page
+
+
+@require_GET
+def upload_thumbnail(request, upload_id):
+    """Small WebP preview of the uploaded marksheet, generated on first request"""
     upload = get_object_or_404(MarksheetUpload, id=upload_id)
-    students = upload.students.all().prefetch_related('marks__subject')
     
-    # Export to CSV
+    try:
+        name = DerivativeStore().get(upload, THUMBNAIL)
+    except OSError:
+        # Original evicted before a thumbnail was made, or not a readable image
+        raise Http404('No preview available.')
+    
+    response = FileResponse(marksheet_storage.open(name), content_type='image/webp')
+    patch_cache_control(response, public=True, max_age=86400)
+    return response
+
+
+def _export_students(upload):
+    """Students to export: the saved ones, or the records of an archived upload"""
+    if upload.is_archived():
+        return ArchivedStudents(upload)
+    return upload.get_students().prefetch_related('marks__subject')
+
+
+@gzip_page
+async def download_csv(request, upload_id):
+    """Download results as CSV"""
+    upload = await aget_object_or_404(MarksheetUpload, id=upload_id)
+    students = _export_students(upload)
+    
+    # Export to CSV on a thread of its own; pandas and the queries block
     exporter = CSVExporter()
-    csv_data = exporter.export_students_to_csv(students)
+    csv_data = await run_in_thread(exporter.export_students_to_csv, students)
     
     # Create response
     filename = f"marksheet_summary_{upload_id}.csv"
@@ -159,14 +270,15 @@ def download_csv(request, upload_id):
     return response
 
 
-def download_detailed_csv(request, upload_id):
+@gzip_page
+async def download_detailed_csv(request, upload_id):
     """Download detailed results as CSV (one row per subject)"""
-    upload = get_object_or_404(MarksheetUpload, id=upload_id)
-    students = upload.students.all().prefetch_related('marks__subject')
+    upload = await aget_object_or_404(MarksheetUpload, id=upload_id)
+    students = _export_students(upload)
     
-    # Export to CSV
+    # Export to CSV on a thread of its own; pandas and the queries block
     exporter = CSVExporter()
-    csv_data = exporter.export_detailed_csv(students)
+    csv_data = await run_in_thread(exporter.export_detailed_csv, students)
     
     # Create response
     filename = f"marksheet_detailed_{upload_id}.csv"
@@ -176,14 +288,14 @@ def download_detailed_csv(request, upload_id):
     return response
 
 
-def download_excel(request, upload_id):
+async def download_excel(request, upload_id):
     """Download results as Excel"""
-    upload = get_object_or_404(MarksheetUpload, id=upload_id)
-    students = upload.students.all().prefetch_related('marks__subject')
+    upload = await aget_object_or_404(MarksheetUpload, id=upload_id)
+    students = _export_students(upload)
     
-    # Export to Excel
+    # Export to Excel on a thread of its own; pandas and the queries block
     exporter = CSVExporter()
-    excel_data = exporter.export_students_to_excel(students)
+    excel_data = await run_in_thread(exporter.export_students_to_excel, students)
     
     # Create response
     filename = f"marksheet_summary_{upload_id}.xlsx"
@@ -196,14 +308,14 @@ def download_excel(request, upload_id):
     return response
 
 
-def download_detailed_excel(request, upload_id):
+async def download_detailed_excel(request, upload_id):
     """Download detailed results as Excel (one row per subject)"""
-    upload = get_object_or_404(MarksheetUpload, id=upload_id)
-    students = upload.students.all().prefetch_related('marks__subject')
+    upload = await aget_object_or_404(MarksheetUpload, id=upload_id)
+    students = _export_students(upload)
     
-    # Export to Excel
+    # Export to Excel on a thread of its own; pandas and the queries block
     exporter = CSVExporter()
-    excel_data = exporter.export_detailed_excel(students)
+    excel_data = await run_in_thread(exporter.export_detailed_excel, students)
     
     # Create response
     filename = f"marksheet_detailed_{upload_id}.xlsx"
@@ -214,3 +326,19 @@ def download_detailed_excel(request, upload_id):
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
     
     return response
+
+
+async def download_bundle(request, upload_id):
+    """Download summary and detailed results as CSV and Excel in one ZIP"""
+    upload = await aget_object_or_404(MarksheetUpload, id=upload_id)
+    students = _export_students(upload)
+    
+    # Built and compressed on worker threads, one file at a time
+    exporter = CSVExporter()
+    chunks = exporter.iter_bundle(students, upload_id, compresslevel=settings.MARKSHEET_BUNDLE_COMPRESSLEVEL)
+    
+    filename = f"marksheet_all_{upload_id}.zip"
+    response = StreamingHttpResponse(iterate_in_thread(chunks), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    
+    return response
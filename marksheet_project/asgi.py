@@ -3,6 +3,12 @@ ASGI config for marksheet_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve through this entry point (gunicorn with uvicorn workers in
+production, see render.yaml) so the upload progress event stream, status
+polls, result pages and exports run as async views: a worker waiting on
+the AI, the database or an export keeps serving other requests instead of
+blocking them.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -10,10 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+from importlib.util import find_spec
 from pathlib import Path
 import os
 from dotenv import load_dotenv
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 
 # Load environment variables
 load_dotenv()
@@ -106,9 +108,38 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                # Take the write lock when a transaction begins, so concurrent
+                # writers wait for it instead of failing on lock upgrade
+                'transaction_mode': os.getenv('MARKSHEET_SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+            },
         }
     }
 
+# Applied to every new SQLite connection by marksheet_ocr.db
+MARKSHEET_SQLITE_TUNING = os.getenv('MARKSHEET_SQLITE_TUNING', 'True') == 'True'
+MARKSHEET_SQLITE_JOURNAL_MODE = os.getenv('MARKSHEET_SQLITE_JOURNAL_MODE', 'wal')
+MARKSHEET_SQLITE_SYNCHRONOUS = os.getenv('MARKSHEET_SQLITE_SYNCHRONOUS', 'normal')
+MARKSHEET_SQLITE_BUSY_TIMEOUT = int(os.getenv('MARKSHEET_SQLITE_BUSY_TIMEOUT', '20000'))  # ms
+MARKSHEET_SQLITE_MMAP_SIZE = int(os.getenv('MARKSHEET_SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+
+# Postgres connection pool, shared by the request and background worker
+# threads of a process. Needs psycopg 3 with the pool extra (requirements.txt);
+# Django falls back to psycopg2, which cannot pool, when it is missing
+MARKSHEET_DB_POOL_MAX_SIZE = int(os.getenv('MARKSHEET_DB_POOL_MAX_SIZE', '0'))
+if MARKSHEET_DB_POOL_MAX_SIZE and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    if not (find_spec('psycopg') and find_spec('psycopg_pool')):
+        raise ImproperlyConfigured(
+            'MARKSHEET_DB_POOL_MAX_SIZE needs psycopg 3 and psycopg_pool: '
+            'pip install "psycopg[binary,pool]", or unset it to use persistent connections.'
+        )
+    DATABASES['default']['CONN_MAX_AGE'] = 0  # the pool replaces persistent connections
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': int(os.getenv('MARKSHEET_DB_POOL_MIN_SIZE', '1')),
+        'max_size': MARKSHEET_DB_POOL_MAX_SIZE,
+        'timeout': int(os.getenv('MARKSHEET_DB_POOL_TIMEOUT', '30')),
+    }
+
 
 
 # Password validation
@@ -158,6 +189,15 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Cache (per-process memory by default; point CACHE_BACKEND/CACHE_LOCATION at
+# a shared backend such as Redis when running several workers)
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'marksheet-ocr'),
+    }
+}
+
 # Crispy Forms
 CRISPY_ALLOWED_TEMPLATE_PACKS = 'bootstrap5'
 CRISPY_TEMPLATE_PACK = 'bootstrap5'
@@ -165,6 +205,69 @@ CRISPY_TEMPLATE_PACK = 'bootstrap5'
 # Google Gemini API
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 
+# Marksheet processing
+MARKSHEET_MAX_UPLOAD_SIZE = int(os.getenv('MARKSHEET_MAX_UPLOAD_SIZE', str(10 * 1024 * 1024)))
+MARKSHEET_MAX_FILES_PER_UPLOAD = int(os.getenv('MARKSHEET_MAX_FILES_PER_UPLOAD', '5'))
+# Multi-page PDFs (needs pypdfium2) and TIFFs: each page becomes its own
+# upload, rendered at MARKSHEET_PDF_DPI but no larger than the largest
+# extraction size. TIFFs with a single page are held to the image limit.
+MARKSHEET_MAX_PDF_SIZE = int(os.getenv('MARKSHEET_MAX_PDF_SIZE', str(100 * 1024 * 1024)))
+MARKSHEET_MAX_PDF_PAGES = int(os.getenv('MARKSHEET_MAX_PDF_PAGES', '300'))
+MARKSHEET_PDF_DPI = int(os.getenv('MARKSHEET_PDF_DPI', '200'))
+# Resumable upload sessions (upload.js, api/upload-sessions): files are sent
+# in chunks of at most MARKSHEET_UPLOAD_CHUNK_SIZE bytes, a session holds at
+# most MARKSHEET_UPLOAD_SESSION_MAX_FILES files and MARKSHEET_UPLOAD_SESSION_MAX_BYTES
+# bytes, and sessions idle for MARKSHEET_UPLOAD_SESSION_HOURS are deleted by gc_marksheets
+MARKSHEET_UPLOAD_CHUNK_SIZE = int(os.getenv('MARKSHEET_UPLOAD_CHUNK_SIZE', str(4 * 1024 * 1024)))
+MARKSHEET_UPLOAD_SESSION_MAX_FILES = int(os.getenv('MARKSHEET_UPLOAD_SESSION_MAX_FILES', '500'))
+MARKSHEET_UPLOAD_SESSION_MAX_BYTES = int(os.getenv('MARKSHEET_UPLOAD_SESSION_MAX_BYTES', str(2 * 1024 ** 3)))
+MARKSHEET_UPLOAD_SESSION_HOURS = int(os.getenv('MARKSHEET_UPLOAD_SESSION_HOURS', '24'))
+# Validates, hashes and stores uploaded files while the request streams in
+FILE_UPLOAD_HANDLERS = ['marksheet_ocr.upload_handlers.MarksheetUploadHandler']
+# Uploads submitted from upload.js are processed on an in-process thread pool
+MARKSHEET_BACKGROUND_WORKERS = int(os.getenv('MARKSHEET_BACKGROUND_WORKERS', '2'))
+# Server-Sent Events progress stream (seconds)
+MARKSHEET_EVENTS_POLL_INTERVAL = float(os.getenv('MARKSHEET_EVENTS_POLL_INTERVAL', '1'))
+MARKSHEET_EVENTS_TIMEOUT = int(os.getenv('MARKSHEET_EVENTS_TIMEOUT', '300'))
+# Deflate level (0-9) of the CSV files in the "all formats" ZIP download
+MARKSHEET_BUNDLE_COMPRESSLEVEL = int(os.getenv('MARKSHEET_BUNDLE_COMPRESSLEVEL', '6'))
+# Rendered student tables on the results page (seconds)
+MARKSHEET_RESULTS_CACHE_TIMEOUT = int(os.getenv('MARKSHEET_RESULTS_CACHE_TIMEOUT', '86400'))
+MARKSHEET_RESULTS_PAGE_SIZE = int(os.getenv('MARKSHEET_RESULTS_PAGE_SIZE', '50'))
+# JSON API: files per submission, and the directory scripts may submit files from by path
+MARKSHEET_API_MAX_FILES = int(os.getenv('MARKSHEET_API_MAX_FILES', '50'))
+MARKSHEET_API_IMPORT_DIR = os.getenv('MARKSHEET_API_IMPORT_DIR', '')
+# Longest image side tried by extraction, smallest first: a result that fails
+# the structural checks is retried at the next size, up to the last one
+MARKSHEET_EXTRACTION_RESOLUTIONS = [
+    int(size) for size in os.getenv('MARKSHEET_EXTRACTION_RESOLUTIONS', '768,1024,1536,2048').split(',')
+]
+# Also flag students whose printed result differs from the one the app's own
+# pass and division rules give. Off by default: boards apply rules of their own.
+MARKSHEET_QUALITY_CHECK_RESULT = os.getenv('MARKSHEET_QUALITY_CHECK_RESULT', 'False') == 'True'
+# upload.js downscales images in the browser to this longest side (default:
+# the largest extraction size) and re-encodes them as JPEG at this quality
+# before sending; 0 sends originals. The server accepts originals either way.
+MARKSHEET_CLIENT_MAX_DIMENSION = int(
+    os.getenv('MARKSHEET_CLIENT_MAX_DIMENSION', str(max(MARKSHEET_EXTRACTION_RESOLUTIONS)))
+)
+MARKSHEET_CLIENT_JPEG_QUALITY = int(os.getenv('MARKSHEET_CLIENT_JPEG_QUALITY', '85'))
+# Image decoding limits: images larger than MARKSHEET_MAX_IMAGE_PIXELS are
+# rejected outright, and no more than MARKSHEET_DECODE_PIXEL_BUDGET pixels are
+# decoded at once (JPEGs are decoded at reduced scale, so rarely hit it)
+MARKSHEET_MAX_IMAGE_PIXELS = int(os.getenv('MARKSHEET_MAX_IMAGE_PIXELS', '100000000'))
+MARKSHEET_DECODE_PIXEL_BUDGET = int(os.getenv('MARKSHEET_DECODE_PIXEL_BUDGET', '50000000'))
+# Retention policy applied by `manage.py gc_marksheets`: originals of completed
+# uploads older than MARKSHEET_RETENTION_DAYS are compressed or evicted (0 keeps them)
+MARKSHEET_RETENTION_DAYS = int(os.getenv('MARKSHEET_RETENTION_DAYS', '0'))
+MARKSHEET_RETENTION_ACTION = os.getenv('MARKSHEET_RETENTION_ACTION', 'compress')
+MARKSHEET_RETENTION_MAX_DIMENSION = int(os.getenv('MARKSHEET_RETENTION_MAX_DIMENSION', '2048'))
+MARKSHEET_RETENTION_QUALITY = int(os.getenv('MARKSHEET_RETENTION_QUALITY', '75'))
+
+# archive_uploads moves the students and marks of completed uploads older than
+# MARKSHEET_ARCHIVE_AFTER_DAYS into compressed archives (0 never archives)
+MARKSHEET_ARCHIVE_AFTER_DAYS = int(os.getenv('MARKSHEET_ARCHIVE_AFTER_DAYS', '0'))
+
 # Logging Configuration
 LOGGING = {
     'version': 1,